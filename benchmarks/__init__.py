@@ -0,0 +1,5 @@
+"""Benchmarks for hubsync
+
+Each module within this package is a runnable benchmark suite, see
+benchmarks.common for the helpers to store and compare baselines.
+"""
@@ -0,0 +1,130 @@
+"""Shared helpers to run benchmarks and compare them against baselines
+
+Results are stored as a flat json dictionary of "<benchmark>[<size>]" to the
+best time in seconds, or to the peak memory in MB for the memory suite.
+Baselines are machine dependant, regenerate them with the "save" command when
+changing the machine the comparisons run on.
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import sys
+import timeit
+
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                            'baselines')
+DEFAULT_THRESHOLD = 0.25
+
+
+def result_key(name, size):
+    """Key of a benchmark result within the results dictionary"""
+    return "{}[{}]".format(name, size)
+
+
+def best_time(func, repeat=5, min_time=0.05):
+    """Returns the best time in seconds of a single call to func
+
+    Fast functions are called in loops of at least min_time seconds to avoid
+    measuring the noise of the timer.
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number *= 10
+    timings = [elapsed] + timer.repeat(repeat=repeat - 1, number=number)
+    return min(timings) / number
+
+
+def load_results(path):
+    """Loads the results stored in path, empty if it does not exist"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def save_results(path, results):
+    """Saves the results as json in path"""
+    with open(path, 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+        results_file.write('\n')
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Compares current results against a baseline
+
+    :param baseline: dictionary with the baseline results
+    :param current: dictionary with the current results
+    :param threshold: max ratio of slowdown allowed, 0.25 means 25% slower
+    :return: list of (key, baseline, current, ratio, regressed) sorted by key.
+        baseline and ratio are None when the key is not in the baseline
+    """
+    result = []
+    for key in sorted(current):
+        new = current[key]
+        old = baseline.get(key)
+        if not old:
+            result.append((key, old, new, None, False))
+            continue
+        ratio = new / old
+        result.append((key, old, new, ratio, ratio > 1 + threshold))
+    return result
+
+
+def print_comparison(comparison, output=sys.stdout):
+    """Prints the result of compare as a table"""
+    print("{:<45} {:>12} {:>12} {:>8}".format(
+        "benchmark", "baseline", "current", "ratio"), file=output)
+    for key, old, new, ratio, regressed in comparison:
+        print("{:<45} {:>12} {:>12.6f} {:>8} {}".format(
+            key,
+            "-" if old is None else "{:.6f}".format(old),
+            new,
+            "-" if ratio is None else "{:.2f}".format(ratio),
+            "REGRESSION" if regressed else ""), file=output)
+
+
+def main(suite_name, run, argv=None):
+    """Command line entry point shared by all benchmark suites
+
+    :param suite_name: name of the suite, used as name of the baseline file
+    :param run: function that receives the parsed arguments and returns a
+        dictionary of results
+    :return: exit code, 1 if any regression was found on compare
+    """
+    parser = argparse.ArgumentParser(
+        description="Runs the {} benchmarks".format(suite_name),
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('command', choices=['run', 'save', 'compare'],
+                        help="run prints the results, save stores them as "
+                             "the new baseline and compare checks them "
+                             "against the stored baseline")
+    parser.add_argument('--baseline', type=str,
+                        default=os.path.join(BASELINE_DIR,
+                                             suite_name + '.json'),
+                        help="Path of the baseline file")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Slowdown ratio over the baseline considered a "
+                             "regression")
+    parser.add_argument('--max_size', type=int, default=10 ** 5,
+                        help="Largest number of elements to benchmark with")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    if args.command == 'save':
+        save_results(args.baseline, results)
+        print("Baseline saved in {}".format(args.baseline))
+    elif args.command == 'compare':
+        comparison = compare(load_results(args.baseline), results,
+                             args.threshold)
+        print_comparison(comparison)
+        if any(item[-1] for item in comparison):
+            return 1
+    else:
+        print_comparison(compare({}, results))
+    return 0
@@ -0,0 +1,135 @@
+"""Memory benchmarks of the sync pipeline
+
+Each benchmark syncs an org of a number of repos in a new python process and
+reports the peak RSS of the process in MB. The github listing is generated a
+page at a time and the git backend does no git, so the results show what the
+sync itself holds: they should stay flat as the number of repos grows. Run it
+from the root of the repository:
+
+    python -m benchmarks.memory compare
+"""
+from __future__ import print_function
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from hubsync import config, github, sync, workspace
+from benchmarks import common
+
+
+SIZES = (10 ** 2, 10 ** 3, 10 ** 4)
+PAGE_SIZE = 100
+USER = 'bench'
+
+
+class PagedApi(github.Api):
+    """Api listing size repos of the user, building a page at a time"""
+
+    def __init__(self, size):
+        super(PagedApi, self).__init__('https://api.github.com', 'token')
+        self.size = size
+        self._user = github.User(self, 'url', USER, '', 'repos_url')
+
+    def iter_get(self, url):
+        for start in range(0, self.size, PAGE_SIZE):
+            page = [{'owner': {'login': USER}, 'id': index,
+                     'name': "repo{}".format(index),
+                     'description': "Repo number {}".format(index),
+                     'ssh_url': "git@github.com:{}/repo{}.git".format(
+                         USER, index),
+                     'forks_url': "https://api.github.com/repos/{}/repo{}/"
+                                  "forks".format(USER, index),
+                     'default_branch': 'master', 'fork': False}
+                    for index in range(start,
+                                       min(start + PAGE_SIZE, self.size))]
+            for item in page:
+                yield item
+
+
+class NullRepo(object):
+    """Opened repo whose operations do nothing"""
+
+    def remote_url(self, _):
+        return None
+
+    def fetch_refspecs(self, _):
+        return []
+
+    def branches(self):
+        return []
+
+    def __getattr__(self, _):
+        return lambda *args, **kwargs: None
+
+
+class NullBackend(object):
+    """Backend whose clones are empty folders"""
+    name = 'null'
+
+    def open(self, _):
+        return NullRepo()
+
+    def clone(self, _, path, branch=None, options=()):
+        os.mkdir(path)
+
+
+def peak_rss():
+    """Peak RSS of the current process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes in macOS, KB elsewhere
+    return peak / (1024.0 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def sync_org(size):
+    """Syncs an org of size repos and returns the peak RSS in MB"""
+    hubsync_config = config.Config()
+    hubsync_config.glob.interactive = False
+    hubsync_config.glob.fork_repos = False
+    api = PagedApi(size)
+    tmp_path = tempfile.mkdtemp(prefix='hubsync-bench-')
+    try:
+        local_org = workspace.Organization(USER, tmp_path, NullBackend())
+        os.mkdir(local_org.path)
+        saved_stdout = sys.stdout
+        with open(os.devnull, 'w') as devnull:
+            sys.stdout = devnull
+            try:
+                sync.SyncHelper(api, hubsync_config).sync_org(local_org,
+                                                              api.user)
+            finally:
+                sys.stdout = saved_stdout
+        # measured before removing the clones, which lists all of them
+        return peak_rss()
+    finally:
+        shutil.rmtree(tmp_path)
+
+
+def measure(size):
+    """Peak RSS in MB of a new process syncing an org of size repos"""
+    root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'benchmarks.memory', 'measure', str(size)],
+        cwd=root)
+    return float(output)
+
+
+def run(args):
+    """Measures the sync of the orgs up to args.max_size repos"""
+    results = {}
+    for size in SIZES:
+        if size > args.max_size:
+            continue
+        key = common.result_key('sync.SyncHelper.sync_org', size)
+        results[key] = measure(size)
+        print("{} done".format(key), file=sys.stderr)
+    return results
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['measure']:
+        print(sync_org(int(sys.argv[2])))
+        sys.exit(0)
+    sys.exit(common.main('memory', run))
@@ -0,0 +1,144 @@
+"""Micro benchmarks of the pure python hot paths of hubsync
+
+Covers the functions that run once per object and scale with the size of the
+workspace. Run it from the root of the repository:
+
+    python -m benchmarks.micro compare
+"""
+from __future__ import print_function
+import collections
+import os
+import shutil
+import sys
+import tempfile
+
+import git
+
+from hubsync import config, github, status, sync, workspace
+from hubsync.gitbackend import run_git
+from benchmarks import common
+
+
+SIZES = (10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5)
+
+Named = collections.namedtuple('Named', 'name')
+
+
+def bench_zip_pairs(size, _):
+    """zip_pairs with half of the elements matching and a lowercase key"""
+    xs = [Named("Repo{}".format(i)) for i in range(size)]
+    ys = [Named("repo{}".format(i)) for i in range(size // 2, size * 3 // 2)]
+
+    def key(item):
+        return str(item.name).lower()
+
+    return lambda: list(sync.zip_pairs(xs, ys, key))
+
+
+def bench_config_from_ini_file(size, tmp_path):
+    """Config.from_ini_file with a file containing size sections"""
+    path = os.path.join(tmp_path, 'hubsyncrc')
+    with open(path, 'w') as ini_file:
+        ini_file.write("[github]\ntoken: XXX\n[workspace]\npath: /tmp\n")
+        for i in range(size):
+            ini_file.write("[repo:repo{0}]\npost: echo {0}\n".format(i))
+    return lambda: config.Config.from_ini_file(path)
+
+
+def bench_get_sub_folders(size, tmp_path):
+    """get_sub_folders of a folder with size subfolders"""
+    for i in range(size):
+        os.mkdir(os.path.join(tmp_path, "repo{}".format(i)))
+    return lambda: workspace.get_sub_folders(tmp_path)
+
+
+def bench_organization_scan(size, tmp_path):
+    """Scans an org folder with size subfolders, half of them git repos"""
+    for i in range(size):
+        os.makedirs(os.path.join(tmp_path, "repo{}".format(i),
+                                 '.git' if i % 2 else ''))
+    return lambda: workspace.Organization('', tmp_path).scan()
+
+
+def bench_workspace_repo(size, tmp_path):
+    """Builds size workspace.Repo objects"""
+    git.Repo.init(os.path.join(tmp_path, 'repo'))
+    return lambda: [workspace.Repo('repo', tmp_path) for _ in range(size)]
+
+
+def bench_workspace_organization(size, tmp_path):
+    """Builds size workspace.Organization objects"""
+    names = ["org{}".format(i) for i in range(size)]
+    return lambda: [workspace.Organization(name, tmp_path) for name in names]
+
+
+def bench_workspace_status(size, tmp_path):
+    """status.workspace_status of size repos spread in 10 orgs"""
+    template = os.path.join(tmp_path, 'template')
+    git.Repo.init(template)
+    run_git(template, '-c', 'user.name=bench', '-c', 'user.email=bench@bench',
+            'commit', '--allow-empty', '-q', '-m', 'initial')
+    ws_path = os.path.join(tmp_path, 'ws')
+    for i in range(size):
+        shutil.copytree(template, os.path.join(
+            ws_path, "org{}".format(i % 10), "repo{}".format(i)))
+    return lambda: status.workspace_status(workspace.Workspace(ws_path))
+
+
+def bench_github_repo(size, _):
+    """Builds size github.Repo objects"""
+    api = github.Api('https://api.github.com', 'token')
+    names = ["repo{}".format(i) for i in range(size)]
+    return lambda: [github.Repo(api, 'user', name, 'description',
+                                'git@github.com:user/repo.git',
+                                'https://api.github.com/forks')
+                    for name in names]
+
+
+def bench_github_organization(size, _):
+    """Builds size github.Organization objects"""
+    api = github.Api('https://api.github.com', 'token')
+    names = ["org{}".format(i) for i in range(size)]
+    return lambda: [github.Organization(api, 'url', name, 'description',
+                                        'repos_url')
+                    for name in names]
+
+
+# name: (setup function, sizes)
+BENCHMARKS = collections.OrderedDict([
+    ('zip_pairs', (bench_zip_pairs, SIZES)),
+    ('config.from_ini_file', (bench_config_from_ini_file, SIZES)),
+    ('workspace.get_sub_folders', (bench_get_sub_folders, SIZES)),
+    ('workspace.Organization.scan', (bench_organization_scan, SIZES[:-1])),
+    ('workspace.Repo', (bench_workspace_repo, SIZES)),
+    ('workspace.Organization', (bench_workspace_organization, SIZES)),
+    # Runs git for each repo, the time grows linearly with the size
+    ('status.workspace_status', (bench_workspace_status, SIZES[:2])),
+    ('github.Repo', (bench_github_repo, SIZES)),
+    ('github.Organization', (bench_github_organization, SIZES)),
+])
+
+
+def run(args):
+    """Runs all benchmarks up to args.max_size elements"""
+    results = {}
+    for name, (setup, sizes) in BENCHMARKS.items():
+        for size in sizes:
+            if size > args.max_size:
+                continue
+            tmp_path = tempfile.mkdtemp(prefix='hubsync-bench-')
+            try:
+                func = setup(size, tmp_path)
+                # Big sizes take long enough to not need as many repetitions
+                repeat = 5 if size < 10 ** 4 else 3
+                results[common.result_key(name, size)] = common.best_time(
+                    func, repeat=repeat)
+            finally:
+                shutil.rmtree(tmp_path)
+            print("{} done".format(common.result_key(name, size)),
+                  file=sys.stderr)
+    return results
+
+
+if __name__ == "__main__":
+    sys.exit(common.main('micro', run))
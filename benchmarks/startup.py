@@ -0,0 +1,49 @@
+"""Benchmarks of the startup time of the hubsync command line
+
+Each benchmark runs a new python process, so they measure the imports and
+the work done before hubsync does anything useful. Run it from the root of
+the repository:
+
+    python -m benchmarks.startup compare
+"""
+from __future__ import print_function
+import collections
+import os
+import subprocess
+import sys
+
+from benchmarks import common
+
+
+def python_command(*args):
+    """Returns a function running the python interpreter with args"""
+    command = [sys.executable] + list(args)
+
+    def run():
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(command, stdout=devnull)
+    return run
+
+
+# name: command line run
+BENCHMARKS = collections.OrderedDict([
+    ('python', python_command('-c', 'pass')),
+    ('import hubsync.cli', python_command('-c', 'import hubsync.cli')),
+    ('import hubsync.sync', python_command('-c', 'import hubsync.sync')),
+    ('hubsync --help', python_command('-m', 'hubsync', '--help')),
+    ('hubsync sync --help', python_command('-m', 'hubsync', 'sync',
+                                           '--help')),
+])
+
+
+def run(_):
+    """Runs all startup benchmarks"""
+    results = {}
+    for name, func in BENCHMARKS.items():
+        results[name] = common.best_time(func, repeat=10, min_time=0)
+        print("{} done".format(name), file=sys.stderr)
+    return results
+
+
+if __name__ == "__main__":
+    sys.exit(common.main('startup', run))
@@ -0,0 +1,7 @@
+"""Allows running hubsync with python -m hubsync"""
+import sys
+
+from .cli import main
+
+
+sys.exit(main())
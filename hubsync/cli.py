@@ -0,0 +1,452 @@
+"""Command line entry point of hubsync
+
+Each subcommand imports the modules it needs when it runs, so --help and the
+quick commands do not pay for importing GitPython and requests nor for
+reading the config file.
+"""
+from __future__ import print_function
+import argparse
+import logging
+import os
+import sys
+import threading
+
+
+LOG = logging.getLogger('hubsync')
+
+CONFIG_PATH = '~/.hubsyncrc'
+DEFAULT_COMMAND = 'sync'
+
+# option: (config section, config attribute) it defaults to
+CONFIG_DEFAULTS = {
+    'github_api_url': ('github', 'api_url'),
+    'github_token': ('github', 'token'),
+    'ws_path': ('workspace', 'path'),
+    'mirror_path': ('mirror', 'path'),
+}
+
+
+def load_config(path):
+    """Reads the config file"""
+    from . import config as hubsync_config
+    return hubsync_config.Config.from_ini_file(path)
+
+
+def apply_config_defaults(parser, args, config):
+    """Fills the options not given in the command line from the config
+
+    :raises SystemExit: through parser.error if a required option is missing
+    """
+    for option, (section, attribute) in sorted(CONFIG_DEFAULTS.items()):
+        if not hasattr(args, option) or getattr(args, option):
+            continue
+        if (section == 'github' and config.hosts and
+                args.command == 'sync'):
+            # each github:NAME section has its own
+            continue
+        value = getattr(getattr(config, section), attribute)
+        if not value:
+            parser.error("--{} is required, pass it or set {} in the [{}] "
+                         "section of {}".format(option, attribute, section,
+                                                args.config))
+        setattr(args, option, value)
+
+
+def build_api(args, config, host=None):
+    """Creates the github api with the transport requested in args
+
+    :param host: github host of the api, the one given in the command line
+        options if None. Captures of a named host go to a subfolder
+    :type host: hubsync.hosts.Host
+    :return: the api and the capture store it records into or replays from,
+        None if the network is used directly
+    """
+    from . import github, transport, watchdog
+    http = transport.HttpTransport(
+        timeout=watchdog.seconds(config.glob.api_timeout))
+    api_args = {
+        "api_url": host.api_url if host else args.github_api_url,
+        "user_token": host.token if host else args.github_token,
+        "transport": http,
+        "retries": int(config.glob.retries)
+    }
+    capture_dir = os.path.expanduser(args.record or args.replay or '')
+    if capture_dir and host and host.name:
+        capture_dir = os.path.join(capture_dir, host.name)
+    store = None
+    if args.record:
+        store = transport.CaptureStore(capture_dir)
+        api_args["transport"] = transport.RecordingTransport(store, http)
+    elif args.replay:
+        store = transport.CaptureStore(capture_dir)
+        api_args["transport"] = transport.ReplayTransport(
+            store, args.replay_realtime)
+    return github.Api(**api_args), store
+
+
+def build_workspace(args, config, path=None):
+    """Creates the local workspace as configured
+
+    :param path: folder of the workspace, args.ws_path if None
+    """
+    from . import gitbackend, watchdog, workspace
+    ws_path = path or os.path.expanduser(args.ws_path)
+    manifest = None
+    if config.workspace.manifest:
+        manifest = workspace.Manifest(
+            os.path.join(ws_path, config.workspace.manifest))
+    backend = gitbackend.get_backend(
+        config.glob.git_backend, watchdog.seconds(config.glob.git_timeout))
+    return workspace.Workspace(ws_path, backend, manifest)
+
+
+def build_workspaces(args, config):
+    """Creates the local workspace, or the folder of each github host of the
+    github:NAME sections within it, the hosts not synced yet are left out
+
+    :return: list of (host name, workspace), the name is None without
+        github:NAME sections
+    :raises hubsync.hosts.InvalidHosts: if the hosts config is not valid
+    """
+    from . import hosts
+    if not config.hosts:
+        return [(None, build_workspace(args, config))]
+    return [(host.name, build_workspace(args, config, host.path))
+            for host in hosts.from_config(config,
+                                          os.path.expanduser(args.ws_path))
+            if os.path.isdir(host.path)]
+
+
+def disable_git_prompts(config):
+    """Makes git fail instead of asking for credentials when nobody is
+    there to answer it"""
+    if not config.glob.interactive:
+        os.environ['GIT_TERMINAL_PROMPT'] = '0'
+
+
+def build_host_sync(args, config, host, git_slots=None, fetch_limits=None):
+    """Creates the api, workspace, journal and sync helper of a host
+
+    :type host: hubsync.hosts.Host
+    :rtype: hubsync.hosts.HostSync
+    :raises ValueError: if the config of the sync is not valid
+    """
+    from . import hosts, journal, sync
+    github_api, store = build_api(args, config,
+                                  host if host.name else None)
+    local_workspace = build_workspace(args, config, host.path)
+    sync_journal = None
+    if config.workspace.journal:
+        sync_journal = journal.Journal(os.path.join(
+            local_workspace.path, config.workspace.journal))
+    sync_helper = sync.SyncHelper(github_api, config, sync_journal,
+                                  git_slots, fetch_limits)
+    return hosts.HostSync(host, github_api, local_workspace, sync_helper,
+                          sync_journal, store)
+
+
+def wait_for_deletions(host_syncs):
+    """Waits for the removed folders of each host to be deleted"""
+    trashes = [host_sync.sync_helper.trash for host_sync in host_syncs]
+    if any(trash.deleting for trash in trashes):
+        print("Waiting for the removed folders to be deleted")
+    for trash in trashes:
+        trash.wait()
+
+
+def run_sync(args, config):
+    """Syncs the workspace with github, or each github host into its
+    folder of the workspace"""
+    from . import (concurrency, filters, hosts, metrics, mirror, policies,
+                   refspecs, sshmux)
+    ws_path = os.path.expanduser(args.ws_path)
+    if args.resume and not config.workspace.journal:
+        LOG.error("--resume requires the journal, set it in the "
+                  "[workspace] section")
+        return 1
+    git_slots = None
+    if config.hosts:
+        try:
+            targets = hosts.from_config(config, ws_path)
+        except hosts.InvalidHosts as err:
+            LOG.error("Invalid github hosts config: {}".format(err))
+            return 1
+        git_slots = threading.BoundedSemaphore(int(config.glob.git_workers))
+    else:
+        targets = [hosts.Host(None, args.github_api_url, args.github_token,
+                              ws_path)]
+    try:
+        fetch_limits = concurrency.AdaptiveLimits.from_config(config.glob)
+        host_syncs = [build_host_sync(args, config, host, git_slots,
+                                      fetch_limits)
+                      for host in targets]
+    except concurrency.InvalidConcurrency as err:
+        LOG.error("Invalid fetches config: {}".format(err))
+        return 1
+    except filters.InvalidFilter as err:
+        LOG.error("Invalid filters config: {}".format(err))
+        return 1
+    except refspecs.InvalidPolicy as err:
+        LOG.error("Invalid fetch config: {}".format(err))
+        return 1
+    except mirror.InvalidMirror as err:
+        LOG.error("Invalid mirror config: {}".format(err))
+        return 1
+    except policies.InvalidSyncPolicy as err:
+        LOG.error("Invalid org or repo config: {}".format(err))
+        return 1
+
+    if config.hosts:
+        run_metrics = metrics.Metrics()
+        for host in targets:
+            print("Syncing {} into '{}'".format(host.name, host.path))
+            if not os.path.isdir(host.path):
+                os.makedirs(host.path)
+    else:
+        run_metrics = host_syncs[0].sync_helper.metrics
+        print("Syncing '{}'".format(args.ws_path))
+    disable_git_prompts(config)
+    ssh_master = sshmux.ControlMaster(config.glob.ssh_control_persist,
+                                      run_metrics)
+    results = []
+    try:
+        if config.glob.ssh_multiplexing:
+            ssh_master.start()
+        run_metrics.set('ssh.multiplexing', ssh_master.active)
+        results = hosts.sync_hosts(host_syncs, args.resume)
+    finally:
+        ssh_master.stop()
+        wait_for_deletions(host_syncs)
+        if config.hosts:
+            for host_sync in host_syncs:
+                run_metrics.merge(host_sync.sync_helper.metrics)
+        fetch_limits.record(run_metrics)
+        LOG.info(run_metrics.format_summary())
+        if args.metrics:
+            run_metrics.save(os.path.expanduser(args.metrics))
+    if config.hosts:
+        print(hosts.format_report(results))
+    if any(result.error for result in results):
+        return 1
+    status = 0
+    if any(host_sync.sync_helper.failed for host_sync in host_syncs):
+        status = 1
+    if config.maintenance.after_sync:
+        for host_sync in host_syncs:
+            status = run_maintain(args, config, host_sync.workspace) or status
+    return status
+
+
+def run_mirror(args, config):
+    """Updates the shared mirrors of the selected repos"""
+    from . import concurrency, filters, github, mirror, watchdog
+    config.mirror.path = args.mirror_path
+    try:
+        repo_mirror = mirror.Mirror.from_config(config.mirror)
+        fetch_limits = concurrency.AdaptiveLimits.from_config(config.glob)
+    except mirror.InvalidMirror as err:
+        LOG.error("Invalid mirror config: {}".format(err))
+        return 1
+    except concurrency.InvalidConcurrency as err:
+        LOG.error("Invalid fetches config: {}".format(err))
+        return 1
+    github_api, store = build_api(args, config)
+    print("Updating the mirrors in '{}'".format(args.mirror_path))
+    disable_git_prompts(config)
+    try:
+        results = mirror.update_mirrors(
+            repo_mirror, mirror.selected_repos(github_api, config),
+            args.workers or fetch_limits.maximum, fetch_limits,
+            watchdog.seconds(config.glob.git_timeout),
+            int(config.glob.retries))
+    except filters.InvalidFilter as err:
+        LOG.error("Invalid filters config: {}".format(err))
+        return 1
+    except github.AuthenticationError as err:
+        LOG.error(str(err))
+        return 1
+    finally:
+        if store is not None:
+            store.close()
+    for host, summary in sorted(fetch_limits.as_dict().items()):
+        LOG.info("Updates of {} ran {} at the same time, between {} and {}"
+                 .format(host, summary['level'], summary['lowest'],
+                         summary['highest']))
+    print("{} mirrors updated, {} cloned, {} failed".format(
+        len(results), len([result for result in results if result.cloned]),
+        len([result for result in results if result.error])))
+    return 1 if any(result.error for result in results) else 0
+
+
+def run_maintain(args, config, local_workspace=None):
+    """Runs the maintenance of the repos of the workspace, or of the folder
+    of each github host"""
+    from . import hosts, maintenance
+    try:
+        maintainer = maintenance.Maintainer.from_config(config.maintenance)
+        workspaces = ([local_workspace] if local_workspace is not None else
+                      [ws for _, ws in build_workspaces(args, config)])
+    except maintenance.InvalidMaintenance as err:
+        LOG.error("Invalid maintenance config: {}".format(err))
+        return 1
+    except hosts.InvalidHosts as err:
+        LOG.error("Invalid github hosts config: {}".format(err))
+        return 1
+    failed = False
+    for ws in workspaces:
+        print("Maintaining the repos of '{}'".format(ws.path))
+        results = maintainer.maintain_workspace(
+            ws, force=getattr(args, 'force', False))
+        report = maintenance.format_report(results)
+        if report:
+            print(report)
+        failed = failed or any(result.error for result in results)
+    return 1 if failed else 0
+
+
+def run_status(args, config):
+    """Prints the state of the local repos without using the network"""
+    from . import hosts, status
+    try:
+        workspaces = build_workspaces(args, config)
+    except hosts.InvalidHosts as err:
+        LOG.error("Invalid github hosts config: {}".format(err))
+        return 1
+    statuses = []
+    for name, ws in workspaces:
+        for item in status.workspace_status(ws, args.workers):
+            # the orgs of each host are within its folder
+            statuses.append(item if name is None else item._replace(
+                org="{}/{}".format(name, item.org)))
+    if args.changed_only:
+        statuses = [item for item in statuses if item.changed]
+    if args.json:
+        print(status.format_json(statuses))
+    else:
+        print(status.format_table(statuses))
+    return 0
+
+
+def build_parser():
+    """Parser of the command line with all the subcommands"""
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--config', type=str, default=CONFIG_PATH,
+                        help="Path of the hubsync config file")
+    common.add_argument('--ws_path', type=str,
+                        help="base path of your local workspace. [workspace] "
+                             "path in the config file by default")
+    common.add_argument('--logging', choices=['INFO', 'DEBUG', 'ERROR'],
+                        required=False, default='INFO', type=str,
+                        help="Logging level of the script")
+
+    remote = argparse.ArgumentParser(add_help=False)
+    remote.add_argument('--github_api_url', type=str,
+                        help="Base URL for the github instance. [github] "
+                             "api_url in the config file by default")
+    remote.add_argument('--github_token', type=str,
+                        help="Private user token to get access to github. "
+                             "[github] token in the config file by default")
+    capture = remote.add_mutually_exclusive_group()
+    capture.add_argument('--record', type=str, metavar='CAPTURE_DIR',
+                         help="Record the github responses in a folder")
+    capture.add_argument('--replay', type=str, metavar='CAPTURE_DIR',
+                         help="Answer the github requests with the responses "
+                              "recorded in a folder instead of the network")
+    remote.add_argument('--replay_realtime', default=False,
+                        action='store_true',
+                        help="Wait the time the recorded requests took")
+
+    parser = argparse.ArgumentParser(
+        prog='hubsync',
+        description="Keeps your repos in sync! Options not given are read "
+                    "from {}. Runs sync if no command is given"
+                    .format(CONFIG_PATH),
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    sync_parser = commands.add_parser(
+        'sync', parents=[common, remote],
+        help="Sync the workspace with github",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    sync_parser.add_argument('--resume', default=False, action='store_true',
+                             help="Continue the last sync if it was "
+                                  "interrupted, skipping what it finished")
+    sync_parser.add_argument('--metrics', type=str, metavar='PATH',
+                             help="Write the counters and timings of the "
+                                  "sync as json")
+    sync_parser.set_defaults(func=run_sync)
+
+    status_parser = commands.add_parser(
+        'status', parents=[common],
+        help="Show which local repos are dirty, ahead or behind their "
+             "upstream or have stale branches, without using the network",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    status_parser.add_argument('--json', default=False, action='store_true',
+                               help="Print the report as json")
+    status_parser.add_argument('--changed_only', default=False,
+                               action='store_true',
+                               help="Only report repos that need attention")
+    status_parser.add_argument('--workers', type=int, default=8,
+                               help="Number of repos read at the same time")
+    status_parser.set_defaults(func=run_status)
+
+    mirror_parser = commands.add_parser(
+        'mirror', parents=[common, remote],
+        help="Update bare mirrors of the selected repos, for syncs to fetch "
+             "from instead of github. See the [mirror] config section",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    mirror_parser.add_argument('--mirror_path', type=str,
+                               help="Folder of the mirrors. [mirror] path in "
+                                    "the config file by default")
+    mirror_parser.add_argument('--workers', type=int, default=None,
+                               help="Max number of mirrors updated at the "
+                                    "same time, within it the updates "
+                                    "against each host adapt between "
+                                    "min_fetches and max_fetches. "
+                                    "max_fetches by default")
+    mirror_parser.set_defaults(func=run_mirror)
+
+    maintain_parser = commands.add_parser(
+        'maintain', parents=[common],
+        help="Repack and write the commit-graph of the local repos, without "
+             "using the network. See the [maintenance] config section",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    maintain_parser.add_argument('--force', default=False,
+                                 action='store_true',
+                                 help="Maintain the repos maintained "
+                                      "recently too")
+    maintain_parser.set_defaults(func=run_maintain)
+    return parser
+
+
+def with_default_command(argv):
+    """Adds the default command to argv if no command was given
+
+    Keeps "hubsync --option value" working as "hubsync sync --option value"
+    """
+    if not argv or (argv[0].startswith('-') and
+                    argv[0] not in ('-h', '--help')):
+        return [DEFAULT_COMMAND] + argv
+    return argv
+
+
+def main(argv=None):
+    """Runs hubsync with the command line arguments
+
+    :return: exit code
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    parser = build_parser()
+    args = parser.parse_args(with_default_command(argv))
+
+    if not LOG.handlers:
+        LOG.addHandler(logging.StreamHandler())
+    LOG.setLevel(args.logging)
+
+    config = load_config(args.config)
+    apply_config_defaults(parser, args, config)
+    return args.func(args, config)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+"""Adaptive limit of the git operations run at the same time on each host
+
+A fixed number of mirror clones and fetches at the same time is either too
+low for a fast link or more than the server, or the VPN in between, can
+take. Each git host gets an AdaptiveLimit instead, which adjusts how many
+operations run against it at the same time with additive increase and
+multiplicative decrease (AIMD), like the congestion control of TCP:
+
+- the limit starts at the minimum and grows by one after each round of
+  operations, a round being as many operations as the limit, completing
+  without signs of congestion
+- it is halved when an operation times out or loses its connection, or when
+  the smoothed latency of the operations goes over LATENCY_FACTOR times the
+  lowest one seen, which shows the host is slowing down with the load. Only
+  one decrease is done per round, as the operations in flight saw the same
+  congestion. Other failures, like a missing repo or bad credentials, say
+  nothing about the load and are only counted
+
+The limits of each host, and the operations per second completed, are
+recorded in the metrics of the run.
+"""
+from contextlib import contextmanager
+import logging
+import re
+import threading
+import time
+
+from six.moves.urllib.parse import urlparse
+
+from . import gitbackend
+
+
+LOG = logging.getLogger('hubsync.concurrency')
+
+DEFAULT_MIN = 1
+DEFAULT_MAX = 8
+LATENCY_FACTOR = 3.0
+# weight of the last operation in the smoothed latency
+SMOOTHING = 0.3
+LOCAL = 'local'
+# git errors of a host or network that cannot keep up
+NETWORK_ERRORS = re.compile(
+    r'timed? ?out|connection (?:reset|refused|closed)|early eof|'
+    r'remote end hung up|unexpected disconnect', re.IGNORECASE)
+
+
+class InvalidConcurrency(ValueError):
+    """Raised when the concurrency limits of the config are not valid"""
+
+
+def git_host(url):
+    """Host a git url reaches, LOCAL for paths and file urls
+
+    >>> git_host('git@github.com:org/repo.git')
+    'github.com'
+    """
+    if not url:
+        return LOCAL
+    if '://' in url:
+        return urlparse(url).hostname or LOCAL
+    # scp-like syntax, [user@]host:path
+    match = re.match(r'^(?:[^@/]+@)?([^:/]+):', url)
+    if match:
+        return match.group(1)
+    return LOCAL
+
+
+def is_congestion(err):
+    """Whether an error of a git operation shows congestion, as git was
+    killed for taking too long or lost its connection"""
+    if isinstance(err, gitbackend.GitTimeout):
+        return True
+    return bool(NETWORK_ERRORS.search(str(err)))
+
+
+class AdaptiveLimit(object):
+    """AIMD limit of the operations run at the same time against a host"""
+
+    def __init__(self, minimum=DEFAULT_MIN, maximum=DEFAULT_MAX,
+                 clock=time.time):
+        """
+        :param minimum: operations always allowed at the same time
+        :param maximum: operations never exceeded at the same time
+        :raises InvalidConcurrency: if the bounds are not valid
+        """
+        if minimum < 1 or maximum < minimum:
+            raise InvalidConcurrency(
+                "Invalid concurrency bounds {}-{}, they must be at least 1 "
+                "and the minimum not over the maximum".format(minimum,
+                                                              maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(minimum)
+        self.lowest = self.highest = minimum
+        self.increases = 0
+        self.decreases = 0
+        self.completed = 0
+        self.failed = 0
+        self._clock = clock
+        self._in_flight = 0
+        self._latency = None
+        self._best_latency = None
+        # operations left in the round, no decrease until it completes
+        self._round_left = minimum
+        self._decreased_in_round = False
+        self._started = None
+        self._condition = threading.Condition()
+
+    @property
+    def level(self):
+        """Operations allowed at the same time right now"""
+        return int(self.limit)
+
+    def acquire(self):
+        """Waits for room to run an operation"""
+        with self._condition:
+            while self._in_flight >= self.level:
+                self._condition.wait()
+            self._in_flight += 1
+            if self._started is None:
+                self._started = self._clock()
+
+    def release(self, seconds=None, succeeded=True, congested=False):
+        """Records the outcome of an operation, adjusting the limit
+
+        :param seconds: how long the operation took, None if its duration
+            depends on what it transfers more than on the host, like a clone
+        :param succeeded: whether it completed without error
+        :param congested: whether it failed for congestion, see
+            is_congestion
+        """
+        with self._condition:
+            self._in_flight -= 1
+            self.completed += 1
+            if not succeeded:
+                self.failed += 1
+            elif seconds is not None:
+                self._observe(seconds)
+            congested = congested or self._congested()
+            if congested and not self._decreased_in_round:
+                self._decrease()
+            self._round_left -= 1
+            if self._round_left <= 0:
+                if not self._decreased_in_round:
+                    self._increase()
+                self._round_left = self.level
+                self._decreased_in_round = False
+            self._condition.notify_all()
+
+    def _observe(self, seconds):
+        if self._latency is None:
+            self._latency = seconds
+        else:
+            self._latency += SMOOTHING * (seconds - self._latency)
+        if self._best_latency is None or self._latency < self._best_latency:
+            self._best_latency = self._latency
+
+    def _congested(self):
+        return (self._best_latency is not None and
+                self._latency > LATENCY_FACTOR * max(self._best_latency,
+                                                     0.001))
+
+    def _increase(self):
+        if self.level >= self.maximum:
+            return
+        self.limit = min(self.limit + 1, self.maximum)
+        self.increases += 1
+        self.highest = max(self.highest, self.level)
+
+    def _decrease(self):
+        self._decreased_in_round = True
+        if self.level <= self.minimum:
+            return
+        self.limit = max(self.limit / 2, self.minimum)
+        self.decreases += 1
+        self.lowest = min(self.lowest, self.level)
+        # the latency seen from now on is the one at the new level
+        self._latency = self._best_latency
+
+    def throughput(self):
+        """Operations per second completed since the first one started"""
+        if self._started is None:
+            return 0.0
+        elapsed = self._clock() - self._started
+        return self.completed / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        """Json serializable summary of the levels chosen"""
+        with self._condition:
+            return {'level': self.level, 'lowest': self.lowest,
+                    'highest': self.highest, 'increases': self.increases,
+                    'decreases': self.decreases,
+                    'completed': self.completed, 'failed': self.failed,
+                    'per_second': round(self.throughput(), 4)}
+
+
+class AdaptiveLimits(object):
+    """Adaptive limit of each git host, created as the hosts are used"""
+
+    def __init__(self, minimum=DEFAULT_MIN, maximum=DEFAULT_MAX,
+                 clock=time.time):
+        """
+        :raises InvalidConcurrency: if the bounds are not valid
+        """
+        # checked before any host is used
+        AdaptiveLimit(minimum, maximum)
+        self.minimum = minimum
+        self.maximum = maximum
+        self._clock = clock
+        self._limits = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def from_config(section):
+        """Builds the limits from the global section of the config
+
+        :type section: hubsync.config.Config.Global
+        :raises InvalidConcurrency: if a value cannot be parsed
+        """
+        try:
+            minimum = int(section.min_fetches)
+            maximum = int(section.max_fetches)
+        except (TypeError, ValueError):
+            raise InvalidConcurrency(
+                "min_fetches and max_fetches must be numbers, got {} and {}"
+                .format(section.min_fetches, section.max_fetches))
+        return AdaptiveLimits(minimum, maximum)
+
+    def limit(self, url):
+        """Adaptive limit of the host of a git url
+
+        :rtype: AdaptiveLimit
+        """
+        host = git_host(url)
+        with self._lock:
+            if host not in self._limits:
+                self._limits[host] = AdaptiveLimit(self.minimum, self.maximum,
+                                                   self._clock)
+            return self._limits[host]
+
+    @contextmanager
+    def operation(self, url, timed=True):
+        """Runs its body once the host of url has room for it, recording
+        how long it took and whether it failed
+
+        :param timed: whether its duration shows the load of the host, see
+            AdaptiveLimit.release
+        """
+        limit = self.limit(url)
+        limit.acquire()
+        start = self._clock()
+        succeeded = False
+        congested = False
+        try:
+            yield
+            succeeded = True
+        except Exception as err:
+            congested = is_congestion(err)
+            raise
+        finally:
+            limit.release(self._clock() - start if timed else None,
+                          succeeded, congested)
+
+    def as_dict(self):
+        """Json serializable summary of the levels chosen for each host"""
+        with self._lock:
+            limits = dict(self._limits)
+        return dict((host, limit.as_dict()) for host, limit in limits.items())
+
+    def record(self, metrics):
+        """Sets the levels chosen for each host in the metrics, as
+        git.concurrency.<host>
+
+        :type metrics: hubsync.metrics.Metrics
+        """
+        for host, summary in self.as_dict().items():
+            metrics.set('git.concurrency.{}'.format(host), summary)
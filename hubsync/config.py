@@ -1,4 +1,5 @@
 """Stores the config related classes/functions"""
+import collections
 import os
 from six.moves import configparser
 
@@ -20,17 +21,19 @@ def _parse_ini_section(config, section, attributes):
     :return: dictionary with the extracted data
     """
     ret = {}
+    if not config.has_section(section):
+        return ret
+    # checked up front, raising for each missing option is slow with
+    # thousands of sections
+    options = set(config.options(section))
     for attr in attributes:
-        try:
-            value = config.get(section, attr)
-            if value in FALSY_VALUES:
-                ret[attr] = False
-            else:
-                ret[attr] = value
-        except configparser.NoOptionError:
+        if attr not in options:
             continue
-        except configparser.NoSectionError:
-            break
+        value = config.get(section, attr)
+        if value in FALSY_VALUES:
+            ret[attr] = False
+        else:
+            ret[attr] = value
     return ret
 
 
@@ -51,27 +54,108 @@ class Config(object):
         :return Config
         """
         parser = _get_config_parser(path)
-        github_attrs = ('token', 'api_url')
-        ws_attrs = ('path',)
+        github_attrs = ('token', 'api_url', 'path')
+        ws_attrs = ('path', 'manifest', 'journal', 'trash')
         org_attrs = ('pre', 'post')
-        repo_attrs = ('path', 'post')
+        repo_attrs = ('pre', 'post', 'mode', 'clone', 'interval')
         global_attrs = ('interactive', 'sync_user', 'fork_repos',
-                        'case_sensitive')
+                        'update_forks', 'case_sensitive', 'git_backend',
+                        'ssh_multiplexing', 'ssh_control_persist',
+                        'git_workers', 'prefetch', 'min_fetches',
+                        'max_fetches', 'git_timeout', 'api_timeout',
+                        'retries')
+        filters_attrs = ('include_orgs', 'exclude_orgs', 'include', 'exclude',
+                         'archived', 'forks', 'max_size', 'languages',
+                         'pushed_within')
+        fetch_attrs = ('branches', 'prune')
+        mirror_attrs = ('path', 'url', 'max_age')
+        maintenance_attrs = ('tasks', 'interval', 'load', 'niceness',
+                             'max_duration', 'after_sync')
+        # PREFIX:NAME sections by prefix, kept in the order of the file as
+        # the later ones override the rest
+        named_attrs = {'filters': filters_attrs, 'fetch': fetch_attrs,
+                       'org': org_attrs, 'repo': repo_attrs,
+                       'github': github_attrs}
+        named = dict((prefix, []) for prefix in named_attrs)
+        for section in parser.sections():
+            prefix, _, name = section.partition(':')
+            if name and prefix in named_attrs:
+                named[prefix].append((name, _parse_ini_section(
+                    parser, section, named_attrs[prefix])))
+        org_filters = named['filters']
+        fetch_policies = named['fetch']
+        org_sections = named['org']
+        repo_sections = named['repo']
+        hosts = named['github']
         result = {
             'github': _parse_ini_section(parser, 'github', github_attrs),
+            'hosts': hosts,
             'workspace': _parse_ini_section(parser, 'workspace', ws_attrs),
             'org': _parse_ini_section(parser, 'org', org_attrs),
             'repo': _parse_ini_section(parser, 'repo', repo_attrs),
+            'org_sections': org_sections,
+            'repo_sections': repo_sections,
             'glob': _parse_ini_section(parser, 'global', global_attrs),
+            'filters': _parse_ini_section(parser, 'filters', filters_attrs),
+            'org_filters': org_filters,
+            'fetch': _parse_ini_section(parser, 'fetch', fetch_attrs),
+            'fetch_policies': fetch_policies,
+            'maintenance': _parse_ini_section(parser, 'maintenance',
+                                              maintenance_attrs),
+            'mirror': _parse_ini_section(parser, 'mirror', mirror_attrs),
         }
         return Config(**result)
 
     def __init__(self, **kwargs):
         self.github = self.Github(**kwargs.get('github', {}))
+        # github:NAME sections, synced at the same time, see hubsync.hosts
+        self.hosts = collections.OrderedDict(
+            (name, self.Github(**values))
+            for name, values in kwargs.get('hosts', []))
         self.workspace = self.Workspace(**kwargs.get('workspace', {}))
         self.org = self.Organization(**kwargs.get('org', {}))
         self.repo = self.Repository(**kwargs.get('repo', {}))
+        # list of (pattern, options set) of the org:PATTERN and repo:PATTERN
+        # sections, see hubsync.policies
+        self.org_sections = kwargs.get('org_sections', [])
+        self.repo_sections = kwargs.get('repo_sections', [])
         self.glob = self.Global(**kwargs.get('glob', {}))
+        self.filters = self.Filters(**kwargs.get('filters', {}))
+        self.fetch = self.Fetch(**kwargs.get('fetch', {}))
+        # list of (pattern, options set) of the filters:PATTERN and
+        # fetch:PATTERN sections, see hubsync.filters and hubsync.refspecs
+        self.org_filters = kwargs.get('org_filters', [])
+        self.fetch_policies = kwargs.get('fetch_policies', [])
+        self.maintenance = self.Maintenance(**kwargs.get('maintenance', {}))
+        self.mirror = self.Mirror(**kwargs.get('mirror', {}))
+
+    def org_section(self, values):
+        """Org section with values set over the org options
+
+        :rtype: Config.Organization
+        """
+        return self.Organization(**dict(vars(self.org), **values))
+
+    def repo_section(self, values):
+        """Repo section with values set over the repo options
+
+        :rtype: Config.Repository
+        """
+        return self.Repository(**dict(vars(self.repo), **values))
+
+    def filters_section(self, values):
+        """Filters section with values set over the filters options
+
+        :rtype: Config.Filters
+        """
+        return self.Filters(**dict(vars(self.filters), **values))
+
+    def fetch_section(self, values):
+        """Fetch section with values set over the fetch options
+
+        :rtype: Config.Fetch
+        """
+        return self.Fetch(**dict(vars(self.fetch), **values))
 
     class Global(object):
         """Hubsync global config"""
@@ -79,7 +163,18 @@ class Config(object):
             self.interactive = kwargs.pop('interactive', True)
             self.sync_user = kwargs.pop('sync_user', True)
             self.fork_repos = kwargs.pop('fork_repos', False)
+            self.update_forks = kwargs.pop('update_forks', False)
             self.case_sensitive = kwargs.pop('case_sensitive', True)
+            self.git_backend = kwargs.pop('git_backend', 'gitpython')
+            self.ssh_multiplexing = kwargs.pop('ssh_multiplexing', True)
+            self.ssh_control_persist = kwargs.pop('ssh_control_persist', 60)
+            self.git_workers = kwargs.pop('git_workers', 4)
+            self.prefetch = kwargs.pop('prefetch', 500)
+            self.min_fetches = kwargs.pop('min_fetches', 1)
+            self.max_fetches = kwargs.pop('max_fetches', 8)
+            self.git_timeout = kwargs.pop('git_timeout', 600)
+            self.api_timeout = kwargs.pop('api_timeout', 60)
+            self.retries = kwargs.pop('retries', 2)
             assert not kwargs, "Unknown config: {}".format(kwargs.keys())
 
     class Github(object):
@@ -87,12 +182,16 @@ class Config(object):
         def __init__(self, **kwargs):
             self.api_url = kwargs.pop('api_url', 'https://api.github.com')
             self.token = kwargs.pop('token', None)
+            self.path = kwargs.pop('path', None)
             assert not kwargs, "Unknown config: {}".format(kwargs.keys())
 
     class Workspace(object):
         """Workspace config"""
         def __init__(self, **kwargs):
             self.path = kwargs.pop('path', os.getcwd())
+            self.manifest = kwargs.pop('manifest', '.hubsync_manifest.json')
+            self.journal = kwargs.pop('journal', '.hubsync_journal')
+            self.trash = kwargs.pop('trash', '.hubsync_trash')
             assert not kwargs, "Unknown config: {}".format(kwargs.keys())
 
     class Organization(object):
@@ -107,4 +206,47 @@ class Config(object):
         def __init__(self, **kwargs):
             self.pre = kwargs.pop('pre', "")
             self.post = kwargs.pop('post', "")
+            self.mode = kwargs.pop('mode', 'full')
+            self.clone = kwargs.pop('clone', 'full')
+            self.interval = kwargs.pop('interval', None)
+            assert not kwargs, "Unknown config: {}".format(kwargs.keys())
+
+    class Filters(object):
+        """Selection of the orgs and repos to sync, see hubsync.filters"""
+        def __init__(self, **kwargs):
+            self.include_orgs = kwargs.pop('include_orgs', "")
+            self.exclude_orgs = kwargs.pop('exclude_orgs', "")
+            self.include = kwargs.pop('include', "")
+            self.exclude = kwargs.pop('exclude', "")
+            self.archived = kwargs.pop('archived', True)
+            self.forks = kwargs.pop('forks', True)
+            self.max_size = kwargs.pop('max_size', None)
+            self.languages = kwargs.pop('languages', "")
+            self.pushed_within = kwargs.pop('pushed_within', None)
+            assert not kwargs, "Unknown config: {}".format(kwargs.keys())
+
+    class Fetch(object):
+        """Branches fetched from the remotes, see hubsync.refspecs"""
+        def __init__(self, **kwargs):
+            self.branches = kwargs.pop('branches', 'all')
+            self.prune = kwargs.pop('prune', False)
+            assert not kwargs, "Unknown config: {}".format(kwargs.keys())
+
+    class Maintenance(object):
+        """Maintenance of the repos, see hubsync.maintenance"""
+        def __init__(self, **kwargs):
+            self.tasks = kwargs.pop('tasks', "")
+            self.interval = kwargs.pop('interval', '7d')
+            self.load = kwargs.pop('load', 0.5)
+            self.niceness = kwargs.pop('niceness', 10)
+            self.max_duration = kwargs.pop('max_duration', None)
+            self.after_sync = kwargs.pop('after_sync', False)
+            assert not kwargs, "Unknown config: {}".format(kwargs.keys())
+
+    class Mirror(object):
+        """Shared mirrors of the repos, see hubsync.mirror"""
+        def __init__(self, **kwargs):
+            self.path = kwargs.pop('path', None)
+            self.url = kwargs.pop('url', None)
+            self.max_age = kwargs.pop('max_age', None)
             assert not kwargs, "Unknown config: {}".format(kwargs.keys())
@@ -0,0 +1,579 @@
+"""Local stand-in of the github api
+
+Serves a generated dataset of users, organizations, repos and forks through
+the same urls github uses, so hubsync can be tested and benchmarked offline.
+It implements Link pagination, ETags, rate limit headers and secondary rate
+limits and it can inject latency and errors.
+
+Usage within tests:
+
+    with FakeGithub(Dataset.generate(orgs=2), latency=0.01) as server:
+        api = github.Api(server.url, server.token)
+
+Or from the command line:
+
+    python -m hubsync.fakehub --port 8000 --orgs 10 --repos 200
+"""
+from __future__ import print_function
+import argparse
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlencode, urlparse, parse_qs
+
+
+LOG = logging.getLogger('hubsync.fakehub')
+
+DEFAULT_TOKEN = 'fake-token'
+# 2020-01-01T00:00:00Z, the generated timestamps are before it
+EPOCH = 1577836800
+MAX_PER_PAGE = 100
+
+
+class Dataset(object):
+    """Users, orgs, repos and forks served by the fake server
+
+    All the data is stored without urls, they are added when rendering the
+    responses as they depend on the address the server is bound to.
+    """
+
+    @staticmethod
+    def generate(user='hubsync', orgs=3, repos_per_org=10, user_repos=5,
+                 forks_per_repo=1, seed=0, epoch=EPOCH):
+        """Generates a deterministic dataset
+
+        :param user: login of the authenticated user
+        :param orgs: number of organizations the user belongs to
+        :param repos_per_org: number of repos within each org
+        :param user_repos: number of repos of the user
+        :param forks_per_repo: number of forks (owned by other users) of each
+            org repo
+        :param seed: seed of the random generator used for the metadata
+        :param epoch: time the generated timestamps are relative to
+        """
+        rand = random.Random(seed)
+        dataset = Dataset(user, epoch)
+        for org_index in range(orgs):
+            org = "org{}".format(org_index)
+            dataset.add_org(org)
+            for repo_index in range(repos_per_org):
+                repo = dataset.add_repo(org, "repo{}".format(repo_index),
+                                        rand=rand)
+                for fork_index in range(forks_per_repo):
+                    dataset.add_fork(repo, "forker{}".format(fork_index))
+        for repo_index in range(user_repos):
+            dataset.add_repo(user, "project{}".format(repo_index), rand=rand)
+        return dataset
+
+    def __init__(self, user, epoch=EPOCH):
+        """
+        :param user: login of the authenticated user
+        :param epoch: time the generated timestamps are relative to
+        """
+        self.user = user
+        self.epoch = epoch
+        self.orgs = []
+        self.repos = {}
+        self.forks = {}
+        self._next_id = 1
+
+    def _new_id(self):
+        result = self._next_id
+        self._next_id += 1
+        return result
+
+    def add_org(self, login, description=None):
+        """Adds an organization the user belongs to"""
+        self.orgs.append({
+            'id': self._new_id(),
+            'login': login,
+            'description': description or "{} organization".format(login),
+        })
+
+    def add_repo(self, owner, name, rand=None, **metadata):
+        """Adds a repo and returns its data"""
+        rand = rand or random.Random(0)
+        data = {
+            'id': self._new_id(),
+            'name': name,
+            'owner': owner,
+            'description': "{}/{} repository".format(owner, name),
+            'fork': False,
+            'archived': rand.random() < 0.1,
+            'size': rand.randint(1, 500000),
+            'language': rand.choice(['Python', 'C', 'Go', 'JavaScript', None]),
+            'default_branch': 'master',
+            'pushed_at': time.strftime(
+                '%Y-%m-%dT%H:%M:%SZ',
+                time.gmtime(self.epoch - rand.randint(0, 365 * 24 * 3600))),
+        }
+        data.update(metadata)
+        self.repos[(owner, name)] = data
+        self.forks[(owner, name)] = []
+        return data
+
+    def add_fork(self, repo, owner):
+        """Adds a fork of repo owned by owner and returns its data"""
+        data = dict(repo, id=self._new_id(), owner=owner, fork=True,
+                    archived=False,
+                    parent="{}/{}".format(repo['owner'], repo['name']))
+        self.repos[(owner, repo['name'])] = data
+        self.forks.setdefault((owner, repo['name']), [])
+        self.forks[(repo['owner'], repo['name'])].append(data)
+        return data
+
+    def move_repo(self, owner, name, new_owner, new_name):
+        """Renames and/or transfers a repo keeping its id"""
+        data = self.repos.pop((owner, name))
+        data.update(owner=new_owner, name=new_name)
+        self.repos[(new_owner, new_name)] = data
+        self.forks[(new_owner, new_name)] = self.forks.pop((owner, name))
+        return data
+
+    def owner_repos(self, owner, include_forks=True):
+        """All repos of an user or organization sorted by name"""
+        return sorted((repo for repo in self.repos.values()
+                       if repo['owner'] == owner and
+                       (include_forks or not repo['fork'])),
+                      key=lambda repo: repo['name'])
+
+
+def render_org(base_url, org):
+    """Github representation of an organization"""
+    url = "{}/orgs/{}".format(base_url, org['login'])
+    return {
+        'id': org['id'],
+        'login': org['login'],
+        'description': org['description'],
+        'url': url,
+        'repos_url': url + '/repos',
+    }
+
+
+def render_user(base_url, login):
+    """Github representation of an user"""
+    url = "{}/users/{}".format(base_url, login)
+    return {
+        'login': login,
+        'url': url,
+        'repos_url': url + '/repos',
+    }
+
+
+def render_repo(base_url, repo):
+    """Github representation of a repository"""
+    full_name = "{}/{}".format(repo['owner'], repo['name'])
+    url = "{}/repos/{}".format(base_url, full_name)
+    result = dict(repo)
+    result.update({
+        'full_name': full_name,
+        'owner': {'login': repo['owner']},
+        'url': url,
+        'forks_url': url + '/forks',
+        'ssh_url': repo.get('ssh_url',
+                            "git@fakehub:{}.git".format(full_name)),
+        'clone_url': repo.get('clone_url',
+                              "https://fakehub/{}.git".format(full_name)),
+    })
+    if 'parent' in repo:
+        result['parent'] = {'full_name': repo['parent']}
+    return result
+
+
+class RateLimiter(object):
+    """Primary and secondary rate limits of the fake server"""
+
+    def __init__(self, limit, window, secondary_limit=None, retry_after=1):
+        """
+        :param limit: requests allowed per window
+        :param window: size of the window in seconds
+        :param secondary_limit: max number of concurrent requests, None to
+            disable the secondary limit
+        :param retry_after: Retry-After header sent when the secondary limit
+            is hit
+        """
+        self.limit = limit
+        self.window = window
+        self.secondary_limit = secondary_limit
+        self.retry_after = retry_after
+        self.used = 0
+        self.reset = time.time() + window
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Accounts a new request
+
+        :return: None if the request is allowed or a message explaining the
+            limit that was hit
+        """
+        with self._lock:
+            if time.time() >= self.reset:
+                self.used = 0
+                self.reset = time.time() + self.window
+            if self.used >= self.limit:
+                return "API rate limit exceeded"
+            if (self.secondary_limit is not None and
+                    self.in_flight >= self.secondary_limit):
+                return "You have exceeded a secondary rate limit"
+            self.used += 1
+            self.in_flight += 1
+            return None
+
+    def release(self):
+        """Marks a request accepted by acquire as finished"""
+        with self._lock:
+            self.in_flight -= 1
+
+    def refund(self):
+        """Gives back a request, github does not charge for 304 responses"""
+        with self._lock:
+            self.used -= 1
+
+    @property
+    def headers(self):
+        """Rate limit headers for the current state"""
+        return {
+            'X-RateLimit-Limit': str(self.limit),
+            'X-RateLimit-Remaining': str(max(self.limit - self.used, 0)),
+            'X-RateLimit-Used': str(self.used),
+            'X-RateLimit-Reset': str(int(self.reset)),
+        }
+
+
+class NotFound(Exception):
+    """Raised by the router when no resource matches the url"""
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Request handler, the configuration lives in self.server.fakehub"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        LOG.debug(format, *args)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self._handle('GET')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        self._handle('POST')
+
+    def _send(self, status, body=None, headers=None):
+        payload = b'' if body is None else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, method):
+        fakehub = self.server.fakehub
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = None
+        if length:
+            try:
+                self.body = json.loads(self.rfile.read(length).decode('utf-8'))
+            except ValueError:
+                self._send(400, {'message': 'Problems parsing JSON'})
+                return
+        fakehub.record(method, self.path)
+
+        if self.headers.get('Authorization') != "token {}".format(
+                fakehub.token):
+            self._send(401, {'message': 'Bad credentials'})
+            return
+
+        limit_message = fakehub.limiter.acquire()
+        if limit_message:
+            headers = fakehub.limiter.headers
+            if 'secondary' in limit_message:
+                headers['Retry-After'] = str(fakehub.limiter.retry_after)
+            self._send(403, {'message': limit_message}, headers)
+            return
+        try:
+            fakehub.delay()
+            self._respond(fakehub, method)
+        finally:
+            fakehub.limiter.release()
+
+    def _respond(self, fakehub, method):
+        if fakehub.should_fail():
+            self._send(502, {'message': 'Server Error'},
+                       fakehub.limiter.headers)
+            return
+
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        try:
+            status, body = fakehub.route(method, parsed.path, self.body)
+        except NotFound:
+            self._send(404, {'message': 'Not Found'}, fakehub.limiter.headers)
+            return
+
+        headers = {}
+        if isinstance(body, list):
+            body, headers = fakehub.paginate(parsed.path, query, body)
+        etag = '"{}"'.format(hashlib.md5(
+            json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest())
+        headers['ETag'] = etag
+        if method == 'GET' and self.headers.get('If-None-Match') == etag:
+            fakehub.limiter.refund()
+            headers.update(fakehub.limiter.headers)
+            self._send(304, headers=headers)
+            return
+        headers.update(fakehub.limiter.headers)
+        self._send(status, body, headers)
+
+
+class _Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeGithub(object):
+    """Fake github api server running in a background thread"""
+
+    def __init__(self, dataset=None, host='127.0.0.1', port=0,
+                 token=DEFAULT_TOKEN, per_page=30, latency=0.0, jitter=0.0,
+                 error_rate=0.0, rate_limit=5000, rate_limit_window=3600,
+                 secondary_limit=None, fork_delay=0.0, seed=None):
+        """
+        :param dataset: data to serve, a generated one by default
+        :param port: port to listen on, 0 picks a free one
+        :param token: token the clients need to authenticate with
+        :param per_page: default page size of the listings
+        :param latency: seconds each request is delayed
+        :param jitter: max random seconds added to the latency
+        :param error_rate: ratio of requests answered with a 502
+        :param rate_limit: requests allowed per rate_limit_window seconds
+        :param secondary_limit: max number of concurrent requests
+        :param fork_delay: seconds a new fork takes to be available, as
+            github creates them asynchronously
+        :param seed: seed of the random generator for jitter and errors
+        """
+        self.dataset = dataset or Dataset.generate()
+        self.token = token
+        self.per_page = per_page
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.limiter = RateLimiter(rate_limit, rate_limit_window,
+                                   secondary_limit)
+        self.fork_delay = fork_delay
+        # owner/name of the forks merge-upstream fails with a conflict
+        self.merge_conflicts = set()
+        # owner/name and branch of the forks updated with merge-upstream
+        self.merged = []
+        self.requests = []
+        self._forks_ready_at = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.fakehub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base url of the api"""
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self):
+        """Starts serving in a daemon thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        LOG.info("Fake github listening on {}".format(self.url))
+        return self
+
+    def stop(self):
+        """Stops the server and releases the port"""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def record(self, method, path):
+        """Keeps track of the requests received"""
+        with self._lock:
+            self.requests.append((method, path))
+
+    def delay(self):
+        """Sleeps the configured latency"""
+        with self._lock:
+            seconds = self.latency + self._random.uniform(0, self.jitter)
+        if seconds:
+            time.sleep(seconds)
+
+    def should_fail(self):
+        """Whether the current request should fail with a server error"""
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def paginate(self, path, query, items):
+        """Slices a listing and builds its Link header
+
+        :return: tuple of the page and the headers to send
+        """
+        per_page = min(int(query.get('per_page', [self.per_page])[0]),
+                       MAX_PER_PAGE)
+        page = max(int(query.get('page', ['1'])[0]), 1)
+        last = max((len(items) + per_page - 1) // per_page, 1)
+        links = []
+
+        def link(number, rel):
+            params = urlencode({'per_page': per_page, 'page': number})
+            links.append('<{}{}?{}>; rel="{}"'.format(self.url, path, params,
+                                                      rel))
+        if page < last:
+            link(page + 1, 'next')
+            link(last, 'last')
+        if page > 1:
+            link(1, 'first')
+            link(page - 1, 'prev')
+        headers = {'Link': ', '.join(links)} if links else {}
+        return items[(page - 1) * per_page:page * per_page], headers
+
+    def route(self, method, path, body=None):
+        """Resolves a request to a response
+
+        :param body: decoded json body of the request, if any
+        :return: tuple of status code and body
+        :raises NotFound: if the url is not served by the fake api
+        """
+        base = self.url
+        data = self.dataset
+        path = path.rstrip('/')
+        if method == 'GET' and path == '':
+            return 200, {'current_user_url': base + '/user'}
+        if method == 'GET' and path == '/user':
+            return 200, render_user(base, data.user)
+        if method == 'GET' and path == '/user/orgs':
+            return 200, [render_org(base, org) for org in data.orgs]
+
+        match = re.match(r'^/orgs/([^/]+)(/repos)?$', path)
+        if method == 'GET' and match:
+            orgs = [org for org in data.orgs if org['login'] == match.group(1)]
+            if not orgs:
+                raise NotFound()
+            if match.group(2):
+                return 200, [render_repo(base, repo)
+                             for repo in data.owner_repos(match.group(1))]
+            return 200, render_org(base, orgs[0])
+
+        match = re.match(r'^/repositories/([0-9]+)$', path)
+        if method == 'GET' and match:
+            repos = [repo for repo in data.repos.values()
+                     if repo['id'] == int(match.group(1))]
+            if not repos:
+                raise NotFound()
+            return 200, render_repo(base, repos[0])
+
+        match = re.match(r'^/users/([^/]+)/repos$', path)
+        if method == 'GET' and match:
+            return 200, [render_repo(base, repo)
+                         for repo in data.owner_repos(match.group(1))]
+
+        match = re.match(r'^/repos/([^/]+)/([^/]+)/merge-upstream$', path)
+        if method == 'POST' and match:
+            key = (match.group(1), match.group(2))
+            if key not in data.repos:
+                raise NotFound()
+            branch = (body or {}).get('branch')
+            if not data.repos[key].get('fork') or not branch:
+                return 422, {'message': 'Branch not found'}
+            if "{}/{}".format(*key) in self.merge_conflicts:
+                return 409, {'message': 'There are merge conflicts'}
+            with self._lock:
+                self.merged.append(("{}/{}".format(*key), branch))
+            return 200, {'message': 'Successfully fetched and fast-forwarded '
+                                    'from upstream', 'merge_type':
+                                    'fast-forward', 'base_branch': branch}
+
+        match = re.match(r'^/repos/([^/]+)/([^/]+)(/forks)?$', path)
+        if match:
+            key = (match.group(1), match.group(2))
+            if key not in data.repos:
+                raise NotFound()
+            if match.group(3) and method == 'POST':
+                fork = data.repos.get((data.user, key[1]))
+                if not fork:
+                    with self._lock:
+                        fork = data.add_fork(data.repos[key], data.user)
+                        self._forks_ready_at[(data.user, key[1])] = (
+                            time.time() + self.fork_delay)
+                return 202, render_repo(base, fork)
+            if match.group(3):
+                return 200, [render_repo(base, repo)
+                             for repo in data.forks[key]]
+            with self._lock:
+                if self._forks_ready_at.get(key, 0) > time.time():
+                    raise NotFound()
+            if method == 'GET':
+                return 200, render_repo(base, data.repos[key])
+        raise NotFound()
+
+
+def main():
+    """Runs the fake server until interrupted"""
+    parser = argparse.ArgumentParser(
+        description="Fake github api serving a generated dataset",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--token', type=str, default=DEFAULT_TOKEN)
+    parser.add_argument('--user', type=str, default='hubsync')
+    parser.add_argument('--orgs', type=int, default=3)
+    parser.add_argument('--repos', type=int, default=10,
+                        help="Number of repos per organization")
+    parser.add_argument('--user_repos', type=int, default=5)
+    parser.add_argument('--forks', type=int, default=1,
+                        help="Number of forks per organization repo")
+    parser.add_argument('--per_page', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Seconds each request is delayed")
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help="Max random seconds added to the latency")
+    parser.add_argument('--error_rate', type=float, default=0.0,
+                        help="Ratio of requests that fail with a 502")
+    parser.add_argument('--rate_limit', type=int, default=5000,
+                        help="Requests allowed per hour")
+    parser.add_argument('--secondary_limit', type=int, default=None,
+                        help="Max number of concurrent requests")
+    parser.add_argument('--fork_delay', type=float, default=0.0,
+                        help="Seconds new forks take to be available")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    dataset = Dataset.generate(args.user, args.orgs, args.repos,
+                               args.user_repos, args.forks)
+    server = FakeGithub(dataset, args.host, args.port, args.token,
+                        args.per_page, args.latency, args.jitter,
+                        args.error_rate, args.rate_limit,
+                        secondary_limit=args.secondary_limit,
+                        fork_delay=args.fork_delay).start()
+    print("Serving on {} with token {}".format(server.url, server.token))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
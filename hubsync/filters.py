@@ -0,0 +1,226 @@
+"""Selection of the orgs and repos to sync
+
+Orgs and repos are selected with the data of the github listings, before any
+other request or git command is run for them. Those not selected are left
+untouched locally.
+
+Patterns are globs, or regular expressions that have to match the whole name
+when prefixed with "re:". Repo patterns containing a "/" are matched against
+"owner/name" and the rest against the name of the repo.
+
+The filters:PATTERN sections apply to the orgs whose name matches the
+pattern. When several match an org they are applied in the order they appear
+in the config, the later ones overriding the options they set, like the
+org:PATTERN sections of hubsync.policies.
+"""
+import calendar
+import fnmatch
+import logging
+import re
+import time
+
+
+LOG = logging.getLogger('hubsync.filters')
+
+DURATION_UNITS = {'h': 60 * 60, 'd': 24 * 60 * 60, 'w': 7 * 24 * 60 * 60}
+GITHUB_TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+class InvalidFilter(ValueError):
+    """Raised when a filter in the config cannot be parsed"""
+
+
+def split_list(value):
+    """Splits a config value by commas and whitespace"""
+    if not value:
+        return []
+    return [item for item in re.split(r'[\s,]+', value) if item]
+
+
+def compile_pattern(pattern, case_sensitive=True):
+    """Compiles a glob or "re:" pattern into a regular expression"""
+    flags = 0 if case_sensitive else re.IGNORECASE
+    if pattern.startswith('re:'):
+        regex = pattern[len('re:'):]
+    else:
+        regex = fnmatch.translate(pattern)
+    try:
+        return re.compile(r'(?:{})\Z'.format(regex), flags)
+    except re.error as err:
+        raise InvalidFilter("Invalid pattern {}: {}".format(pattern, err))
+
+
+def parse_duration(value):
+    """Converts a duration like 12h, 90d or 2w to seconds, days by default"""
+    match = re.match(r'^\s*([0-9]+(?:\.[0-9]*)?)\s*([hdw]?)\s*$', str(value))
+    if not match:
+        raise InvalidFilter("Invalid duration {}, use a number followed by h,"
+                            " d or w".format(value))
+    return float(match.group(1)) * DURATION_UNITS[match.group(2) or 'd']
+
+
+def parse_time(value):
+    """Converts a github timestamp to seconds since the epoch"""
+    return calendar.timegm(time.strptime(value, GITHUB_TIME_FORMAT))
+
+
+class NameFilter(object):
+    """Include and exclude patterns
+
+    A name is selected if it matches any include pattern, or there are none,
+    and does not match any exclude pattern.
+    """
+
+    def __init__(self, include=(), exclude=(), case_sensitive=True):
+        self.include = [(pattern, compile_pattern(pattern, case_sensitive))
+                        for pattern in include]
+        self.exclude = [(pattern, compile_pattern(pattern, case_sensitive))
+                        for pattern in exclude]
+
+    @staticmethod
+    def _matches(patterns, name, full_name):
+        return any(regex.match(full_name if '/' in pattern else name)
+                   for pattern, regex in patterns)
+
+    def selects(self, name, full_name=None):
+        """Whether the name is selected
+
+        :param full_name: owner/name, for the patterns containing a "/"
+        """
+        full_name = full_name or name
+        if self.include and not self._matches(self.include, name, full_name):
+            return False
+        return not self._matches(self.exclude, name, full_name)
+
+
+class RepoFilter(object):
+    """Selects the repos of an org by name and listing metadata"""
+
+    def __init__(self, names=None, archived=True, forks=True, max_size=None,
+                 languages=(), pushed_within=None):
+        """
+        :type names: NameFilter
+        :param archived: whether to select archived repos
+        :param forks: whether to select repos that are forks
+        :param max_size: max size in MB of the selected repos
+        :param languages: main languages of the selected repos, any if empty
+        :param pushed_within: seconds since the last push of the selected
+            repos
+        """
+        self.names = names or NameFilter()
+        self.archived = archived
+        self.forks = forks
+        self.max_size = max_size
+        self.languages = set(language.lower() for language in languages)
+        self.pushed_within = pushed_within
+
+    @staticmethod
+    def from_config(section, case_sensitive=True):
+        """Builds the filter from a filters section of the config
+
+        :type section: hubsync.config.Config.Filters
+        :raises InvalidFilter: if a value cannot be parsed
+        """
+        try:
+            max_size = (float(section.max_size) if section.max_size
+                        else None)
+        except ValueError:
+            raise InvalidFilter("Invalid max_size {}".format(section.max_size))
+        return RepoFilter(
+            NameFilter(split_list(section.include),
+                       split_list(section.exclude), case_sensitive),
+            archived=bool(section.archived), forks=bool(section.forks),
+            max_size=max_size, languages=split_list(section.languages),
+            pushed_within=(parse_duration(section.pushed_within)
+                           if section.pushed_within else None))
+
+    def selects_name(self, name, full_name):
+        """Whether a repo is selected by its name alone"""
+        return self.names.selects(name, full_name)
+
+    def selects(self, github_repo, now=None):
+        """Whether a github repo is selected
+
+        :type github_repo: hubsync.github.Repo
+        :param now: current time, to check how long ago it was pushed
+        """
+        if not self.selects_name(github_repo.name, github_repo.full_name):
+            return False
+        if github_repo.archived and not self.archived:
+            return False
+        if github_repo.is_fork and not self.forks:
+            return False
+        if (self.max_size is not None and
+                github_repo.size > self.max_size * 1024):
+            return False
+        if (self.languages and
+                (github_repo.language or '').lower() not in self.languages):
+            return False
+        if self.pushed_within is not None and github_repo.pushed_at:
+            now = time.time() if now is None else now
+            if now - parse_time(github_repo.pushed_at) > self.pushed_within:
+                return False
+        return True
+
+
+class Selector(object):
+    """Decides which orgs and repos are synced"""
+
+    def __init__(self, orgs=None, repos=None, org_sections=None,
+                 case_sensitive=True, section_filter=None):
+        """
+        :type orgs: NameFilter
+        :param repos: filter of the repos of the orgs no section matches
+        :type repos: RepoFilter
+        :param org_sections: list of (pattern, options set) of the
+            filters:PATTERN sections, in the order of the config
+        :param section_filter: function building the RepoFilter of the
+            options set by the sections matching an org
+        :raises InvalidFilter: if a pattern cannot be parsed
+        """
+        self.orgs = orgs or NameFilter()
+        self.repos = repos or RepoFilter()
+        self.case_sensitive = case_sensitive
+        self.org_sections = [(compile_pattern(pattern, case_sensitive),
+                              values)
+                             for pattern, values in (org_sections or [])]
+        self.section_filter = section_filter
+
+    @staticmethod
+    def from_config(config):
+        """Builds the selector from the filters sections of the config
+
+        :type config: hubsync.config.Config
+        :raises InvalidFilter: if a pattern or value cannot be parsed
+        """
+        case_sensitive = config.glob.case_sensitive
+
+        def section_filter(values):
+            return RepoFilter.from_config(config.filters_section(values),
+                                          case_sensitive)
+        # options given in a section are checked even if no org matches it
+        for _, values in config.org_filters:
+            section_filter(values)
+        return Selector(
+            NameFilter(split_list(config.filters.include_orgs),
+                       split_list(config.filters.exclude_orgs),
+                       case_sensitive),
+            RepoFilter.from_config(config.filters, case_sensitive),
+            config.org_filters, case_sensitive, section_filter)
+
+    def selects_org(self, name):
+        """Whether an org, or the user, is selected"""
+        return self.orgs.selects(name)
+
+    def repo_filter(self, org_name):
+        """Filter for the repos of an org
+
+        :rtype: RepoFilter
+        """
+        values = {}
+        for regex, section_values in self.org_sections:
+            if regex.match(org_name):
+                values.update(section_values)
+        if not values:
+            return self.repos
+        return self.section_filter(values)
@@ -0,0 +1,283 @@
+"""Background management of the forks of the user
+
+Github creates forks asynchronously: the fork request returns straight away
+but the fork takes a while to be available. ForkQueue sends the fork requests
+from a background thread, spacing them and pausing when github asks to, and
+polls each fork until it is available, so the sync of the repos does not wait
+for them. The forks ready are configured as remotes at the end of the sync.
+
+MergeUpstreamQueue updates the default branch of existing forks through the
+merge-upstream api, so github moves the commits instead of fetching them
+locally and pushing them back. Forks github cannot update are reported to
+be pushed locally.
+"""
+import collections
+import logging
+import re
+import threading
+import time
+
+import requests
+from six.moves import queue
+from six.moves.urllib.parse import urlparse
+
+from . import github
+
+
+LOG = logging.getLogger('hubsync.forks')
+
+ForkRequest = collections.namedtuple('ForkRequest', 'github_repo path')
+Fork = collections.namedtuple('Fork', 'github_repo path url')
+MergeRequest = collections.namedtuple('MergeRequest',
+                                      'github_repo path fork_name branch')
+
+
+def send(api, method, url, data=None):
+    """Sends a request, waiting and retrying if github limits the rate
+
+    :type api: hubsync.github.Api
+    :rtype: hubsync.transport.Response
+    """
+    while True:
+        response = api.request(method, url, data)
+        if response.status not in (403, 429):
+            return response
+        headers = response.headers
+        if 'Retry-After' in headers:
+            wait = int(headers['Retry-After'])
+        elif headers.get('X-RateLimit-Remaining') == '0':
+            wait = int(headers['X-RateLimit-Reset']) - time.time()
+        else:
+            return response
+        LOG.info("Waiting {:.0f}s for the github rate limit".format(wait))
+        time.sleep(max(wait, 0))
+
+
+def remote_name(url):
+    """owner/name of the repo a remote url points to, None if the url has
+    no owner and name
+
+    >>> remote_name('git@github.com:user/repo.git')
+    'user/repo'
+    """
+    if '://' in url:
+        path = urlparse(url).path
+    else:
+        # scp-like syntax, [user@]host:path, or a local path
+        match = re.match(r'^(?:[^@/]+@)?[^:/]+:(.*)$', url)
+        path = match.group(1) if match else url
+    path = path.rstrip('/')
+    if path.endswith('.git'):
+        path = path[:-len('.git')]
+    parts = [part for part in path.split('/') if part]
+    if len(parts) < 2:
+        return None
+    return '/'.join(parts[-2:])
+
+
+class ForkQueue(object):
+    """Creates forks in a background thread"""
+
+    def __init__(self, api, post_interval=1.0, poll_interval=2.0,
+                 timeout=120.0):
+        """
+        :type api: hubsync.github.Api
+        :param post_interval: min seconds between fork requests, github
+            limits how fast content can be created
+        :param poll_interval: seconds between checks of a pending fork
+        :param timeout: seconds to wait for a fork to be available
+        """
+        self.api = api
+        self.post_interval = post_interval
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.ready = []
+        self.failed = []
+        self._requests = queue.Queue()
+        self._pending = []
+        self._closed = threading.Event()
+        self._thread = None
+        self._user = None
+        self._last_post = 0
+
+    def request(self, github_repo, path):
+        """Queues the creation of the fork of a repo
+
+        :type github_repo: hubsync.github.Repo
+        :param path: local path of the repo, to add the fork remote to
+        """
+        if self._thread is None:
+            # resolved here as the api caches it without locking
+            self._user = self.api.user.name
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        self._requests.put(ForkRequest(github_repo, path))
+
+    def wait(self):
+        """Waits for the queued forks to be available or to time out
+
+        :return: list of Fork ready
+        """
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.ready
+
+    def _create(self, fork_request):
+        """Requests a fork, unless the user already has it"""
+        github_repo = fork_request.github_repo
+        existing = send(self.api, 'GET', "{}/repos/{}/{}".format(
+            self.api.base_url, self._user, github_repo.name))
+        if existing.status == 200 and self._is_fork_of(existing.json(),
+                                                       github_repo):
+            LOG.debug("{} is already forked".format(github_repo.full_name))
+            self.ready.append(Fork(github_repo, fork_request.path,
+                                   existing.json()['ssh_url']))
+            return
+        wait = self._last_post + self.post_interval - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        LOG.info("Creating a fork for {}".format(github_repo.full_name))
+        response = send(self.api, 'POST', github_repo.forks_url)
+        self._last_post = time.time()
+        if response.status not in (200, 202):
+            LOG.error("Failed to fork {}: {} {}".format(
+                github_repo.full_name, response.status, response.body))
+            self.failed.append(fork_request)
+            return
+        data = response.json()
+        self._pending.append((fork_request, data['url'], data['ssh_url'],
+                              time.time() + self.timeout))
+
+    @staticmethod
+    def _is_fork_of(data, github_repo):
+        """Whether a repo of the user is a fork of github_repo, rather than
+        a repo or a fork of another repo with the same name"""
+        parent = (data.get('parent') or {}).get('full_name') or ''
+        return bool(data.get('fork')) and \
+            parent.lower() == github_repo.full_name.lower()
+
+    def _poll(self):
+        """Checks whether the pending forks are available"""
+        still_pending = []
+        for fork_request, url, ssh_url, deadline in self._pending:
+            if send(self.api, 'GET', url).status == 200:
+                LOG.debug("Fork of {} is available"
+                          .format(fork_request.github_repo.full_name))
+                self.ready.append(Fork(fork_request.github_repo,
+                                       fork_request.path, ssh_url))
+            elif time.time() > deadline:
+                LOG.error("Fork of {} not available after {}s, it will be "
+                          "configured on the next sync".format(
+                              fork_request.github_repo.full_name,
+                              self.timeout))
+                self.failed.append(fork_request)
+            else:
+                still_pending.append((fork_request, url, ssh_url, deadline))
+        self._pending = still_pending
+
+    def _run(self):
+        next_poll = time.time() + self.poll_interval
+        while True:
+            try:
+                fork_request = self._requests.get(timeout=0.1)
+            except queue.Empty:
+                fork_request = None
+            if fork_request is not None:
+                try:
+                    self._create(fork_request)
+                except (requests.RequestException, github.GithubError,
+                        ValueError) as err:
+                    LOG.error("Failed to fork {}: {}".format(
+                        fork_request.github_repo.full_name, err))
+                    self.failed.append(fork_request)
+            if self._pending and time.time() >= next_poll:
+                try:
+                    self._poll()
+                except (requests.RequestException, github.GithubError) as err:
+                    LOG.warning("Failed to check the pending forks: {}"
+                                .format(err))
+                next_poll = time.time() + self.poll_interval
+            if (self._closed.is_set() and self._requests.empty() and
+                    not self._pending):
+                return
+
+
+class MergeUpstreamQueue(object):
+    """Fast-forwards forks server side from a background thread"""
+
+    def __init__(self, api, post_interval=1.0):
+        """
+        :type api: hubsync.github.Api
+        :param post_interval: min seconds between merge requests, github
+            limits how fast content can be created
+        """
+        self.api = api
+        self.post_interval = post_interval
+        self.merged = []
+        self.conflicts = []
+        self.failed = []
+        self._requests = queue.Queue()
+        self._thread = None
+
+    def request(self, github_repo, path, fork_name):
+        """Queues the update of the default branch of a fork
+
+        :type github_repo: hubsync.github.Repo
+        :param path: local path of the repo, to push from if github cannot
+            update the fork
+        :param fork_name: owner/name of the fork
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        self._requests.put(MergeRequest(github_repo, path, fork_name,
+                                        github_repo.default_branch))
+
+    def wait(self):
+        """Waits for the queued updates to be done
+
+        :return: list of MergeRequest github could not update
+        """
+        if self._thread is not None:
+            self._requests.put(None)
+            self._thread.join()
+        return self.conflicts
+
+    def _merge(self, merge_request):
+        url = "{}/repos/{}/merge-upstream".format(self.api.base_url,
+                                                  merge_request.fork_name)
+        response = send(self.api, 'POST', url,
+                        {'branch': merge_request.branch})
+        if response.status == 200:
+            LOG.debug("Fork {} updated: {}".format(
+                merge_request.fork_name, response.json().get('message')))
+            self.merged.append(merge_request)
+        elif response.status in (409, 422):
+            LOG.info("Github cannot update fork {}: {}".format(
+                merge_request.fork_name, response.json().get('message')))
+            self.conflicts.append(merge_request)
+        else:
+            LOG.error("Failed to update fork {}: {} {}".format(
+                merge_request.fork_name, response.status, response.body))
+            self.failed.append(merge_request)
+
+    def _run(self):
+        last_post = 0
+        while True:
+            merge_request = self._requests.get()
+            if merge_request is None:
+                return
+            wait = last_post + self.post_interval - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                self._merge(merge_request)
+            except (requests.RequestException, github.GithubError,
+                    ValueError) as err:
+                LOG.error("Failed to update fork {}: {}".format(
+                    merge_request.fork_name, err))
+                self.failed.append(merge_request)
+            last_post = time.time()
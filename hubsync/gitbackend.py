@@ -0,0 +1,517 @@
+"""Backends used to read and modify the local git repositories
+
+All git access of hubsync goes through a backend, which opens repositories
+and clones them. The opened repositories expose the small set of operations
+hubsync needs:
+
+- gitpython: uses GitPython, which spawns git processes for most operations
+- pygit2: reads refs, edits remotes config and deletes branches in process
+  through libgit2. Network operations still run the git command line so the
+  user ssh and credential setup is honoured. Requires pygit2 to be installed.
+
+Backends created with a timeout kill the clones, pulls, fetches and pushes
+that take longer, see hubsync.watchdog.
+"""
+import logging
+import subprocess
+
+import git
+
+from . import watchdog
+
+
+LOG = logging.getLogger('hubsync.gitbackend')
+
+
+class GitBackendError(Exception):
+    """Base exception for errors of the git backends"""
+
+
+class InvalidRepository(GitBackendError):
+    """Raised when opening a path that is not a git repository"""
+
+
+class GitTimeout(GitBackendError):
+    """Raised when git is killed for taking longer than its timeout"""
+
+
+def run_git(path, *args, **kwargs):
+    """Runs a git command within path and returns its output
+
+    :param timeout: keyword only, seconds after which git is killed. No
+        limit if None
+    :raises GitBackendError: if the command fails
+    :raises GitTimeout: if the command is killed
+    """
+    timeout = kwargs.pop('timeout', None)
+    try:
+        return watchdog.check_output(('git',) + args, cwd=path,
+                                     timeout=timeout).decode('utf-8')
+    except subprocess.CalledProcessError as err:
+        raise GitBackendError("{}{}".format(
+            str(err).rstrip('.'), watchdog.describe_stderr(err.stderr)))
+    except watchdog.Timeout as err:
+        raise GitTimeout(str(err))
+
+
+def clone(url, path, branch=None, options=(), timeout=None):
+    """Clones url into path running git
+
+    :param branch: if given, only this branch is cloned
+    :param options: extra arguments of git clone, like --depth 1
+    :param timeout: seconds after which git is killed, no limit if None
+    """
+    args = tuple(options)
+    if branch is not None:
+        args += ('--single-branch', '--branch', branch)
+    run_git(None, 'clone', *(args + (url, path)), timeout=timeout)
+
+
+class GitPythonRepo(object):
+    """Repository opened through GitPython"""
+
+    def __init__(self, path, timeout=None):
+        """
+        :param timeout: seconds after which the network operations are
+            killed, no limit if None
+        """
+        self.path = path
+        self.timeout = timeout
+        try:
+            self.repo = git.Repo(path)
+        except (git.exc.InvalidGitRepositoryError, git.exc.NoSuchPathError):
+            raise InvalidRepository("Not a git repository: {}".format(path))
+
+    def remote_url(self, name):
+        """Url of a remote, None if it does not exist"""
+        try:
+            return self.repo.remote(name).url
+        except ValueError:
+            return None
+
+    def create_remote(self, name, url):
+        """Adds a new remote"""
+        self.repo.create_remote(name, url)
+
+    def set_remote_config(self, name, key, value):
+        """Sets a config value of the remote section, like pushurl"""
+        writer = self.repo.remote(name).config_writer
+        try:
+            writer.set(key, value)
+        finally:
+            writer.release()
+
+    def fetch_refspecs(self, name):
+        """Fetch refspecs configured for a remote"""
+        try:
+            return self.repo.git.config(
+                '--get-all', 'remote.{}.fetch'.format(name)).splitlines()
+        except git.exc.GitCommandError:
+            return []
+
+    def set_fetch_refspecs(self, name, refspecs):
+        """Replaces the fetch refspecs of a remote, none removes them all
+
+        :raises GitBackendError: if git fails
+        """
+        key = 'remote.{}.fetch'.format(name)
+        try:
+            try:
+                self.repo.git.config('--unset-all', key)
+            except git.exc.GitCommandError as err:
+                # 5 is the status of a key not set
+                if err.status != 5:
+                    raise
+            for refspec in refspecs:
+                self.repo.git.config('--add', key, refspec)
+        except git.exc.GitCommandError as err:
+            raise GitBackendError(str(err))
+
+    def remote_branches(self, name):
+        """Names of the remote-tracking branches of a remote, HEAD included
+
+        :raises GitBackendError: if git fails
+        """
+        prefix = 'refs/remotes/{}/'.format(name)
+        try:
+            output = self.repo.git.for_each_ref('--format=%(refname)',
+                                                prefix)
+        except git.exc.GitCommandError as err:
+            raise GitBackendError(str(err))
+        return [ref[len(prefix):] for ref in output.splitlines()]
+
+    def delete_remote_branch(self, name, branch):
+        """Deletes a remote-tracking branch
+
+        :raises GitBackendError: if git fails
+        """
+        try:
+            self.repo.git.update_ref('-d', 'refs/remotes/{}/{}'.format(
+                name, branch))
+        except git.exc.GitCommandError as err:
+            raise GitBackendError(str(err))
+
+    def pull(self, remote, prune=False):
+        """Pulls the current branch from remote
+
+        :param prune: whether to remove the remote-tracking branches deleted
+            in the remote
+        :raises GitBackendError: if git fails
+        """
+        self._network(('pull',) + (('--prune', remote) if prune
+                                   else (remote,)),
+                      self.repo.remote(remote).pull, prune=prune)
+
+    def fetch(self, remote, prune=False):
+        """Fetches from remote
+
+        :param prune: whether to remove the remote-tracking branches deleted
+            in the remote
+        :raises GitBackendError: if git fails
+        """
+        self._network(('fetch',) + (('--prune', remote) if prune
+                                    else (remote,)),
+                      self.repo.remote(remote).fetch, prune=prune)
+
+    def push(self, remote, refspec):
+        """Pushes refspec to remote, without forcing it
+
+        :raises GitBackendError: if git fails or the push is rejected
+        """
+        self._network(('push', '-q', remote, refspec), self.repo.git.push,
+                      remote, refspec)
+
+    def _network(self, args, operation, *op_args, **kwargs):
+        """Runs an operation that uses the network
+
+        With a timeout git runs under the watchdog, GitPython cannot tell
+        whether it killed git or git failed.
+
+        :param args: arguments of the git command doing the operation
+        :param operation: GitPython function doing it without timeout
+        :raises GitBackendError: if git fails
+        :raises GitTimeout: if git is killed
+        """
+        if self.timeout:
+            run_git(self.path, *args, timeout=self.timeout)
+            return
+        try:
+            operation(*op_args, **kwargs)
+        except git.exc.GitCommandError as err:
+            raise GitBackendError(str(err))
+
+    def branches(self):
+        """Names of the local branches"""
+        return [head.name for head in self.repo.heads]
+
+    def rev_parse(self, ref):
+        """Sha of the commit ref points to, None if it does not exist"""
+        try:
+            return self.repo.commit(ref).hexsha
+        except (git.exc.BadName, ValueError):
+            return None
+
+    def ahead_behind(self, branch, upstream):
+        """Returns how many commits branch is ahead and behind upstream"""
+        try:
+            output = self.repo.git.rev_list(
+                '--left-right', '--count', '{}...{}'.format(branch, upstream))
+        except git.exc.GitCommandError as err:
+            raise GitBackendError(str(err))
+        ahead, behind = output.split()
+        return int(ahead), int(behind)
+
+    def is_dirty(self):
+        """Whether there are uncommitted changes or untracked files
+
+        :raises GitBackendError: if git fails
+        """
+        # a single git status is cheaper than the diffs of Repo.is_dirty
+        try:
+            return bool(self.repo.git.status('--porcelain'))
+        except git.exc.GitCommandError as err:
+            raise GitBackendError(str(err))
+
+    def active_branch(self):
+        """Name of the checked out branch, None if HEAD is detached"""
+        if self.repo.head.is_detached:
+            return None
+        return self.repo.active_branch.name
+
+    def tracking_branches(self):
+        """Dictionary of local branch name to its upstream, None if it has
+        no upstream configured. The upstream may not exist anymore"""
+        result = {}
+        for head in self.repo.heads:
+            tracking = head.tracking_branch()
+            result[head.name] = tracking.name if tracking else None
+        return result
+
+    def delete_branch(self, name):
+        """Deletes a local branch
+
+        :raises GitBackendError: if git refuses to delete it
+        """
+        try:
+            self.repo.delete_head(name)
+        except git.exc.GitCommandError as err:
+            raise GitBackendError(str(err))
+
+    def close(self):
+        """Releases the git processes and files held by the repo"""
+        self.repo.close()
+
+
+class GitPythonBackend(object):
+    """Backend based on GitPython"""
+    name = 'gitpython'
+
+    def __init__(self, timeout=None):
+        """
+        :param timeout: seconds after which the network operations are
+            killed, no limit if None
+        """
+        self.timeout = timeout
+
+    def open(self, path):
+        """Opens the repository in path
+
+        :raises InvalidRepository: if path is not a git repository
+        """
+        return GitPythonRepo(path, self.timeout)
+
+    def clone(self, url, path, branch=None, options=()):
+        """Clones url into path
+
+        :param branch: if given, only this branch is cloned
+        :param options: extra arguments of git clone, like --depth 1
+        :raises GitBackendError: if git fails
+        """
+        if self.timeout:
+            # GitPython cannot kill a clone, it runs under the watchdog
+            clone(url, path, branch, options, self.timeout)
+            return
+        kwargs = {}
+        if branch is not None:
+            kwargs.update(single_branch=True, branch=branch)
+        if options:
+            kwargs['multi_options'] = list(options)
+        try:
+            git.Repo.clone_from(url, path, **kwargs)
+        except git.exc.GitCommandError as err:
+            raise GitBackendError(str(err))
+
+
+class Pygit2Repo(object):
+    """Repository opened through libgit2"""
+
+    def __init__(self, pygit2, path, timeout=None):
+        """
+        :param timeout: seconds after which the network operations are
+            killed, no limit if None
+        """
+        self._pygit2 = pygit2
+        self.path = path
+        self.timeout = timeout
+        try:
+            self.repo = pygit2.Repository(path)
+        except (pygit2.GitError, KeyError):
+            raise InvalidRepository("Not a git repository: {}".format(path))
+
+    def remote_url(self, name):
+        """Url of a remote, None if it does not exist"""
+        try:
+            return self.repo.remotes[name].url
+        except KeyError:
+            return None
+
+    def create_remote(self, name, url):
+        """Adds a new remote"""
+        self.repo.remotes.create(name, url)
+
+    def set_remote_config(self, name, key, value):
+        """Sets a config value of the remote section, like pushurl"""
+        self.repo.config["remote.{}.{}".format(name, key)] = value
+
+    def fetch_refspecs(self, name):
+        """Fetch refspecs configured for a remote"""
+        try:
+            return list(self.repo.remotes[name].fetch_refspecs)
+        except KeyError:
+            return []
+
+    def set_fetch_refspecs(self, name, refspecs):
+        """Replaces the fetch refspecs of a remote"""
+        try:
+            self.repo.config.delete_multivar(
+                'remote.{}.fetch'.format(name), '.*')
+        except (KeyError, self._pygit2.GitError):
+            pass
+        for refspec in refspecs:
+            self.repo.remotes.add_fetch(name, refspec)
+
+    def remote_branches(self, name):
+        """Names of the remote-tracking branches of a remote, HEAD included"""
+        prefix = 'refs/remotes/{}/'.format(name)
+        return [ref[len(prefix):] for ref in self.repo.listall_references()
+                if ref.startswith(prefix)]
+
+    def delete_remote_branch(self, name, branch):
+        """Deletes a remote-tracking branch
+
+        :raises GitBackendError: if it does not exist or libgit2 fails
+        """
+        try:
+            self.repo.references.delete('refs/remotes/{}/{}'.format(name,
+                                                                    branch))
+        except (KeyError, self._pygit2.GitError) as err:
+            raise GitBackendError(str(err))
+
+    def pull(self, remote, prune=False):
+        """Pulls the current branch from remote
+
+        :param prune: whether to remove the remote-tracking branches deleted
+            in the remote
+        :raises GitBackendError: if git fails
+        """
+        run_git(self.path, 'pull', *(('--prune', remote) if prune
+                                     else (remote,)), timeout=self.timeout)
+
+    def fetch(self, remote, prune=False):
+        """Fetches from remote
+
+        :param prune: whether to remove the remote-tracking branches deleted
+            in the remote
+        :raises GitBackendError: if git fails
+        """
+        run_git(self.path, 'fetch', *(('--prune', remote) if prune
+                                      else (remote,)), timeout=self.timeout)
+
+    def push(self, remote, refspec):
+        """Pushes refspec to remote, without forcing it
+
+        :raises GitBackendError: if git fails or the push is rejected
+        """
+        run_git(self.path, 'push', '-q', remote, refspec,
+                timeout=self.timeout)
+
+    def branches(self):
+        """Names of the local branches"""
+        return list(self.repo.branches.local)
+
+    def rev_parse(self, ref):
+        """Sha of the commit ref points to, None if it does not exist"""
+        try:
+            return str(self.repo.revparse_single(ref).peel(
+                self._pygit2.Commit).id)
+        except (KeyError, ValueError, self._pygit2.GitError):
+            return None
+
+    def ahead_behind(self, branch, upstream):
+        """Returns how many commits branch is ahead and behind upstream"""
+        try:
+            local = self.repo.revparse_single(branch).id
+            remote = self.repo.revparse_single(upstream).id
+        except KeyError as err:
+            raise GitBackendError("Unknown revision {}".format(err))
+        return self.repo.ahead_behind(local, remote)
+
+    def is_dirty(self):
+        """Whether there are uncommitted changes or untracked files
+
+        :raises GitBackendError: if libgit2 cannot read the index
+        """
+        try:
+            return bool(self.repo.status())
+        except self._pygit2.GitError as err:
+            raise GitBackendError(str(err))
+
+    def active_branch(self):
+        """Name of the checked out branch, None if HEAD is detached"""
+        if self.repo.head_is_detached:
+            return None
+        return self.repo.head.shorthand
+
+    def tracking_branches(self):
+        """Dictionary of local branch name to its upstream, None if it has
+        no upstream configured. The upstream may not exist anymore"""
+        result = {}
+        for name in self.repo.branches.local:
+            try:
+                upstream = self.repo.branches.local[name].upstream_name
+            except (KeyError, self._pygit2.GitError):
+                upstream = None
+            if upstream is not None and upstream.startswith('refs/remotes/'):
+                upstream = upstream[len('refs/remotes/'):]
+            result[name] = upstream
+        return result
+
+    def delete_branch(self, name):
+        """Deletes a local branch
+
+        :raises GitBackendError: if libgit2 refuses to delete it
+        """
+        try:
+            self.repo.branches.delete(name)
+        except self._pygit2.GitError as err:
+            raise GitBackendError(str(err))
+
+    def close(self):
+        """Releases the files held by the repo"""
+        self.repo.free()
+
+
+class Pygit2Backend(object):
+    """Backend based on libgit2 through pygit2"""
+    name = 'pygit2'
+
+    def __init__(self, timeout=None):
+        """
+        :param timeout: seconds after which the network operations are
+            killed, no limit if None
+        """
+        try:
+            import pygit2
+        except ImportError:
+            raise GitBackendError("The pygit2 backend requires pygit2, "
+                                  "install it with 'pip install pygit2'")
+        self._pygit2 = pygit2
+        self.timeout = timeout
+
+    def open(self, path):
+        """Opens the repository in path
+
+        :raises InvalidRepository: if path is not a git repository
+        """
+        return Pygit2Repo(self._pygit2, path, self.timeout)
+
+    def clone(self, url, path, branch=None, options=()):
+        """Clones url into path
+
+        :param branch: if given, only this branch is cloned
+        :param options: extra arguments of git clone, like --depth 1
+        :raises GitBackendError: if git fails
+        """
+        clone(url, path, branch, options, self.timeout)
+
+
+BACKENDS = {
+    GitPythonBackend.name: GitPythonBackend,
+    Pygit2Backend.name: Pygit2Backend,
+}
+
+
+def get_backend(name, timeout=None):
+    """Returns a backend given its name
+
+    :param timeout: seconds after which the network operations are killed,
+        no limit if None
+    :raises GitBackendError: if the backend is unknown or not installed
+    """
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise GitBackendError("Unknown git backend {}, valid ones are: {}"
+                              .format(name, ", ".join(sorted(BACKENDS))))
+    LOG.debug("Using the {} git backend".format(name))
+    return backend_class(timeout)
@@ -1,44 +1,120 @@
 """File that wraps http requests to github api"""
 import collections
+import json
 import logging
 
 import requests
 
+from . import watchdog
+from .transport import HttpTransport
+
 
 LOG = logging.getLogger("hubsync.api")
 
+
+class GithubError(Exception):
+    """Base exception for errors talking to github"""
+
+
+class AuthenticationError(GithubError):
+    """Raised when github rejects the token"""
+
+
+class GithubUnavailable(GithubError):
+    """Raised when github cannot be reached or does not answer in time"""
+
+
+class _RetriedStatus(Exception):
+    """Response of a get that is sent again, github failed or limits the
+    rate"""
+
+    def __init__(self, response):
+        super(_RetriedStatus, self).__init__(
+            "github answered {}".format(response.status))
+        self.response = response
+
+
+def is_rate_limited(response):
+    """Whether github refused a request for going over the rate limit
+
+    :type response: hubsync.transport.Response
+    """
+    return response.status == 429 or (
+        response.status == 403 and
+        ('Retry-After' in response.headers or
+         response.headers.get('X-RateLimit-Remaining') == '0'))
+
+
 Fork = collections.namedtuple('Fork', 'name description fork_owner origin_url'
                                       ' forked_url')
 
 
 class Repo(object):
-    """Represents a repo within github"""
+    """Represents a repo within github
+
+    Syncs hold one per repo of the org being listed, so it keeps only the
+    fields hubsync uses in slots rather than the whole api representation.
+    """
+    __slots__ = ('api', 'user', 'name', 'description', 'url', 'forks_url',
+                 'id', 'default_branch', 'archived', 'is_fork', 'size',
+                 'language', 'pushed_at')
 
     @staticmethod
     def from_url(api, url):
         """Builds an repo given its github api url"""
-        data = api.get(url)
+        return Repo.from_data(api, api.get(url))
+
+    @staticmethod
+    def from_data(api, data):
+        """Builds an repo given its github api representation
+
+        The items of the repo listings contain all the data needed, there is
+        no need to request each repo.
+        """
         return Repo(api, data["owner"]["login"], data["name"],
-                    data["description"], data["ssh_url"], data["forks_url"])
+                    data["description"], data["ssh_url"], data["forks_url"],
+                    data.get("id"), data.get("default_branch") or "master",
+                    archived=bool(data.get("archived")),
+                    is_fork=bool(data.get("fork")), size=data.get("size") or 0,
+                    language=data.get("language"),
+                    pushed_at=data.get("pushed_at"))
 
-    def __init__(self, api, user, name, description, url, forks_url):
+    def __init__(self, api, user, name, description, url, forks_url,
+                 repo_id=None, default_branch="master", archived=False,
+                 is_fork=False, size=0, language=None, pushed_at=None):
+        """
+        :param size: size of the repo in KB as reported by github
+        :param pushed_at: time of the last push as an ISO 8601 string
+        """
         self.api = api
         self.user = user
         self.name = name
         self.description = description
         self.url = url
-        self._forks_url = forks_url
+        self.forks_url = forks_url
+        self.id = repo_id
+        self.default_branch = default_branch
+        self.archived = archived
+        self.is_fork = is_fork
+        self.size = size
+        self.language = language
+        self.pushed_at = pushed_at
+
+    @property
+    def full_name(self):
+        """owner/name of the repo"""
+        return "{}/{}".format(self.user, self.name)
 
     @property
     def forks(self):
         """Lists of the forks  of the repo"""
-        result = self.api.get(self._forks_url)
+        result = self.api.get(self.forks_url)
         return [Fork(item["name"], item["description"], self.name,
                      item["ssh_url"], self.url) for item in result]
 
     def fork(self):
         """Forks the repo to the current user"""
-        self.api.post(self._forks_url)
+        self.api.post(self.forks_url)
 
 
 class Organization(object):
@@ -47,7 +123,11 @@ class Organization(object):
     @staticmethod
     def from_url(api, url):
         """Builds an organization given its github api url"""
-        data = api.get(url)
+        return Organization.from_data(api, url, api.get(url))
+
+    @staticmethod
+    def from_data(api, url, data):
+        """Builds an organization given its github api representation"""
         return Organization(api, url, data["login"], data["description"],
                             data["repos_url"])
 
@@ -63,11 +143,15 @@ class Organization(object):
         """repr for an Organization"""
         return "<{0.__class__.__name__} {0.name}({0.description})>".format(self)
 
+    def iter_repos(self):
+        """Yields the repos within the org, requesting a page at a time"""
+        for item in self.api.iter_get(self.repos_url):
+            yield Repo.from_data(self.api, item)
+
     @property
     def repos(self):
         """Retrieves the list of repos within an org"""
-        result = self.api.get(self.repos_url)
-        return [Repo.from_url(self.api, item["url"]) for item in result]
+        return list(self.iter_repos())
 
 
 class User(Organization):
@@ -76,46 +160,139 @@ class User(Organization):
     Note that it inherit from Organization as in github users and orgs have
     a really similar structure.
     We can change this once we add user specific functionality"""
-    @property
-    def repos(self):
-        """Retrieves the list of repos within an org"""
-        result = self.api.get(self.repos_url)
-        return [Repo.from_url(self.api, item["url"]) for item in result
-                if not item["fork"]]
+    def iter_repos(self):
+        """Yields the repos of the user that are not forks"""
+        for item in self.api.iter_get(self.repos_url):
+            if not item["fork"]:
+                yield Repo.from_data(self.api, item)
 
 
 class Api(object):
     """Class that wraps calls to github api"""
 
-    def __init__(self, api_url, user_token):
+    def __init__(self, api_url, user_token, transport=None, retries=0):
         """Creates a wrapper for github api
 
         :param api_url: base url for github api
         :param user_token: user token to get access to github
+        :param transport: transport used to send the requests, see
+            hubsync.transport. Http by default
+        :param retries: times a get is sent again if github cannot be
+            reached or does not answer in time
         :type api_url: str
         """
         self.base_url = api_url.rstrip('/')
         self.token = user_token
+        self.transport = transport or HttpTransport()
+        self.retries = retries
+        self.retry_backoff = watchdog.DEFAULT_BACKOFF
         self._user = None
+        # requests left in the rate limit of the token, as last reported
+        self.rate_limit_remaining = None
+
+    def request(self, method, url, data=None):
+        """Sends a request passing the auth header
+
+        The token is validated by the first request, there is no need to
+        check it beforehand.
+
+        Gets are sent again, waiting longer each time, if github cannot be
+        reached, does not answer in time, fails with a 5xx or limits the
+        rate. Posts are not, as github may have received them. Other error
+        statuses are returned, see check.
+
+        :param data: object to send as the json body, if any
+        :rtype: hubsync.transport.Response
+        :raises AuthenticationError: if github rejects the token
+        :raises GithubUnavailable: if github cannot be reached
+        """
+        LOG.debug("Sending {} request to {}".format(method.lower(), url))
+        headers = {"Authorization": "token {}".format(self.token)}
+        body = None
+        if data is not None:
+            headers["Content-Type"] = "application/json"
+            body = json.dumps(data)
+
+        def attempt():
+            response = self.transport.request(method, url, headers, body)
+            if response.status >= 500 or is_rate_limited(response):
+                raise _RetriedStatus(response)
+            return response
+        try:
+            response = watchdog.retry(
+                attempt,
+                (requests.ConnectionError, requests.Timeout, _RetriedStatus),
+                self.retries if method == 'GET' else 0, self.retry_backoff,
+                "{} {}".format(method, url))
+        except (requests.ConnectionError, requests.Timeout) as err:
+            raise GithubUnavailable("Github did not answer {} {}: {}".format(
+                method, url, err))
+        except _RetriedStatus as err:
+            response = err.response
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        if remaining is not None:
+            self.rate_limit_remaining = int(remaining)
+        if response.status == 401:
+            raise AuthenticationError("Invalid credentials. Check your github "
+                                      "token")
+        return response
+
+    @staticmethod
+    def check(response, method, url):
+        """Raises the error status of a response, before its body is read
+
+        :type response: hubsync.transport.Response
+        :raises GithubUnavailable: if github failed or limits the rate
+        :raises GithubError: for the other statuses over 400
+        """
+        if response.status < 400:
+            return
+        error = GithubUnavailable if (
+            response.status >= 500 or is_rate_limited(response)) \
+            else GithubError
+        raise error("Github answered {} {} with {}: {}".format(
+            method, url, response.status, response.body[:200]))
 
     def post(self, url):
         """Performs a post to an url passing the auth header"""
-        LOG.debug("Sending post request to {}".format(url))
-        ret = requests.post(url, headers={
-            "Authorization": "token {}".format(self.token)
-        }).json()
+        response = self.request('POST', url)
+        self.check(response, 'POST', url)
+        ret = response.json()
         LOG.debug("Response: {}".format(ret))
         return ret
 
     def get(self, url):
-        """Performs a get to an url passing the auth header"""
-        LOG.debug("Sending get request to {}".format(url))
-        ret = requests.get(url, headers={
-            "Authorization": "token {}".format(self.token)
-        }).json()
+        """Performs a get to an url passing the auth header
+
+        Paginated listings are followed until the last page
+        """
+        response = self.request('GET', url)
+        self.check(response, 'GET', url)
+        ret = response.json()
+        while isinstance(ret, list) and 'next' in response.links:
+            next_url = response.links['next']
+            response = self.request('GET', next_url)
+            self.check(response, 'GET', next_url)
+            ret.extend(response.json())
         LOG.debug("Response: {}".format(ret))
         return ret
 
+    def iter_get(self, url):
+        """Yields the items of a paginated listing
+
+        Only a page is held at a time, the next one is requested once the
+        items of the previous one are consumed.
+        """
+        while url:
+            response = self.request('GET', url)
+            self.check(response, 'GET', url)
+            page = response.json()
+            LOG.debug("Received {} items from {}".format(len(page), url))
+            url = response.links.get('next')
+            for item in page:
+                yield item
+            del page
+
     @property
     def user(self):
         """Retrieves the user in github
@@ -129,8 +306,22 @@ class Api(object):
                               " repos", data["repos_url"])
         return self._user
 
+    def repository(self, repo_id):
+        """Retrieves a repo by its id, which does not change on renames
+
+        :return: the repo or None if it does not exist or is not accessible
+        :rtype: Repo
+        """
+        url = "{}/repositories/{}".format(self.base_url, repo_id)
+        response = self.request('GET', url)
+        if response.status == 404:
+            return None
+        self.check(response, 'GET', url)
+        return Repo.from_data(self, response.json())
+
     @property
     def organizations(self):
         """Retrieves all organizations an user have"""
         result = self.get(self.base_url + "/user/orgs")
-        return [Organization.from_url(self, item["url"]) for item in result]
+        return [Organization.from_data(self, item["url"], item)
+                for item in result]
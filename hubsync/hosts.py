@@ -0,0 +1,143 @@
+"""Sync of several github hosts in a single run
+
+Each github:NAME section of the config is a github host, like github.com or
+a github enterprise instance, synced into its own folder of the workspace.
+The hosts are synced at the same time, each in a thread with its own api
+session, manifest and journal, so a host waiting for its rate limit or
+failing does not hold the others. The clones, pulls, fetches and pushes of
+all the hosts share a limit of how many run at the same time.
+"""
+from concurrent import futures
+import collections
+import logging
+import os
+import time
+
+from . import github, gitbackend, workspace
+
+
+LOG = logging.getLogger('hubsync.hosts')
+
+Host = collections.namedtuple('Host', 'name api_url token path')
+HostResult = collections.namedtuple(
+    'HostResult', 'name path metrics duration rate_limit_remaining error')
+
+
+class InvalidHosts(ValueError):
+    """Raised when the github:NAME sections of the config are not valid"""
+
+
+def from_config(config, ws_path):
+    """Hosts of the github:NAME sections of the config
+
+    :type config: hubsync.config.Config
+    :param ws_path: workspace path, the folders of the hosts are within it
+    :rtype: list of Host
+    :raises InvalidHosts: if a host has no token or two share a folder
+    """
+    result = []
+    paths = {}
+    for name, section in config.hosts.items():
+        if not section.token:
+            raise InvalidHosts("The token of github:{} is not set"
+                               .format(name))
+        path = os.path.normpath(os.path.join(
+            ws_path, os.path.expanduser(section.path or name)))
+        if path in paths:
+            raise InvalidHosts("github:{} and github:{} sync into the same "
+                               "folder {}".format(paths[path], name, path))
+        paths[path] = name
+        result.append(Host(name, section.api_url, section.token, path))
+    return result
+
+
+class HostSync(object):
+    """Sync of the workspace folder of a host"""
+
+    def __init__(self, host, api, local_workspace, sync_helper,
+                 sync_journal=None, store=None):
+        """
+        :type host: Host
+        :type api: hubsync.github.Api
+        :type local_workspace: hubsync.workspace.Workspace
+        :type sync_helper: hubsync.sync.SyncHelper
+        :type sync_journal: hubsync.journal.Journal
+        :param store: capture store of the api transport, closed at the end
+        :type store: hubsync.transport.CaptureStore
+        """
+        self.host = host
+        self.api = api
+        self.workspace = local_workspace
+        self.sync_helper = sync_helper
+        self.journal = sync_journal
+        self.store = store
+
+    def run(self, resume=False):
+        """Syncs the host, recording the failure instead of raising it
+
+        :param resume: whether to continue the interrupted sync of the host
+        :rtype: HostResult
+        """
+        start = time.time()
+        completed = False
+        error = None
+        try:
+            if self.journal is not None:
+                self.journal.open(resume)
+            self.sync_helper.sync(self.workspace, self.api)
+            completed = True
+        except (github.GithubError, gitbackend.GitBackendError,
+                workspace.LocalWorkspaceError) as err:
+            error = str(err)
+            LOG.error("Failed to sync {}: {}".format(
+                self.host.name or self.host.path, err))
+        except Exception as err:  # pylint: disable=broad-except
+            # a bug must not hide the results of the other hosts
+            error = "{}: {}".format(type(err).__name__, err)
+            LOG.exception("Failed to sync {}".format(
+                self.host.name or self.host.path))
+        finally:
+            if self.journal is not None:
+                self.journal.close(completed)
+            if self.store is not None:
+                self.store.close()
+        return HostResult(self.host.name, self.host.path,
+                          self.sync_helper.metrics, time.time() - start,
+                          self.api.rate_limit_remaining, error)
+
+
+def sync_hosts(host_syncs, resume=False):
+    """Syncs the hosts at the same time
+
+    :type host_syncs: list of HostSync
+    :return: list of HostResult, in the order of host_syncs
+    """
+    if len(host_syncs) == 1:
+        return [host_syncs[0].run(resume)]
+    with futures.ThreadPoolExecutor(max_workers=len(host_syncs)) as executor:
+        return list(executor.map(lambda host_sync: host_sync.run(resume),
+                                 host_syncs))
+
+
+def format_report(results):
+    """Formats a line per host and the totals of the run"""
+    lines = []
+    for result in results:
+        if result.error:
+            lines.append("{}: failed after {:.1f}s: {}".format(
+                result.name, result.duration, result.error))
+            continue
+        line = "{}: {} repos synced in {:.1f}s into {}".format(
+            result.name, result.metrics.counters.get('repos', 0),
+            result.duration, result.path)
+        if result.metrics.counters.get('repos.failed'):
+            line += ", {} repos failed".format(
+                result.metrics.counters['repos.failed'])
+        if result.rate_limit_remaining is not None:
+            line += ", {} api requests left".format(
+                result.rate_limit_remaining)
+        lines.append(line)
+    lines.append("{} hosts synced, {} failed".format(
+        len([result for result in results if not result.error]),
+        len([result for result in results if result.error])))
+    return "\n".join(lines)
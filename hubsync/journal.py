@@ -0,0 +1,117 @@
+"""Checkpoint journal of a sync, to resume it if it is interrupted
+
+The sync appends a line to the journal when it starts and when it finishes
+each clone, repo and org, flushing it to disk before going on. The journal
+is removed once the sync completes, so finding it means the last sync was
+interrupted. Resuming it skips the orgs and repos it finished and removes
+the clones it left half done, as git may have left them unusable.
+"""
+import json
+import logging
+import os
+import shutil
+import time
+
+
+LOG = logging.getLogger('hubsync.journal')
+
+START = 'start'
+DONE = 'done'
+
+
+class Journal(object):
+    """Write-ahead journal of the actions of a sync"""
+
+    def __init__(self, path):
+        """
+        :param path: path of the journal file, within the workspace
+        """
+        self.path = path
+        self._started = set()
+        self._done = set()
+        # done by the interrupted sync, the one resumed
+        self._done_before = set()
+        self._file = None
+
+    @property
+    def interrupted(self):
+        """Whether there is a journal left by an interrupted sync"""
+        return os.path.exists(self.path)
+
+    def _load(self):
+        with open(self.path) as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # the last line is partial if the sync was killed writing
+                    LOG.debug("Ignoring partial journal line {!r}"
+                              .format(line))
+                    continue
+                action = (record['kind'], record['key'])
+                if record['action'] == DONE:
+                    self._done.add(action)
+                    self._done_before.add(action)
+                else:
+                    self._started.add(action)
+
+    def open(self, resume=False):
+        """Opens the journal for the sync
+
+        :param resume: whether to continue the interrupted sync, otherwise
+            the journal is started anew. The clones it left half done are
+            removed by remove_unfinished_clones either way
+        """
+        if resume and self.interrupted:
+            self._load()
+            LOG.info("Resuming the interrupted sync, {} actions were done"
+                     .format(len(self._done_before)))
+        elif self.interrupted:
+            print("The last sync was interrupted, run with --resume to "
+                  "continue it instead of starting again")
+            # read before it is truncated, for its unfinished clones
+            self._load()
+            self._done_before.clear()
+        self._file = open(self.path, 'a' if resume else 'w')
+
+    def _write(self, action, kind, key):
+        self._file.write(json.dumps({'action': action, 'kind': kind,
+                                     'key': key, 'at': time.time()}) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def start(self, kind, key):
+        """Records that an action is starting"""
+        self._started.add((kind, key))
+        self._write(START, kind, key)
+
+    def done(self, kind, key):
+        """Records that an action finished"""
+        self._done.add((kind, key))
+        self._write(DONE, kind, key)
+
+    def is_done(self, kind, key):
+        """Whether an action finished in the interrupted sync, the ones
+        finished since it was resumed do not count"""
+        return (kind, key) in self._done_before
+
+    def unfinished(self, kind):
+        """Keys of the actions of a kind started but not finished"""
+        return sorted(key for started_kind, key in self._started - self._done
+                      if started_kind == kind)
+
+    def remove_unfinished_clones(self):
+        """Removes the folders of the clones left half done"""
+        for path in self.unfinished('clone'):
+            if os.path.exists(path):
+                print("Removing the unfinished clone {}".format(path))
+                shutil.rmtree(path)
+
+    def close(self, completed):
+        """Closes the journal, removing it if the sync completed"""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        if completed:
+            os.remove(self.path)
@@ -0,0 +1,265 @@
+"""Maintenance of the git repositories within the workspace
+
+Repos synced for months pile up loose objects and packs and have no
+commit-graph, which makes every fetch and ancestry check slower. The
+maintenance runs, in each repo:
+
+- repack: packs the loose objects, rolling small packs into bigger ones
+  geometrically instead of repacking everything
+- multi-pack-index: indexes all packs so objects are found with one lookup
+- commit-graph: writes the commit-graph incrementally, it speeds up the
+  ancestry checks
+- reflog: expires old reflog entries
+- pack-refs: packs the loose refs
+
+It is throttled so it can run in the background: git runs with a lower
+priority, the stage pauses between repos to only use a fraction of the time
+and stops starting new repos once its time budget is spent. Repos maintained
+recently are skipped. Each repo is measured before and after: its loose
+objects and packs and how long a walk of its history takes.
+"""
+import collections
+import logging
+import os
+import subprocess
+import time
+
+from . import filters, gitbackend
+
+
+LOG = logging.getLogger('hubsync.maintenance')
+
+# name: git arguments, in the order they run
+TASKS = collections.OrderedDict([
+    ('repack', ('repack', '-d', '-l', '-q', '--geometric=2')),
+    ('multi-pack-index', ('multi-pack-index', 'write')),
+    ('commit-graph', ('commit-graph', 'write', '--reachable', '--split')),
+    ('reflog', ('reflog', 'expire', '--all')),
+    ('pack-refs', ('pack-refs', '--all')),
+])
+
+Maintenance = collections.namedtuple(
+    'Maintenance', 'org name path skipped duration tasks before after error')
+
+
+class InvalidMaintenance(ValueError):
+    """Raised when the maintenance config cannot be parsed"""
+
+
+def run_niced_git(path, args, niceness=0):
+    """Runs a git command within path with a lower priority
+
+    :param niceness: increment of the niceness of the git process, ignored
+        where processes cannot be niced
+    :raises GitBackendError: if the command fails
+    """
+    def lower_priority():
+        os.nice(niceness)
+
+    preexec_fn = None
+    if niceness and hasattr(os, 'nice'):
+        preexec_fn = lower_priority
+    try:
+        return subprocess.check_output(
+            ('git',) + tuple(args), cwd=path, preexec_fn=preexec_fn,
+            stderr=subprocess.STDOUT).decode('utf-8')
+    except subprocess.CalledProcessError as err:
+        raise gitbackend.GitBackendError("git {} failed: {}".format(
+            args[0], err.output.decode('utf-8', 'replace').strip()))
+    except OSError as err:
+        raise gitbackend.GitBackendError(str(err))
+
+
+def measure(path):
+    """Loose objects, packs and seconds taken to walk the history of a repo
+
+    :return: dictionary with loose_objects, packs and walk_seconds, which is
+        None if the history cannot be walked
+    """
+    result = {}
+    for line in run_niced_git(path, ('count-objects', '-v')).splitlines():
+        key, _, value = line.partition(':')
+        if key == 'count':
+            result['loose_objects'] = int(value)
+        elif key == 'packs':
+            result['packs'] = int(value)
+    start = time.time()
+    try:
+        run_niced_git(path, ('rev-list', '--count', 'HEAD'))
+        result['walk_seconds'] = round(time.time() - start, 4)
+    except gitbackend.GitBackendError:
+        result['walk_seconds'] = None
+    return result
+
+
+class Budget(object):
+    """Limits the time the maintenance runs and the share of it used"""
+
+    def __init__(self, load=0.5, max_duration=None, clock=time.time,
+                 sleep=time.sleep):
+        """
+        :param load: fraction of the time spent maintaining, the rest of the
+            time is spent paused between repos
+        :param max_duration: seconds after which no more repos are started,
+            no limit if None
+        """
+        if not 0 < load <= 1:
+            raise ValueError("load must be within (0, 1], got {}"
+                             .format(load))
+        self.load = load
+        self.max_duration = max_duration
+        self._clock = clock
+        self._sleep = sleep
+        self._start = clock()
+
+    @property
+    def exhausted(self):
+        """Whether the time budget is spent"""
+        return (self.max_duration is not None and
+                self._clock() - self._start >= self.max_duration)
+
+    def spend(self, seconds):
+        """Pauses after working for seconds, to keep to the load"""
+        if self.load < 1:
+            self._sleep(seconds * (1 - self.load) / self.load)
+
+
+class Maintainer(object):
+    """Runs the maintenance tasks on the repos of a workspace"""
+
+    def __init__(self, tasks=None, interval=None, niceness=10, budget=None):
+        """
+        :param tasks: names of the TASKS to run, all by default
+        :param interval: seconds to wait before maintaining a repo again,
+            repos are always maintained if None
+        :param niceness: increment of the niceness of the git processes
+        :type budget: Budget
+        :raises InvalidMaintenance: if a task is unknown
+        """
+        tasks = list(TASKS) if tasks is None else list(tasks)
+        unknown = [task for task in tasks if task not in TASKS]
+        if unknown:
+            raise InvalidMaintenance(
+                "Unknown maintenance tasks {}, valid ones are: {}".format(
+                    ", ".join(unknown), ", ".join(TASKS)))
+        # always run in the order of TASKS
+        self.tasks = [task for task in TASKS if task in tasks]
+        self.interval = interval
+        self.niceness = niceness
+        self.budget = budget or Budget(load=1)
+
+    @staticmethod
+    def from_config(section):
+        """Builds the maintainer from the maintenance section of the config
+
+        :type section: hubsync.config.Config.Maintenance
+        :raises InvalidMaintenance: if a value cannot be parsed
+        """
+        try:
+            interval = (filters.parse_duration(section.interval)
+                        if section.interval else None)
+            max_duration = (filters.parse_duration(section.max_duration)
+                            if section.max_duration else None)
+            budget = Budget(float(section.load), max_duration)
+            niceness = int(section.niceness)
+        except (ValueError, filters.InvalidFilter) as err:
+            raise InvalidMaintenance(str(err))
+        return Maintainer(filters.split_list(section.tasks) or None,
+                          interval, niceness, budget)
+
+    def is_due(self, local_repo, now=None):
+        """Whether a repo was not maintained within the interval
+
+        :type local_repo: hubsync.workspace.Repo
+        """
+        if self.interval is None or local_repo.manifest is None:
+            return True
+        entry = local_repo.manifest.maintenance(local_repo.path)
+        now = time.time() if now is None else now
+        return not entry or now - entry['at'] >= self.interval
+
+    def maintain(self, org_name, local_repo, force=False):
+        """Runs the tasks in a repo and records the result in the manifest
+
+        :type local_repo: hubsync.workspace.Repo
+        :param force: maintain it even if it was maintained recently
+        :rtype: Maintenance
+        """
+        if not force and not self.is_due(local_repo):
+            return Maintenance(org_name, local_repo.name, local_repo.path,
+                               True, None, {}, None, None, None)
+        start = time.time()
+        tasks = {}
+        try:
+            before = measure(local_repo.path)
+            # git refuses to index or graph a repo without objects
+            empty = not before['loose_objects'] and not before['packs']
+            for task in [] if empty else self.tasks:
+                task_start = time.time()
+                LOG.debug("Running {} in {}".format(task, local_repo.path))
+                run_niced_git(local_repo.path, TASKS[task], self.niceness)
+                tasks[task] = round(time.time() - task_start, 4)
+            after = measure(local_repo.path)
+        except gitbackend.GitBackendError as err:
+            return Maintenance(org_name, local_repo.name, local_repo.path,
+                               False, time.time() - start, tasks, None, None,
+                               str(err))
+        duration = time.time() - start
+        if local_repo.manifest is not None:
+            local_repo.manifest.record_maintenance(
+                local_repo.path, at=start, duration=round(duration, 4),
+                tasks=tasks, before=before, after=after)
+        return Maintenance(org_name, local_repo.name, local_repo.path, False,
+                           duration, tasks, before, after, None)
+
+    def maintain_workspace(self, local_workspace, force=False):
+        """Maintains the repos of the workspace within the budget
+
+        :type local_workspace: hubsync.workspace.Workspace
+        :param force: maintain the repos maintained recently too
+        :return: list of Maintenance of the repos visited
+        """
+        results = []
+        for org in sorted(local_workspace.organizations,
+                          key=lambda org: org.name):
+            for local_repo in org.iter_repos():
+                if self.budget.exhausted:
+                    LOG.info("Maintenance time budget spent, the remaining "
+                             "repos will be maintained on the next run")
+                    local_workspace.save_manifest()
+                    return results
+                result = self.maintain(org.name, local_repo, force)
+                results.append(result)
+                if result.error:
+                    LOG.error("Failed to maintain {}/{}: {}".format(
+                        org.name, local_repo.name, result.error))
+                if result.duration:
+                    self.budget.spend(result.duration)
+        local_workspace.save_manifest()
+        return results
+
+
+def format_report(results):
+    """Formats a line per repo maintained with its before and after"""
+    lines = []
+    for result in results:
+        name = "{}/{}".format(result.org, result.name)
+        if result.skipped:
+            continue
+        if result.error:
+            lines.append("{}: error: {}".format(name, result.error))
+            continue
+        walk = ''
+        if (result.before['walk_seconds'] is not None and
+                result.after['walk_seconds'] is not None):
+            walk = ", history walk {:.3f}s -> {:.3f}s".format(
+                result.before['walk_seconds'], result.after['walk_seconds'])
+        lines.append(
+            "{}: {:.1f}s, loose objects {} -> {}, packs {} -> {}{}".format(
+                name, result.duration, result.before['loose_objects'],
+                result.after['loose_objects'], result.before['packs'],
+                result.after['packs'], walk))
+    skipped = len([result for result in results if result.skipped])
+    if skipped:
+        lines.append("{} repos skipped, maintained recently".format(skipped))
+    return "\n".join(lines)
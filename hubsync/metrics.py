@@ -0,0 +1,99 @@
+"""Counters and timings of a sync
+
+The sync records how many git operations it ran and how long they took, so
+changes in how git talks to the remotes can be measured run by run. The
+metrics are logged at the end of the sync and can be written as json.
+"""
+from contextlib import contextmanager
+import json
+import threading
+import time
+
+
+class Metrics(object):
+    """Counters, values and timings of a run
+
+    Safe to update from several threads.
+    """
+
+    def __init__(self, clock=time.time):
+        self.counters = {}
+        self.values = {}
+        self.timings = {}
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1):
+        """Adds value to a counter"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        """Sets a value, like a setting the run used"""
+        with self._lock:
+            self.values[name] = value
+
+    def record(self, name, seconds):
+        """Adds the duration of an operation to a timing"""
+        with self._lock:
+            count, total, longest = self.timings.get(name, (0, 0.0, 0.0))
+            self.timings[name] = (count + 1, total + seconds,
+                                  max(longest, seconds))
+
+    @contextmanager
+    def timer(self, name):
+        """Context manager recording the time its body takes"""
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.record(name, self._clock() - start)
+
+    def merge(self, other):
+        """Adds the counters and timings of other metrics, and its values
+
+        :type other: Metrics
+        """
+        with other._lock:
+            counters = dict(other.counters)
+            values = dict(other.values)
+            timings = dict(other.timings)
+        with self._lock:
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            self.values.update(values)
+            for name, (count, total, longest) in timings.items():
+                old_count, old_total, old_longest = self.timings.get(
+                    name, (0, 0.0, 0.0))
+                self.timings[name] = (old_count + count, old_total + total,
+                                      max(old_longest, longest))
+
+    def as_dict(self):
+        """Json serializable copy of the metrics"""
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'values': dict(self.values),
+                'timings': dict(
+                    (name, {'count': count, 'total': round(total, 4),
+                            'max': round(longest, 4),
+                            'mean': round(total / count, 4)})
+                    for name, (count, total, longest)
+                    in self.timings.items()),
+            }
+
+    def save(self, path):
+        """Writes the metrics as json"""
+        with open(path, 'w') as metrics_file:
+            json.dump(self.as_dict(), metrics_file, indent=1, sort_keys=True)
+
+    def format_summary(self):
+        """One line per timing and the counters and values"""
+        data = self.as_dict()
+        lines = ["{}: {} in {:.2f}s (mean {:.3f}s, max {:.3f}s)".format(
+            name, timing['count'], timing['total'], timing['mean'],
+            timing['max'])
+            for name, timing in sorted(data['timings'].items())]
+        lines += ["{}: {}".format(name, value) for name, value
+                  in sorted(dict(data['counters'], **data['values']).items())]
+        return "\n".join(lines)
@@ -0,0 +1,202 @@
+"""Bare mirrors of the github repos shared by a team
+
+"hubsync mirror" keeps a bare mirror of each selected repo in a folder, like
+a shared disk or a folder served in the LAN, at <owner>/<name>.git. Syncs
+configured with the mirror clone and fetch from it instead of github, while
+pushes still go to github.
+
+Each mirror stores the github push time it was updated to. A sync falls back
+to github for the repos whose mirror is missing, was not updated since the
+last push to github or is older than the max age configured.
+"""
+from concurrent import futures
+import collections
+import json
+import logging
+import os
+import shutil
+import time
+
+from . import filters, gitbackend, watchdog
+
+
+LOG = logging.getLogger('hubsync.mirror')
+
+STATE_FILE = 'hubsync-mirror.json'
+DEFAULT_WORKERS = 4
+
+MirrorResult = collections.namedtuple('MirrorResult',
+                                      'full_name cloned error')
+
+
+class InvalidMirror(ValueError):
+    """Raised when the mirror config cannot be parsed"""
+
+
+class Mirror(object):
+    """Folder with the bare mirrors of the repos"""
+
+    def __init__(self, path, url=None, max_age=None):
+        """
+        :param path: folder of the mirrors, where their state is read from
+        :param url: base url git reaches the mirrors through, path if None
+        :param max_age: seconds after which a mirror is stale even if github
+            shows no push since it was updated, no limit if None
+        """
+        self.path = path
+        self.url = url
+        self.max_age = max_age
+
+    @staticmethod
+    def from_config(section):
+        """Builds the mirror from the mirror section of the config, None if
+        there is no mirror configured
+
+        :type section: hubsync.config.Config.Mirror
+        :raises InvalidMirror: if a value cannot be parsed
+        """
+        if not section.path:
+            return None
+        try:
+            max_age = (filters.parse_duration(section.max_age)
+                       if section.max_age else None)
+        except filters.InvalidFilter as err:
+            raise InvalidMirror(str(err))
+        return Mirror(os.path.expanduser(section.path), section.url or None,
+                      max_age)
+
+    def repo_path(self, github_repo):
+        """Folder of the mirror of a repo
+
+        :type github_repo: hubsync.github.Repo
+        """
+        return os.path.join(self.path, github_repo.user,
+                            github_repo.name + '.git')
+
+    def repo_url(self, github_repo):
+        """Url git clones and fetches the mirror of a repo from"""
+        if self.url is None:
+            return self.repo_path(github_repo)
+        return "{}/{}/{}.git".format(self.url.rstrip('/'), github_repo.user,
+                                     github_repo.name)
+
+    def state(self, github_repo):
+        """State recorded by the last update of a mirror, None if missing"""
+        try:
+            with open(os.path.join(self.repo_path(github_repo),
+                                   STATE_FILE)) as state_file:
+                return json.load(state_file)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def is_fresh(self, github_repo, now=None):
+        """Whether the mirror of a repo has all that was pushed to github"""
+        state = self.state(github_repo)
+        if state is None:
+            return False
+        if (github_repo.pushed_at and
+                (state.get('pushed_at') or '') < github_repo.pushed_at):
+            return False
+        now = time.time() if now is None else now
+        return (self.max_age is None or
+                now - state['updated_at'] <= self.max_age)
+
+    def update(self, github_repo, timeout=None):
+        """Clones or fetches the mirror of a repo from github
+
+        :param timeout: seconds git may take, no limit if None
+        :return: whether the mirror was cloned
+        :raises GitBackendError: if git fails or times out
+        """
+        path = self.repo_path(github_repo)
+        # the push time is read before fetching, so the mirror has at least
+        # what was pushed until then
+        state = {'full_name': github_repo.full_name,
+                 'pushed_at': github_repo.pushed_at,
+                 'updated_at': time.time()}
+        cloned = not os.path.exists(path)
+        if cloned:
+            # cloned aside so syncs never see a partial mirror
+            tmp_path = path + '.tmp'
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            gitbackend.run_git(None, 'clone', '-q', '--mirror',
+                               github_repo.url, tmp_path, timeout=timeout)
+            os.rename(tmp_path, path)
+        else:
+            gitbackend.run_git(path, 'fetch', '-q', '--prune', 'origin',
+                               timeout=timeout)
+        tmp_state = os.path.join(path, STATE_FILE + '.tmp')
+        with open(tmp_state, 'w') as state_file:
+            json.dump(state, state_file)
+        os.rename(tmp_state, os.path.join(path, STATE_FILE))
+        return cloned
+
+
+def selected_repos(api, config):
+    """Github repos selected by the filters of the config
+
+    :type api: hubsync.github.Api
+    :type config: hubsync.config.Config
+    :raises InvalidFilter: if the filters cannot be parsed
+    """
+    selector = filters.Selector.from_config(config)
+    owners = api.organizations
+    if config.glob.sync_user:
+        owners.append(api.user)
+    for owner in owners:
+        if not selector.selects_org(owner.name):
+            continue
+        repo_filter = selector.repo_filter(owner.name)
+        for github_repo in owner.iter_repos():
+            if repo_filter.selects(github_repo):
+                yield github_repo
+
+
+def update_mirrors(mirror, github_repos, workers=DEFAULT_WORKERS,
+                   limits=None, timeout=None, retries=0):
+    """Updates the mirrors of the repos, skipping the fresh ones
+
+    :type mirror: Mirror
+    :param workers: max number of mirrors updated at the same time
+    :param limits: adaptive limit of the updates run at the same time
+        against each git host, within workers. No limit if None
+    :type limits: hubsync.concurrency.AdaptiveLimits
+    :param timeout: seconds git may take for a mirror, no limit if None
+    :param retries: times an update that timed out is tried again
+    :return: list of MirrorResult of the mirrors updated
+    """
+    def update_mirror(github_repo):
+        if limits is None:
+            return mirror.update(github_repo, timeout)
+        # new mirrors take as long as the repo is big, not as the load
+        with limits.operation(github_repo.url,
+                              os.path.exists(mirror.repo_path(github_repo))):
+            return mirror.update(github_repo, timeout)
+
+    def update_retrying(github_repo):
+        return watchdog.retry(
+            lambda: update_mirror(github_repo), gitbackend.GitTimeout,
+            retries, description="Update of the mirror of {}".format(
+                github_repo.full_name))
+
+    def update(github_repo):
+        LOG.info("Updating mirror of {}".format(github_repo.full_name))
+        try:
+            return MirrorResult(github_repo.full_name,
+                                update_retrying(github_repo), None)
+        except (gitbackend.GitBackendError, OSError) as err:
+            LOG.error("Failed to update mirror of {}: {}".format(
+                github_repo.full_name, err))
+            return MirrorResult(github_repo.full_name, False, str(err))
+
+    stale = []
+    for github_repo in github_repos:
+        if mirror.is_fresh(github_repo):
+            LOG.debug("Mirror of {} is up to date".format(
+                github_repo.full_name))
+        else:
+            stale.append(github_repo)
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(update, stale))
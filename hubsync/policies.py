@@ -0,0 +1,170 @@
+"""How each org and repo is synced
+
+The org and repo sections of the config apply to all orgs and repos. The
+sections org:PATTERN and repo:PATTERN override them for the orgs and repos
+whose name matches the pattern, so big or inactive repos can be synced
+differently than the rest. A repo policy sets:
+
+- mode: "full" pulls the checked out branch and removes the merged local
+  branches, "fetch-only" only fetches the remotes, so the local branches are
+  left untouched, and "skip" leaves the repo alone, it is neither cloned,
+  synced nor removed
+- clone: how new repos are cloned. "full", "shallow" with the last commit
+  only, "blobless" without the file contents, which are downloaded when
+  checked out, or "treeless" without the trees either
+- interval: how often the repo is synced, like 1h for active repos or 1w for
+  the rest. Syncs within the interval of the last one skip it, which needs
+  the workspace manifest
+- pre and post: commands run before and after syncing it
+
+Patterns follow hubsync.filters: globs, or regular expressions when prefixed
+with "re:". Repo patterns containing a "/" are matched against "org/name" and
+the rest against the name of the repo. When several sections match, they are
+applied in the order they appear in the config, so the later ones override
+the options they set.
+"""
+import collections
+import logging
+import time
+
+from . import filters
+
+
+LOG = logging.getLogger('hubsync.policies')
+
+FULL = 'full'
+FETCH_ONLY = 'fetch-only'
+SKIP = 'skip'
+MODES = (FULL, FETCH_ONLY, SKIP)
+
+# clone strategy: extra arguments of git clone
+CLONE_OPTIONS = collections.OrderedDict([
+    ('full', ()),
+    ('shallow', ('--depth', '1')),
+    ('blobless', ('--filter=blob:none',)),
+    ('treeless', ('--filter=tree:0',)),
+])
+
+
+class InvalidSyncPolicy(ValueError):
+    """Raised when an org or repo section of the config cannot be parsed"""
+
+
+class RepoPolicy(object):
+    """How a repo is synced"""
+
+    def __init__(self, mode=FULL, clone='full', interval=None, pre="",
+                 post=""):
+        """
+        :param mode: one of MODES
+        :param clone: one of the CLONE_OPTIONS
+        :param interval: seconds to wait before syncing the repo again,
+            synced in every sync if None
+        :param pre: shell command run before syncing the repo
+        :param post: shell command run after syncing the repo
+        :raises InvalidSyncPolicy: if the mode or clone are unknown
+        """
+        if mode not in MODES:
+            raise InvalidSyncPolicy("Unknown mode {}, valid ones are: {}"
+                                    .format(mode, ", ".join(MODES)))
+        if clone not in CLONE_OPTIONS:
+            raise InvalidSyncPolicy(
+                "Unknown clone {}, valid ones are: {}".format(
+                    clone, ", ".join(CLONE_OPTIONS)))
+        self.mode = mode
+        self.clone = clone
+        self.interval = interval
+        self.pre = pre
+        self.post = post
+
+    @staticmethod
+    def from_config(section):
+        """Builds the policy from a repo section of the config
+
+        :type section: hubsync.config.Config.Repository
+        :raises InvalidSyncPolicy: if a value cannot be parsed
+        """
+        try:
+            interval = (filters.parse_duration(section.interval)
+                        if section.interval else None)
+        except filters.InvalidFilter as err:
+            raise InvalidSyncPolicy(str(err))
+        return RepoPolicy(section.mode or FULL, section.clone or 'full',
+                          interval, section.pre or "", section.post or "")
+
+    @property
+    def clone_options(self):
+        """Extra arguments of git clone"""
+        return CLONE_OPTIONS[self.clone]
+
+    def is_due(self, entry, now=None):
+        """Whether the repo was not synced within the interval
+
+        :param entry: manifest entry of the repo, None if there is none
+        """
+        if self.interval is None or not entry or 'synced_at' not in entry:
+            return True
+        now = time.time() if now is None else now
+        return now - entry['synced_at'] >= self.interval
+
+
+class Policies(object):
+    """Org and repo sections of the config matching each org and repo"""
+
+    def __init__(self, config):
+        """
+        :type config: hubsync.config.Config
+        :raises InvalidSyncPolicy: if a pattern or value cannot be parsed
+        """
+        self.config = config
+        case_sensitive = config.glob.case_sensitive
+        try:
+            self.org_sections = [
+                (filters.compile_pattern(pattern, case_sensitive), values)
+                for pattern, values in config.org_sections]
+            self.repo_sections = [
+                ('/' in pattern,
+                 filters.compile_pattern(pattern, case_sensitive), values)
+                for pattern, values in config.repo_sections]
+        except filters.InvalidFilter as err:
+            raise InvalidSyncPolicy(str(err))
+        self.default = RepoPolicy.from_config(config.repo)
+        # options given in a section are checked even if no repo matches it
+        for _, _, values in self.repo_sections:
+            RepoPolicy.from_config(config.repo_section(values))
+
+    @staticmethod
+    def from_config(config):
+        """Builds the policies from the org and repo sections of the config
+
+        :type config: hubsync.config.Config
+        :raises InvalidSyncPolicy: if a pattern or value cannot be parsed
+        """
+        return Policies(config)
+
+    def org(self, org_name):
+        """Config of an org, with the sections matching its name applied
+
+        :rtype: hubsync.config.Config.Organization
+        """
+        values = {}
+        for regex, section_values in self.org_sections:
+            if regex.match(org_name):
+                values.update(section_values)
+        if not values:
+            return self.config.org
+        return self.config.org_section(values)
+
+    def repo(self, org_name, repo_name):
+        """Policy of a repo, with the sections matching its name applied
+
+        :rtype: RepoPolicy
+        """
+        values = {}
+        full_name = "{}/{}".format(org_name, repo_name)
+        for with_owner, regex, section_values in self.repo_sections:
+            if regex.match(full_name if with_owner else repo_name):
+                values.update(section_values)
+        if not values:
+            return self.default
+        return RepoPolicy.from_config(self.config.repo_section(values))
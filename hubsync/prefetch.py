@@ -0,0 +1,176 @@
+"""Listing of the github orgs ahead of the sync
+
+The repos of an org are listed a page at a time as the sync goes through
+them, so the sync waits for github at each page and github is idle while
+the sync runs git. The Prefetcher lists the repos of the orgs to sync in a
+background thread instead, in the order they are synced, going on with the
+next orgs while the repos of the current one are synced. It stops once it is
+a number of repos ahead of the sync, so at most that many are held at a
+time however big the orgs are.
+"""
+import logging
+import sys
+import threading
+import time
+
+import six
+from six.moves import queue
+
+from . import github
+
+
+LOG = logging.getLogger('hubsync.prefetch')
+
+DEFAULT_LOOKAHEAD = 500
+
+# marks the end of the listing of an org
+_END = object()
+
+
+class PrefetchError(github.GithubError):
+    """Raised when the repos of an org will not come from the prefetcher"""
+
+
+class _Failure(object):
+    """Error listing an org, raised by the sync when it reaches it"""
+
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+
+class PrefetchedOrg(object):
+    """Github org whose repos are read from the prefetcher"""
+
+    def __init__(self, prefetcher, github_org):
+        """
+        :type prefetcher: Prefetcher
+        :type github_org: hubsync.github.Organization
+        """
+        self.prefetcher = prefetcher
+        self.github_org = github_org
+        self.name = github_org.name
+
+    def iter_repos(self):
+        """Yields the repos of the org as they are listed"""
+        return self.prefetcher.iter_repos(self.github_org)
+
+    def __repr__(self):
+        return "<{0.__class__.__name__} {0.name}>".format(self)
+
+
+class Prefetcher(object):
+    """Lists the repos of the orgs to sync in a background thread"""
+
+    def __init__(self, github_orgs, lookahead=DEFAULT_LOOKAHEAD,
+                 metrics=None):
+        """
+        :param github_orgs: orgs to list, in the order they are synced
+        :type github_orgs: list of hubsync.github.Organization
+        :param lookahead: max number of repos listed ahead of the sync
+        :param metrics: metrics to record the time the sync waits for the
+            listings in, as github.list.wait
+        :type metrics: hubsync.metrics.Metrics
+        """
+        self.github_orgs = list(github_orgs)
+        self.metrics = metrics
+        self._queue = queue.Queue(maxsize=max(lookahead, 1))
+        self._closed = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts listing the orgs in the background"""
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def _put(self, item):
+        """Queues an item, waiting for room unless the prefetcher is closed
+
+        :return: whether the item was queued
+        """
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        for github_org in self.github_orgs:
+            LOG.debug("Listing the repos of {}".format(github_org.name))
+            try:
+                for github_repo in github_org.iter_repos():
+                    if not self._put((github_org, github_repo)):
+                        return
+            except Exception:  # pylint: disable=broad-except
+                # raised by the sync when it gets to the org
+                self._put((github_org, _Failure(sys.exc_info())))
+            if not self._put((github_org, _END)):
+                return
+
+    def org(self, github_org):
+        """Org whose repos are read from the prefetcher
+
+        :type github_org: hubsync.github.Organization
+        :rtype: PrefetchedOrg
+        """
+        return PrefetchedOrg(self, github_org)
+
+    def iter_repos(self, github_org):
+        """Yields the repos of an org as they are listed
+
+        The orgs are listed in order, so the repos of the orgs before it that
+        the sync did not read are dropped.
+
+        :raises PrefetchError: if the org is not listed by the prefetcher,
+            or the listing stopped before it
+        :raises: the error listing the org, if any
+        """
+        if github_org not in self.github_orgs:
+            raise PrefetchError("{} is not listed by the prefetcher"
+                                .format(github_org.name))
+        waited = 0.0
+        try:
+            while True:
+                start = time.time()
+                owner, item = self._get(github_org)
+                waited += time.time() - start
+                if owner is not github_org:
+                    continue
+                if item is _END:
+                    return
+                if isinstance(item, _Failure):
+                    six.reraise(*item.exc_info)
+                yield item
+        finally:
+            if self.metrics is not None:
+                self.metrics.record('github.list.wait', waited)
+
+    def _get(self, github_org):
+        """Next item listed, waiting for it while the listing goes on
+
+        :raises PrefetchError: if the listing stopped
+        """
+        while True:
+            try:
+                return self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+            if self._closed.is_set():
+                raise PrefetchError("The prefetcher was closed before "
+                                    "listing {}".format(github_org.name))
+            if self._thread is None or not self._thread.is_alive():
+                # the last items may be queued just before it stops
+                try:
+                    return self._queue.get_nowait()
+                except queue.Empty:
+                    raise PrefetchError("The listing stopped before {}"
+                                        .format(github_org.name))
+
+    def close(self):
+        """Stops the listing, the repos listed and not read are dropped"""
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,149 @@
+"""Branches fetched from the remotes of each repo
+
+By default remotes fetch every branch, which in big repos means thousands of
+branches nobody uses locally that make every fetch negotiate and transfer
+more. A fetch policy narrows the refspecs of the remotes to:
+
+- all: every branch, the git default
+- default-branch-only: only the default branch of the repo
+- a list of globs: the default branch and the branches matching them. Git
+  refspecs only support a single "*", which also matches "/"
+
+With prune, remote-tracking branches the policy does not cover anymore are
+removed, and fetches prune the branches deleted in the remote. It is off by
+default, like in git.
+
+The fetch:PATTERN sections apply to the repos of the orgs whose name matches
+the pattern, or to the repos whose "org/name" matches it if it contains a
+"/". When several match a repo they are applied in the order they appear in
+the config, the later ones overriding the options they set, like the
+repo:PATTERN sections of hubsync.policies.
+"""
+import fnmatch
+import logging
+
+from . import filters
+
+
+LOG = logging.getLogger('hubsync.refspecs')
+
+ALL = 'all'
+DEFAULT_BRANCH_ONLY = 'default-branch-only'
+
+
+class InvalidPolicy(ValueError):
+    """Raised when a fetch policy in the config cannot be parsed"""
+
+
+class FetchPolicy(object):
+    """Branches fetched from each remote of a repo"""
+
+    def __init__(self, branches=ALL, prune=False):
+        """
+        :param branches: ALL, DEFAULT_BRANCH_ONLY or a list of globs
+        :param prune: whether to remove the remote-tracking branches deleted
+            in the remote or not covered by the policy
+        """
+        if branches not in (ALL, DEFAULT_BRANCH_ONLY):
+            for pattern in branches:
+                if pattern.count('*') > 1 or set('?[]') & set(pattern):
+                    raise InvalidPolicy(
+                        "Invalid branch pattern {}, git only supports a "
+                        "single * in refspecs".format(pattern))
+            branches = list(branches)
+        self.branches = branches
+        self.prune = prune
+
+    @staticmethod
+    def from_config(section):
+        """Builds the policy from a fetch section of the config
+
+        :type section: hubsync.config.Config.Fetch
+        :raises InvalidPolicy: if the branches cannot be parsed
+        """
+        branches = section.branches or ALL
+        if branches not in (ALL, DEFAULT_BRANCH_ONLY):
+            branches = filters.split_list(branches)
+        return FetchPolicy(branches, bool(section.prune))
+
+    @property
+    def narrow(self):
+        """Whether only some of the branches are fetched"""
+        return self.branches != ALL
+
+    def refspecs(self, remote, default_branch):
+        """Fetch refspecs of a remote
+
+        :return: list of refspecs, the default branch first
+        """
+        if not self.narrow:
+            return ['+refs/heads/*:refs/remotes/{}/*'.format(remote)]
+        patterns = [default_branch]
+        if self.branches != DEFAULT_BRANCH_ONLY:
+            patterns += [pattern for pattern in self.branches
+                         if pattern != default_branch]
+        return ['+refs/heads/{1}:refs/remotes/{0}/{1}'.format(remote, pattern)
+                for pattern in patterns]
+
+    def covers(self, branch, default_branch):
+        """Whether a branch of the remote is fetched"""
+        if not self.narrow or branch == default_branch:
+            return True
+        if self.branches == DEFAULT_BRANCH_ONLY:
+            return False
+        return any(fnmatch.fnmatchcase(branch, pattern)
+                   for pattern in self.branches)
+
+
+class FetchPolicies(object):
+    """Fetch policy of each repo, by org and repo name"""
+
+    def __init__(self, default=None, sections=None, case_sensitive=True,
+                 section_policy=None):
+        """
+        :type default: FetchPolicy
+        :param sections: list of (pattern, options set) of the fetch:PATTERN
+            sections, in the order of the config
+        :param section_policy: function building the FetchPolicy of the
+            options set by the sections matching a repo
+        :raises InvalidPolicy: if a pattern cannot be parsed
+        """
+        self.default = default or FetchPolicy()
+        try:
+            self.sections = [
+                ('/' in pattern,
+                 filters.compile_pattern(pattern, case_sensitive), values)
+                for pattern, values in (sections or [])]
+        except filters.InvalidFilter as err:
+            raise InvalidPolicy(str(err))
+        self.section_policy = section_policy
+
+    @staticmethod
+    def from_config(config):
+        """Builds the policies from the fetch sections of the config
+
+        :type config: hubsync.config.Config
+        :raises InvalidPolicy: if a pattern or policy cannot be parsed
+        """
+        def section_policy(values):
+            return FetchPolicy.from_config(config.fetch_section(values))
+        # options given in a section are checked even if no repo matches it
+        for _, values in config.fetch_policies:
+            section_policy(values)
+        return FetchPolicies(FetchPolicy.from_config(config.fetch),
+                             config.fetch_policies,
+                             config.glob.case_sensitive, section_policy)
+
+    def policy(self, org_name, repo_name):
+        """Policy of a repo, with the sections matching it applied
+
+        :rtype: FetchPolicy
+        """
+        values = {}
+        full_name = "{}/{}".format(org_name, repo_name)
+        for with_repo, regex, section_values in self.sections:
+            if regex.match(full_name if with_repo else org_name):
+                values.update(section_values)
+        if not values:
+            return self.default
+        return self.section_policy(values)
@@ -0,0 +1,131 @@
+"""Removal of the local folders no longer in github
+
+The orgs and repos found locally but not in github are not removed while
+the sync goes on, they are collected and reviewed together at the end of the
+sync, so it never stops waiting for an answer. The folders confirmed are
+moved into the trash folder of the workspace, which is a rename within the
+same disk, and deleted from there in the background. Folders left in the
+trash by a sync that was killed while deleting them are deleted by the next
+one.
+"""
+import collections
+from concurrent import futures
+import logging
+import os
+import shutil
+import threading
+import time
+
+
+LOG = logging.getLogger('hubsync.removals')
+
+Removal = collections.namedtuple('Removal', 'path manifest')
+
+
+class Trash(object):
+    """Folder the removed folders are moved into and deleted from"""
+
+    def __init__(self, path=None):
+        """
+        :param path: trash folder, within the workspace. The folders are
+            deleted where they are if None
+        """
+        self.path = path
+        self._executor = None
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def _delete(self, path):
+        """Deletes a folder in the background"""
+        with self._lock:
+            if self._executor is None:
+                # a single thread, deleting competes for the disk with git
+                self._executor = futures.ThreadPoolExecutor(max_workers=1)
+            self._pending.append(self._executor.submit(
+                shutil.rmtree, path, True))
+
+    def empty(self):
+        """Deletes in the background the folders left in the trash"""
+        if self.path is None or not os.path.isdir(self.path):
+            return
+        for name in os.listdir(self.path):
+            LOG.info("Deleting {} left in the trash".format(name))
+            self._delete(os.path.join(self.path, name))
+
+    def discard(self, folder):
+        """Moves a folder into the trash and deletes it in the background
+
+        :raises OSError: if the folder cannot be moved
+        """
+        if self.path is None:
+            self._delete(folder)
+            return
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        # unique, a folder of the same name may be in the trash already
+        target = os.path.join(self.path, "{}-{}".format(
+            os.path.basename(os.path.normpath(folder)),
+            int(time.time() * 1000000)))
+        os.rename(folder, target)
+        self._delete(target)
+
+    @property
+    def deleting(self):
+        """Whether folders are still being deleted"""
+        with self._lock:
+            return any(not future.done() for future in self._pending)
+
+    def wait(self):
+        """Waits for the folders being deleted and stops the thread
+        deleting them"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            executor, self._executor = self._executor, None
+        futures.wait(pending)
+        if executor is not None:
+            executor.shutdown()
+
+
+class Removals(object):
+    """Local folders to remove, reviewed at the end of the sync"""
+
+    def __init__(self):
+        self.pending = []
+
+    def add(self, folder, manifest=None):
+        """Records a folder to review
+
+        :param manifest: manifest of the workspace, to forget the folder
+        :type manifest: hubsync.workspace.Manifest
+        """
+        self.pending.append(Removal(folder, manifest))
+
+    def review(self, confirm, trash):
+        """Removes the folders confirmed
+
+        :param confirm: function receiving the list of folders to remove and
+            returning those confirmed, like a prompt to the user
+        :param trash: trash the folders confirmed are discarded into
+        :type trash: Trash
+        :return: list of the folders removed
+        """
+        # moved repos are adopted after being found missing in their org
+        pending = [removal for removal in self.pending
+                   if os.path.isdir(removal.path)]
+        self.pending = []
+        if not pending:
+            return []
+        confirmed = set(confirm([removal.path for removal in pending]))
+        removed = []
+        for removal in pending:
+            if removal.path not in confirmed:
+                continue
+            try:
+                trash.discard(removal.path)
+            except OSError as err:
+                LOG.error("Failed to remove {}: {}".format(removal.path, err))
+                continue
+            if removal.manifest is not None:
+                removal.manifest.forget(removal.path)
+            removed.append(removal.path)
+        return removed
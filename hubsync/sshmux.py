@@ -0,0 +1,158 @@
+"""Reuse of the ssh connections git opens during a run
+
+Each clone, pull and fetch over ssh does a full ssh handshake. ControlMaster
+makes git run ssh with a control master per host for the whole run, so only
+the first operation against a host pays for the handshake and the rest go
+through its connection. The control sockets live in a private folder created
+for the run, and the masters are closed and the folder removed at the end.
+A thread watches the folder to count the masters started, including the ones
+started again after ControlPersist closed them. It is approximate, a master
+open for less than POLL_INTERVAL can be missed.
+
+git is pointed to the masters through GIT_SSH_COMMAND, extending the ssh
+command the user configured, if any. Nothing is done where ssh has no control
+masters or if the user set GIT_SSH, which cannot take ssh options.
+"""
+import atexit
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from six.moves import shlex_quote
+
+
+LOG = logging.getLogger('hubsync.sshmux')
+
+SSH_COMMAND_ENV = 'GIT_SSH_COMMAND'
+# seconds between the looks at the control sockets
+POLL_INTERVAL = 0.5
+
+
+def configured_ssh_command():
+    """ssh command set in the git config, None if there is none"""
+    try:
+        with open(os.devnull, 'w') as devnull:
+            output = subprocess.check_output(
+                ('git', 'config', '--get', 'core.sshCommand'), stderr=devnull)
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    return output.decode('utf-8').strip() or None
+
+
+class ControlMaster(object):
+    """Makes the git processes started within it share ssh connections
+
+    Use it as a context manager around the run.
+    """
+
+    def __init__(self, persist=60, metrics=None,
+                 poll_interval=POLL_INTERVAL):
+        """
+        :param persist: seconds an idle master is kept open
+        :param metrics: metrics of the run, to record how many masters, that
+            is ssh handshakes, the run needed
+        :type metrics: hubsync.metrics.Metrics
+        :param poll_interval: seconds between the looks at the control
+            sockets to count the masters
+        """
+        self.persist = persist
+        self.metrics = metrics
+        self.poll_interval = poll_interval
+        self.path = None
+        self._saved_command = None
+        # (name, inode, change time) of the control sockets seen, a master
+        # started again for the same host creates a new socket
+        self._sockets = set()
+        self._stopped = threading.Event()
+        self._watcher = None
+
+    @property
+    def active(self):
+        """Whether git is using the control masters"""
+        return self.path is not None
+
+    def ssh_command(self, base):
+        """ssh command using the control masters, given the user one"""
+        return "{} -o ControlMaster=auto -o ControlPath={} " \
+               "-o ControlPersist={}".format(
+                   base, shlex_quote(os.path.join(self.path, '%C')),
+                   self.persist)
+
+    def start(self):
+        """Points git to the control masters"""
+        if os.name != 'posix' or os.environ.get('GIT_SSH'):
+            LOG.debug("Not multiplexing ssh connections")
+            return
+        # sockets paths are limited to around 100 characters
+        self.path = tempfile.mkdtemp(
+            prefix='hubsync-ssh-',
+            dir='/tmp' if os.path.isdir('/tmp') else None)
+        self._saved_command = os.environ.get(SSH_COMMAND_ENV)
+        base = self._saved_command or configured_ssh_command() or 'ssh'
+        os.environ[SSH_COMMAND_ENV] = self.ssh_command(base)
+        atexit.register(self.stop)
+        self._stopped.clear()
+        self._watcher = threading.Thread(target=self._watch)
+        self._watcher.daemon = True
+        self._watcher.start()
+        LOG.debug("Multiplexing ssh connections through {}".format(self.path))
+
+    def _look(self):
+        """Records the control sockets in the folder"""
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return
+        for name in names:
+            try:
+                info = os.lstat(os.path.join(self.path, name))
+            except OSError:
+                # closed since listed
+                continue
+            self._sockets.add((name, info.st_ino, info.st_ctime))
+
+    def _watch(self):
+        while not self._stopped.wait(self.poll_interval):
+            self._look()
+
+    def stop(self):
+        """Closes the masters and restores the ssh command of git"""
+        if not self.active:
+            return
+        self._stopped.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+        self._look()
+        if self._saved_command is None:
+            os.environ.pop(SSH_COMMAND_ENV, None)
+        else:
+            os.environ[SSH_COMMAND_ENV] = self._saved_command
+        sockets = os.listdir(self.path)
+        with open(os.devnull, 'w') as devnull:
+            for socket in sockets:
+                # the host is ignored as the control path has no tokens
+                try:
+                    subprocess.call(
+                        ('ssh', '-O', 'exit', '-o', 'ControlPath={}'.format(
+                            os.path.join(self.path, socket)), 'hubsync'),
+                        stdout=devnull, stderr=devnull)
+                except OSError as err:
+                    LOG.warning("Failed to close ssh master {}: {}".format(
+                        socket, err))
+        if self.metrics is not None:
+            self.metrics.increment('ssh.masters', len(self._sockets))
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.path = None
+
+    def __enter__(self):
+        self.start()
+        if self.metrics is not None:
+            self.metrics.set('ssh.multiplexing', self.active)
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
@@ -0,0 +1,143 @@
+"""Offline report of the state of the repos within the workspace
+
+Only the local repositories are read, nothing is requested to github nor to
+the remotes, so remote branches are as of the last fetch. Repos are read
+concurrently as most of the time is spent waiting for git.
+"""
+import collections
+from concurrent import futures
+import json
+import logging
+
+from . import gitbackend, workspace
+
+
+LOG = logging.getLogger('hubsync.status')
+
+DEFAULT_WORKERS = 8
+NO_VALUE = '-'
+
+
+class RepoStatus(collections.namedtuple(
+        'RepoStatus', 'org name path branch dirty ahead behind stale error')):
+    """State of a local repo
+
+    :param branch: checked out branch, None if HEAD is detached
+    :param dirty: whether there are uncommitted changes or untracked files
+    :param ahead: commits of branch not in its upstream, None without one
+    :param behind: commits of the upstream not in branch, None without one
+    :param stale: branches merged into the default branch of origin or whose
+        upstream was deleted
+    :param error: why the repo could not be read, None if it could
+    """
+    __slots__ = ()
+
+    @property
+    def changed(self):
+        """Whether the repo needs attention"""
+        return bool(self.error or self.dirty or self.ahead or self.behind or
+                    self.stale)
+
+
+def stale_branches(repo, tracking, current, default_upstream):
+    """Branches that can be deleted, besides the checked out one
+
+    :param tracking: upstream of each branch, see tracking_branches
+    :param default_upstream: remote branch merged branches are compared to
+    """
+    has_default = repo.rev_parse(default_upstream) is not None
+    result = []
+    for branch, upstream in sorted(tracking.items()):
+        if branch == current:
+            continue
+        if upstream is not None and repo.rev_parse(upstream) is None:
+            result.append(branch)
+            continue
+        if not has_default:
+            continue
+        try:
+            ahead, behind = repo.ahead_behind(branch, default_upstream)
+        except gitbackend.GitBackendError as err:
+            LOG.debug("Failed to compare branch {}, {}".format(branch, err))
+            continue
+        if not ahead and behind:
+            result.append(branch)
+    return result
+
+
+def repo_status(org_name, local_repo):
+    """Reads the state of a repo, closing it afterwards
+
+    :type local_repo: hubsync.workspace.Repo
+    :rtype: RepoStatus
+    """
+    default_upstream = 'origin/HEAD'
+    if local_repo.manifest is not None:
+        entry = local_repo.manifest.repo(local_repo.path)
+        if entry and entry.get('default_branch'):
+            default_upstream = 'origin/{}'.format(entry['default_branch'])
+    try:
+        repo = local_repo.git
+        branch = repo.active_branch()
+        tracking = repo.tracking_branches()
+        ahead = behind = None
+        if tracking.get(branch):
+            try:
+                ahead, behind = repo.ahead_behind(branch, tracking[branch])
+            except gitbackend.GitBackendError as err:
+                LOG.debug("Failed to compare {} with its upstream, {}"
+                          .format(local_repo.name, err))
+        return RepoStatus(
+            org_name, local_repo.name, local_repo.path, branch,
+            repo.is_dirty(), ahead, behind,
+            stale_branches(repo, tracking, branch, default_upstream), None)
+    except (workspace.InvalidPath, gitbackend.GitBackendError) as err:
+        return RepoStatus(org_name, local_repo.name, local_repo.path, None,
+                          False, None, None, [], str(err))
+    finally:
+        local_repo.close()
+
+
+def workspace_status(local_workspace, workers=DEFAULT_WORKERS):
+    """Reads the state of all repos within the workspace
+
+    :type local_workspace: hubsync.workspace.Workspace
+    :param workers: number of repos read at the same time
+    :return: list of RepoStatus sorted by org and repo
+    """
+    repos = [(org.name, repo)
+             for org in sorted(local_workspace.organizations,
+                               key=lambda org: org.name)
+             for repo in org.iter_repos()]
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda item: repo_status(*item), repos))
+
+
+def format_table(statuses):
+    """Formats the statuses as a table with a row per repo"""
+    rows = [('REPO', 'BRANCH', 'DIRTY', 'AHEAD', 'BEHIND', 'STALE')]
+    for status in statuses:
+        if status.error:
+            rows.append(("{}/{}".format(status.org, status.name),
+                         NO_VALUE, NO_VALUE, NO_VALUE, NO_VALUE,
+                         "error: {}".format(status.error)))
+            continue
+        rows.append((
+            "{}/{}".format(status.org, status.name),
+            status.branch or '(detached)',
+            '*' if status.dirty else '',
+            NO_VALUE if status.ahead is None else str(status.ahead),
+            NO_VALUE if status.behind is None else str(status.behind),
+            ", ".join(status.stale)))
+    widths = [max(len(row[column]) for row in rows)
+              for column in range(len(rows[0]) - 1)]
+    return "\n".join(
+        "  ".join([value.ljust(width) for value, width
+                   in zip(row, widths)] + [row[-1]]).rstrip()
+        for row in rows)
+
+
+def format_json(statuses):
+    """Formats the statuses as a json list"""
+    return json.dumps([dict(status._asdict()) for status in statuses],
+                      indent=1, sort_keys=True)
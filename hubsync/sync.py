@@ -1,34 +1,28 @@
 """File wrapping sync related functions,
 
 You will see that this files uses the workspace repo/org and the github repo/org
- together with the raw Api of git for example. We are aware this is not the best
- design and ideally all git calls should be hidden within the workspace module
- but we chose to be pragmatic for the moment as doing so will raise the current
+ together with the repos opened by the git backend (see hubsync.gitbackend).
+ Ideally all git calls should be hidden within the workspace module but we
+ chose to be pragmatic for the moment as doing so will raise the current
  complexity of the workspace module in a way that is not justifiable for the
  moment. Lets not make best the enemy of better :). You are though welcome to
  come up with a better solution.
 """
 from contextlib import contextmanager
 import logging
-import shutil
 import os
+import shutil
 import subprocess
+import threading
 
-import git
-
-from . import workspace
+from . import (filters, forks, gitbackend, metrics, mirror, policies,
+               prefetch, refspecs, removals, watchdog, workspace)
 
 
 LOG = logging.getLogger('hubsync.sync')
 
-
-@contextmanager
-def git_wrap(git_item):
-    cw = git_item.config_writer
-    try:
-        yield cw
-    finally:
-        cw.release()
+# hosts synced at the same time ask one question at a time
+_PROMPT_LOCK = threading.Lock()
 
 
 def zip_pairs(xs, ys, key=lambda x: x):
@@ -49,17 +43,6 @@ def zip_pairs(xs, ys, key=lambda x: x):
             yield None, ys.pop()
 
 
-@contextmanager
-def cd(path):
-    """Context manager that cds to a path"""
-    saved_path = os.getcwd()
-    os.chdir(path)
-    try:
-        yield
-    finally:
-        os.chdir(saved_path)
-
-
 def yesno_as_boolean(yesno_string):
     """converts text containing yes or no to a bool"""
     valid = {"yes": True, "y": True, "ye": True, "no": False, "n": False}
@@ -98,36 +81,109 @@ def input_yesno(question, default="yes"):
                 print("Please respond with 'yes' or 'no' (or 'y' or 'n').")
 
 
-def run_commands(commands):
-    """Runs a bash command in the current workspace"""
+def run_commands(commands, cwd=None):
+    """Runs a bash command within cwd
+
+    The working directory of hubsync is left alone, as several hosts may be
+    synced at the same time.
+    """
     if commands:
-        subprocess.call(commands, shell=True)
+        subprocess.call(commands, shell=True, cwd=cwd)
 
 
 class SyncHelper(object):
     """Class that wraps the synchronization of objects"""
 
-    def __init__(self, api, config):
+    def __init__(self, api, config, journal=None, git_slots=None,
+                 fetch_limits=None):
         """ Initializes the sync helper
 
         :type api: hubsync.github.api
         :type config: hubsync.config.Config
         :param api: github helper
         :param config: parsed global configuration
+        :param journal: opened journal to record the progress in and to skip
+            what an interrupted sync finished, None to not record it
+        :type journal: hubsync.journal.Journal
+        :param git_slots: semaphore limiting the git clones, pulls, fetches
+            and pushes run at the same time, shared by the hosts of the run.
+            No limit if None
+        :type git_slots: threading.Semaphore
+        :param fetch_limits: adaptive limit of the git operations run at the
+            same time against each git host, shared by the hosts of the run.
+            No limit if None
+        :type fetch_limits: hubsync.concurrency.AdaptiveLimits
         """
         self.api = api
         self.config = config
+        self.journal = journal
+        self.git_slots = git_slots
+        self.fetch_limits = fetch_limits
+        self.retries = int(config.glob.retries)
+        # full names of the repos whose git operations failed
+        self.failed = []
+        self.selector = filters.Selector.from_config(config)
+        self.fetch_policies = refspecs.FetchPolicies.from_config(config)
+        self.policies = policies.Policies.from_config(config)
+        self.metrics = metrics.Metrics()
+        self.mirror = mirror.Mirror.from_config(config.mirror)
+        self.removals = removals.Removals()
+        self.trash = removals.Trash()
+        self.fork_queue = None
+        if self.config.glob.fork_repos:
+            self.fork_queue = forks.ForkQueue(api)
+        self.merge_queue = None
+        if self.config.glob.update_forks:
+            self.merge_queue = forks.MergeUpstreamQueue(api)
 
         if self.config.glob.case_sensitive:
             self._key_extractor = lambda x: x.name
         else:
             self._key_extractor = lambda x: str(x.name).lower()
 
-    def remove_local(self, folder):
-        """Handles the removal of a local folder in function of the config"""
-        if self.config.glob.interactive:
-            if input_yesno("Delete {}?".format(folder), "no"):
-                shutil.rmtree(folder)
+    def remove_local(self, folder, manifest=None):
+        """Records a local folder to remove, they are reviewed together at
+        the end of the sync
+
+        :param manifest: manifest of the workspace, to forget the folder
+        :type manifest: hubsync.workspace.Manifest
+        """
+        self.removals.add(folder, manifest)
+
+    def confirm_removals(self, folders):
+        """Asks which of the local folders missing in github to delete
+
+        :return: list of the folders confirmed, none if not interactive
+        """
+        if not self.config.glob.interactive:
+            for folder in folders:
+                print("Not removing {}, run interactively to delete it"
+                      .format(folder))
+            return []
+        with _PROMPT_LOCK:
+            if len(folders) == 1:
+                if input_yesno("Delete {}?".format(folders[0]), "no"):
+                    return folders
+                return []
+            print("Found {} folders locally but not in github:"
+                  .format(len(folders)))
+            for folder in folders:
+                print("  {}".format(folder))
+            if input_yesno("Delete all of them?", "no"):
+                return folders
+            if not input_yesno("Choose which ones to delete?", "no"):
+                return []
+            return [folder for folder in folders
+                    if input_yesno("Delete {}?".format(folder), "no")]
+
+    def review_removals(self):
+        """Removes the local folders missing in github that are confirmed,
+        they are deleted in the background"""
+        removed = self.removals.review(self.confirm_removals, self.trash)
+        if removed:
+            print("Deleting {} folders in the background".format(
+                len(removed)))
+            self.metrics.increment('folders.removed', len(removed))
 
     def sync(self, local_workspace, github_api):
         """Syncs using a workspace and a github api
@@ -138,63 +194,445 @@ class SyncHelper(object):
         """
         LOG.debug("Syncing organizations. workspace {} with github {}"
                   .format(local_workspace, github_api))
+        with self.metrics.timer('sync'):
+            self._sync(local_workspace, github_api)
+
+    @contextmanager
+    def git_operation(self, name, url=None):
+        """Times a git operation that uses the network, waiting first for a
+        free slot if they are limited
+
+        :param url: url the operation reaches, to wait for room in the
+            adaptive limit of its host if there is one
+        """
+        if self.fetch_limits is not None and url is not None:
+            # clones take as long as what they download, not as the load
+            with self.fetch_limits.operation(url, name != 'git.clone'):
+                with self._git_slot(name):
+                    yield
+        else:
+            with self._git_slot(name):
+                yield
+
+    def run_git_operation(self, name, url, operation):
+        """Runs a git operation that uses the network, see git_operation,
+        running it again with backoff if git is killed for taking too long
+
+        :param operation: function running the operation
+        :raises GitBackendError: if git fails, or times out every time
+        """
+        def attempt():
+            with self.git_operation(name, url):
+                return operation()
+        return watchdog.retry(
+            attempt, gitbackend.GitTimeout, self.retries,
+            description=name,
+            on_retry=lambda _: self.metrics.increment('git.retries'))
+
+    def repo_failed(self, github_repo, err):
+        """Records a repo whose git operations failed, the sync goes on
+        with the next one"""
+        LOG.error("Failed to sync repo {}: {}".format(github_repo.full_name,
+                                                      err))
+        self.metrics.increment('repos.failed')
+        self.failed.append(github_repo.full_name)
+
+    @contextmanager
+    def _git_slot(self, name):
+        """Times the body, waiting first for a slot if they are limited"""
+        if self.git_slots is None:
+            with self.metrics.timer(name):
+                yield
+            return
+        with self.metrics.timer('git.wait'):
+            self.git_slots.acquire()
+        try:
+            with self.metrics.timer(name):
+                yield
+        finally:
+            self.git_slots.release()
+
+    def _journal(self, action, kind, path):
+        """Records an action in the journal, if there is one"""
+        if self.journal is not None:
+            getattr(self.journal, action)(kind, os.path.abspath(path))
+
+    def _finished_before(self, kind, path):
+        """Whether the interrupted sync being resumed finished an action"""
+        return (self.journal is not None and
+                self.journal.is_done(kind, os.path.abspath(path)))
+
+    def _sync(self, local_workspace, github_api):
+        if self.journal is not None:
+            self.journal.remove_unfinished_clones()
+        if self.config.workspace.trash:
+            self.trash = removals.Trash(os.path.join(
+                local_workspace.path, self.config.workspace.trash))
+        self.trash.empty()
         local_orgs = local_workspace.organizations
         github_orgs = github_api.organizations
         if self.config.glob.sync_user:
             github_orgs.append(github_api.user)
-        for local_org, github_org in zip_pairs(local_orgs,
-                                               github_orgs,
-                                               self._key_extractor):
-            if not github_org:
-                print("Found organization {} locally but not in github."
-                      .format(local_org.name))
-                self.remove_local(local_org.path)
-                continue
+        # orgs not selected are neither synced nor removed
+        local_orgs = [org for org in local_orgs
+                      if self.selector.selects_org(org.name)]
+        github_orgs = [org for org in github_orgs
+                       if self.selector.selects_org(org.name)]
+        pairs = list(zip_pairs(local_orgs, github_orgs, self._key_extractor))
+        prefetcher = None
+        lookahead = int(self.config.glob.prefetch)
+        if lookahead:
+            # the orgs synced, in order, are listed ahead in the background
+            prefetcher = prefetch.Prefetcher(
+                [github_org for _, github_org in pairs
+                 if github_org and not self._finished_before(
+                     'org', os.path.join(local_workspace.path,
+                                         github_org.name))],
+                lookahead, self.metrics).start()
+        try:
+            for local_org, github_org in pairs:
+                self._sync_org_pair(local_workspace, local_org, github_org,
+                                    prefetcher)
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
+        self.review_removals()
+        self.configure_forks(local_workspace)
+        self.push_forks(local_workspace)
+        local_workspace.save_manifest()
+        if self.failed:
+            print("Failed to sync {} repos, the next sync tries them again: "
+                  "{}".format(len(self.failed), ", ".join(self.failed)))
+
+    def _sync_org_pair(self, local_workspace, local_org, github_org,
+                       prefetcher=None):
+        """Syncs an org of the workspace with its github org
+
+        :param prefetcher: prefetcher listing the github org, if any
+        :type prefetcher: hubsync.prefetch.Prefetcher
+        """
+        if not github_org:
+            print("Found organization {} locally but not in github."
+                  .format(local_org.name))
+            self.remove_local(local_org.path, local_workspace.manifest)
+            return
+
+        org_path = os.path.join(local_workspace.path, github_org.name)
+        if self._finished_before('org', org_path):
+            LOG.info("Skipping organization {}, it was synced before the "
+                     "interruption".format(github_org.name))
+            return
+
+        if not local_org:
+            print("Cloning organization {}".format(github_org.name))
+            os.makedirs(os.path.join(local_workspace.path, github_org.name))
+            local_org = workspace.Organization(github_org.name,
+                                               local_workspace.path,
+                                               local_workspace.backend,
+                                               local_workspace.manifest)
+
+        org_config = self.policies.org(github_org.name)
+        self._journal('start', 'org', org_path)
+        run_commands(org_config.pre, local_org.path)
+        self.sync_org(local_org, github_org if prefetcher is None
+                      else prefetcher.org(github_org))
+        run_commands(org_config.post, local_org.path)
+        self._journal('done', 'org', org_path)
+        # checkpoint, the repos of the org are skipped if resuming
+        local_workspace.save_manifest()
+
+    def push_forks(self, local_workspace):
+        """Pushes the default branch of the forks github could not update
+
+        Waits for the updates requested to github to finish.
+
+        :type local_workspace: hubsync.workspace.Workspace
+        """
+        if self.merge_queue is None:
+            return
+        conflicts = self.merge_queue.wait()
+        failed = [merge_request.fork_name
+                  for merge_request in self.merge_queue.failed]
+        for merge_request in conflicts:
+            print("Pushing {} to fork {}".format(merge_request.branch,
+                                                 merge_request.fork_name))
+            local_repo = workspace.Repo(
+                os.path.basename(merge_request.path),
+                os.path.dirname(merge_request.path), local_workspace.backend)
+            try:
+                self.run_git_operation(
+                    'git.push', local_repo.git.remote_url('fork'),
+                    lambda: local_repo.git.push(
+                        'fork', 'refs/remotes/upstream/{0}:refs/heads/{0}'
+                        .format(merge_request.branch)))
+            except (workspace.InvalidPath, gitbackend.GitBackendError) as err:
+                LOG.error("Failed to update fork {}: {}".format(
+                    merge_request.fork_name, err))
+                failed.append(merge_request.fork_name)
+            finally:
+                local_repo.close()
+        if failed:
+            self.metrics.increment('forks.update_failed', len(failed))
+            print("Failed to update {} forks, the next sync tries them "
+                  "again: {}".format(len(failed), ", ".join(failed)))
+
+    def update_fork(self, github_repo, local_repo):
+        """Requests github to update the fork the fork remote points to
+
+        :type github_repo: hubsync.github.Repo
+        :type local_repo: hubsync.workspace.Repo
+        """
+        fork_url = local_repo.git.remote_url('fork')
+        if fork_url is None:
+            return
+        fork_name = forks.remote_name(fork_url)
+        if fork_name is None:
+            LOG.warning("Cannot update fork {} of {}, its url has no "
+                        "owner/name".format(fork_url, local_repo.name))
+            return
+        self.merge_queue.request(github_repo, local_repo.path, fork_name)
 
-            if not local_org:
-                print("Cloning organization {}".format(github_org.name))
-                os.makedirs(os.path.join(local_workspace.path, github_org.name))
-                local_org = workspace.Organization(github_org.name,
-                                                   local_workspace.path)
+    def configure_forks(self, local_workspace):
+        """Adds and fetches the fork remote of the repos forked in this sync
 
-            with cd(local_org.path):
-                run_commands(self.config.org.pre)
-                self.sync_org(local_org, github_org)
-                run_commands(self.config.org.post)
+        Waits for the forks requested to be available.
+
+        :type local_workspace: hubsync.workspace.Workspace
+        """
+        if self.fork_queue is None:
+            return
+        for fork in self.fork_queue.wait():
+            local_repo = workspace.Repo(
+                os.path.basename(fork.path), os.path.dirname(fork.path),
+                local_workspace.backend, local_workspace.manifest)
+            policy = self.fetch_policies.policy(fork.github_repo.user,
+                                                fork.github_repo.name)
+            try:
+                if local_repo.git.remote_url('fork') is None:
+                    local_repo.git.create_remote('fork', fork.url)
+                fetch = self.apply_fetch_policy(
+                    local_repo.git, 'fork', policy,
+                    fork.github_repo.default_branch)
+                self.run_git_operation(
+                    'git.fetch', fork.url,
+                    lambda: local_repo.git.fetch('fork', prune=policy.prune))
+                if local_repo.manifest is not None:
+                    entry = local_repo.manifest.repo(local_repo.path) or {}
+                    local_repo.manifest.update_repo(
+                        local_repo.path,
+                        remotes=dict(entry.get('remotes', {}), fork=fork.url),
+                        fetch=dict(entry.get('fetch', {}), fork=fetch))
+            except (workspace.InvalidPath, gitbackend.GitBackendError) as err:
+                LOG.error("Failed to set the fork of {}: {}".format(
+                    local_repo.name, err))
+            finally:
+                local_repo.close()
+        failed = [fork_request.github_repo.full_name
+                  for fork_request in self.fork_queue.failed]
+        if failed:
+            self.metrics.increment('forks.failed', len(failed))
+            print("Failed to fork {} repos, the next sync tries them again: "
+                  "{}".format(len(failed), ", ".join(failed)))
 
     def sync_org(self, local_org, github_origin):
         """Syncs the org across the workspace and the origin
 
+        The github repos are synced as their listing is received, a page at
+        a time, so only the names of the local repos are held for the whole
+        org. The local repos missing in github are handled once the listing
+        ends.
+
         :param local_org: local workspace of the org
         :param github_origin: github storage of the org
         """
         LOG.info("Syncing organization {}".format(local_org.name))
-        for local_repo, github_repo in zip_pairs(
-                local_org.repos, github_origin.repos, self._key_extractor):
-            if not github_repo:
+        not_git = set()
+        for folder in local_org.invalid_folders:
+            print("Ignoring folder {}, it is not a git repository"
+                  .format(folder.path))
+            not_git.add(self._key_extractor(folder))
+
+        # repos not selected are neither synced nor removed
+        repo_filter = self.selector.repo_filter(local_org.name)
+        # key: names of the local repos not matched to a github repo yet
+        unmatched = {}
+        for local_repo in local_org.iter_repos():
+            if repo_filter.selects_name(local_repo.name, "{}/{}".format(
+                    local_org.name, local_repo.name)):
+                unmatched.setdefault(self._key_extractor(local_repo),
+                                     []).append(local_repo.name)
+
+        moved = set()
+        for github_repo in github_origin.iter_repos():
+            names = unmatched.get(self._key_extractor(github_repo))
+            policy = self.policies.repo(github_repo.user, github_repo.name)
+            if (policy.mode == policies.SKIP or
+                    not repo_filter.selects(github_repo)):
+                LOG.debug("Skipping repo {}".format(github_repo.full_name))
+                unmatched.pop(self._key_extractor(github_repo), None)
+                continue
+            local_repo = None
+            if names:
+                local_repo = workspace.Repo(names.pop(0), local_org.path,
+                                            local_org.backend,
+                                            local_org.manifest)
+            elif local_org.manifest is not None:
+                # Adopt the folders of repos renamed or transferred, their
+                # old name is not in github anymore so they are not removed
+                old_path = local_org.manifest.find_by_id(github_repo.id)
+                local_repo = self.adopt_moved_repo(local_org, github_repo,
+                                                   old_path)
+                if local_repo is not None:
+                    moved.add(os.path.abspath(old_path))
+            self.sync_github_repo(local_org, local_repo, github_repo, not_git,
+                                  policy)
+
+        for names in unmatched.values():
+            for name in names:
+                local_repo = workspace.Repo(name, local_org.path,
+                                            local_org.backend,
+                                            local_org.manifest)
+                if os.path.abspath(local_repo.path) in moved:
+                    continue
+                if self.moved_in_github(local_repo):
+                    continue
                 print("Found repo {} locally but not in github."
                       .format(local_repo.name))
-                self.remove_local(local_repo.path)
-                continue
+                self.remove_local(local_repo.path, local_org.manifest)
 
-            if not local_repo:
-                print("Cloning repo {}".format(github_repo.name))
-                git.Repo.clone_from(github_repo.url, github_repo.name)
-                local_repo = workspace.Repo(github_repo.name, local_org.path)
+    def sync_github_repo(self, local_org, local_repo, github_repo, not_git,
+                         policy):
+        """Clones or syncs a github repo, closing its git repo afterwards
 
-            with cd(local_repo.path):
-                run_commands(self.config.repo.pre)
-                self.sync_repo(local_repo, github_repo)
-                run_commands(self.config.repo.post)
+        :type local_org: hubsync.workspace.Organization
+        :param local_repo: folder of the repo, None if it is not cloned
+        :type local_repo: hubsync.workspace.Repo
+        :type github_repo: hubsync.github.Repo
+        :param not_git: keys of the folders of the org that are not git
+            repos, they are not cloned over
+        :type policy: hubsync.policies.RepoPolicy
+        """
+        repo_path = (local_repo.path if local_repo else
+                     os.path.join(local_org.path, github_repo.name))
+        if self._finished_before('repo', repo_path):
+            LOG.debug("Skipping repo {}, it was synced before the "
+                      "interruption".format(github_repo.name))
+            return
+        if (local_repo and local_repo.manifest is not None and
+                not policy.is_due(local_repo.manifest.repo(local_repo.path))):
+            LOG.debug("Skipping repo {}, it was synced within its interval"
+                      .format(github_repo.name))
+            self.metrics.increment('repos.not_due')
+            return
+
+        if not local_repo:
+            if self._key_extractor(github_repo) in not_git:
+                print("Not cloning repo {}, its folder is in use"
+                      .format(github_repo.name))
+                return
+            print("Cloning repo {}".format(github_repo.name))
+            fetch_policy = self.fetch_policies.policy(github_repo.user,
+                                                      github_repo.name)
+            self._journal('start', 'clone', repo_path)
+            clone_url = self.fetch_url(github_repo)
+
+            def clone():
+                # a clone killed for taking too long leaves its folder
+                if os.path.isdir(repo_path):
+                    shutil.rmtree(repo_path)
+                local_org.backend.clone(
+                    clone_url, repo_path,
+                    github_repo.default_branch if fetch_policy.narrow
+                    else None, policy.clone_options)
+            try:
+                self.run_git_operation('git.clone', clone_url, clone)
+            except gitbackend.GitBackendError as err:
+                self.repo_failed(github_repo, err)
+                shutil.rmtree(repo_path, ignore_errors=True)
+                return
+            self._journal('done', 'clone', repo_path)
+            local_repo = workspace.Repo(github_repo.name, local_org.path,
+                                        local_org.backend,
+                                        local_org.manifest)
+
+        try:
+            local_repo.git
+        except workspace.InvalidPath as err:
+            print("Skipping repo {}: {}".format(local_repo.name, err))
+            return
+        self._journal('start', 'repo', repo_path)
+        try:
+            run_commands(policy.pre, local_repo.path)
+            self.sync_repo(local_repo, github_repo)
+            run_commands(policy.post, local_repo.path)
+        except gitbackend.GitBackendError as err:
+            # not recorded as done, a resumed sync tries it again
+            self.repo_failed(github_repo, err)
+            return
+        finally:
+            local_repo.close()
+        self._journal('done', 'repo', repo_path)
+
+    def adopt_moved_repo(self, local_org, github_repo, old_path):
+        """Moves the folder of a repo that was renamed or transferred
+
+        The folder, found through the github id recorded in the manifest, is
+        moved to its new name within local_org and its remotes are
+        updated. Local branches are kept and no new clone is needed.
+
+        :type local_org: hubsync.workspace.Organization
+        :type github_repo: hubsync.github.Repo
+        :param old_path: path recorded for the github repo id, if any
+        :return: the repo in its new location or None if there is no
+            folder to move
+        :rtype: hubsync.workspace.Repo
+        """
+        new_path = os.path.join(local_org.path, github_repo.name)
+        if (old_path is None or not os.path.isdir(old_path) or
+                os.path.exists(new_path)):
+            return None
+        print("Moving {} to {} as it was renamed or transferred in github"
+              .format(old_path, new_path))
+        os.rename(old_path, new_path)
+        local_org.manifest.forget(old_path)
+        local_repo = workspace.Repo(github_repo.name, local_org.path,
+                                    local_org.backend, local_org.manifest)
+        for name, url in sorted(self.expected_remotes(github_repo).items()):
+            if local_repo.git.remote_url(name) is None:
+                local_repo.git.create_remote(name, url)
+            else:
+                local_repo.git.set_remote_config(name, 'url', url)
+        return local_repo
+
+    def moved_in_github(self, local_repo):
+        """Whether a repo missing in its org was transferred to another one
+
+        :type local_repo: hubsync.workspace.Repo
+        """
+        manifest = local_repo.manifest
+        entry = manifest.repo(local_repo.path) if manifest else None
+        if not entry or entry.get('id') is None:
+            return False
+        github_repo = self.api.repository(entry['id'])
+        if github_repo is None or github_repo.full_name == entry['full_name']:
+            return False
+        print("Repo {} was moved to {} in github, it will be moved when "
+              "syncing {}".format(local_repo.name, github_repo.full_name,
+                                  github_repo.user))
+        return True
 
     def sync_repo(self, local_repo, github_repo):
         """Syncs the repo with github
 
         :type github_repo: hubsync.github.Repo
         :type local_repo: hubsync.workspace.Repo
-        It syncs remotes and branches
+        It syncs remotes and branches, only the remotes if its policy is
+        fetch-only
         """
         LOG.info("Syncing repo {}".format(local_repo.name))
+        self.metrics.increment('repos')
+        fetch_only = self.policies.repo(
+            github_repo.user, github_repo.name).mode == policies.FETCH_ONLY
 
         def sync_remotes():
             """Sets up the remotes
@@ -202,63 +640,160 @@ class SyncHelper(object):
             - origin: origin of the repo
             - upstream: origin with push options
             - fork: user's fork of the repo
+
+            origin and upstream fetch from the mirror if it is up to date,
+            pushing to github. The branches fetched from each remote follow
+            the fetch policy of the repo. The remotes config is skipped if
+            the manifest shows it was already set and the repo did not
+            change since.
             """
             LOG.debug("Syncing remotes")
-            # set origin
-            try:
-                origin = local_repo.git.remote('origin')
-            except ValueError:
-                origin = local_repo.git.create_remote('origin', github_repo.url)
-            origin.pull()
-
-            if github_repo.user != self.api.user.name:
-                # disable push to origin if I am not the owner
-                with git_wrap(origin) as writer:
-                    writer.set('pushurl', 'nopush')
-                # and set upstream
-                try:
-                    upstream = local_repo.git.remote('upstream')
-                except ValueError:
-                    upstream = local_repo.git.create_remote('upstream',
-                                                            github_repo.url)
-                upstream.fetch()
-                # set fork
-                try:
-                    local_repo.git.remote('fork')
-                except ValueError:
-                    fork_url = str(github_repo.url).replace(
-                        github_repo.user, self.api.user.name, 1)
-                    local_repo.git.create_remote('fork', fork_url)
+            repo = local_repo.git
+            policy = self.fetch_policies.policy(github_repo.user,
+                                                github_repo.name)
+            remotes = self.expected_remotes(github_repo)
+            fork_pending = False
+            if self.fork_queue is not None and 'fork' in remotes:
+                fork_url = repo.remote_url('fork')
+                if fork_url is None:
+                    # added once the fork exists, see configure_forks
+                    del remotes['fork']
+                    fork_pending = True
+                else:
+                    remotes['fork'] = fork_url
+            push_urls = {}
+            if self.mirror is not None:
+                fetch_url = self.fetch_url(github_repo)
+                self.metrics.increment('mirror.fresh'
+                                       if fetch_url != github_repo.url
+                                       else 'mirror.stale')
+                for name in ('origin', 'upstream'):
+                    if name in remotes:
+                        push_urls[name] = remotes[name]
+                        remotes[name] = fetch_url
+                if 'upstream' in remotes:
+                    push_urls['origin'] = 'nopush'
+            fetch = dict((name, policy.refspecs(name,
+                                                github_repo.default_branch))
+                         for name in remotes)
+            manifest = local_repo.manifest
+            entry = manifest.repo(local_repo.path) if manifest else None
+            if (manifest is None or not manifest.is_fresh(local_repo.path) or
+                    entry.get('remotes') != remotes or
+                    entry.get('fetch') != fetch):
+                for name, url in sorted(remotes.items()):
+                    current_url = repo.remote_url(name)
+                    if current_url is None:
+                        repo.create_remote(name, url)
+                    elif name in push_urls and current_url != url:
+                        # switching between the mirror and github
+                        repo.set_remote_config(name, 'url', url)
+                    self.apply_fetch_policy(repo, name, policy,
+                                            github_repo.default_branch)
+                if 'upstream' in remotes:
+                    # disable push to origin if I am not the owner
+                    repo.set_remote_config('origin', 'pushurl', 'nopush')
+                for name, url in sorted(push_urls.items()):
+                    repo.set_remote_config(name, 'pushurl', url)
+            else:
+                LOG.debug("Remotes of {} already set".format(local_repo.name))
+
+            if fetch_only:
+                self.run_git_operation(
+                    'git.fetch', remotes['origin'],
+                    lambda: repo.fetch('origin', prune=policy.prune))
+            else:
+                self.run_git_operation(
+                    'git.pull', remotes['origin'],
+                    lambda: repo.pull('origin', prune=policy.prune))
+            if 'upstream' in remotes:
+                self.run_git_operation(
+                    'git.fetch', remotes['upstream'],
+                    lambda: repo.fetch('upstream', prune=policy.prune))
+            if fork_pending:
+                self.fork_queue.request(github_repo, local_repo.path)
+            elif self.merge_queue is not None and 'fork' in remotes:
+                self.update_fork(github_repo, local_repo)
+            return remotes, fetch
 
         def sync_branches():
             """Sincs/update/clean local/fork branches"""
             LOG.debug("Syncing branches")
+            upstream_branch = "origin/{}".format(github_repo.default_branch)
             # clean merged branches
-            for branch in local_repo.git.heads:
-                commits_ahead = list(local_repo.git.iter_commits(
-                    "origin/master..{}".format(branch.name)))
-                commits_behind = list(local_repo.git.iter_commits(
-                    "{}..origin/master".format(branch.name)))
+            for branch in local_repo.git.branches():
+                try:
+                    commits_ahead, commits_behind = \
+                        local_repo.git.ahead_behind(branch, upstream_branch)
+                except gitbackend.GitBackendError as err:
+                    LOG.error("Failed to compare branch {}, {}"
+                              .format(branch, err))
+                    continue
                 if not commits_ahead and commits_behind:
                     print("Removing stale branch {} locally"
-                          .format(branch.name))
+                          .format(branch))
                     try:
-                        local_repo.git.delete_head(branch.name)
-                    except git.exc.GitCommandError as err:
+                        local_repo.git.delete_branch(branch)
+                    except gitbackend.GitBackendError as err:
                         LOG.error("Failed to delete branch, {}".format(err))
 
-        def sync_fork():
-            """Syncs and clears the fork (if any)"""
-            already_forked = any(fork.fork_owner == self.api.user.name
-                                 for fork in github_repo.forks)
-            already_forked = already_forked or (github_repo.user == self.api.user.name)
-            if not already_forked:
-                LOG.info("Creating a fork for {}".format(local_repo.name))
-                github_repo.fork()
-            else:
-                LOG.debug("{} is already forked".format(local_repo.name))
+        remotes, fetch = sync_remotes()
+        if not fetch_only:
+            sync_branches()
+        if local_repo.manifest is not None:
+            default_branch = "origin/{}".format(github_repo.default_branch)
+            local_repo.manifest.record_repo(
+                local_repo.path, id=github_repo.id,
+                full_name=github_repo.full_name, remotes=remotes, fetch=fetch,
+                default_branch=github_repo.default_branch,
+                shas={'HEAD': local_repo.git.rev_parse('HEAD'),
+                      default_branch: local_repo.git.rev_parse(default_branch)})
+
+    @staticmethod
+    def apply_fetch_policy(repo, remote, policy, default_branch):
+        """Sets the fetch refspecs of a remote as the policy says
+
+        The remote-tracking branches not covered by the policy are removed
+        if it prunes, as fetch only prunes the ones the refspecs cover.
+
+        :type policy: hubsync.refspecs.FetchPolicy
+        :return: refspecs of the remote
+        """
+        remote_refspecs = policy.refspecs(remote, default_branch)
+        if repo.fetch_refspecs(remote) != remote_refspecs:
+            LOG.debug("Setting the fetch refspecs of {} to {}".format(
+                remote, ", ".join(remote_refspecs)))
+            repo.set_fetch_refspecs(remote, remote_refspecs)
+        if policy.prune and policy.narrow:
+            for branch in repo.remote_branches(remote):
+                if branch != 'HEAD' and not policy.covers(branch,
+                                                          default_branch):
+                    LOG.debug("Pruning {}/{}".format(remote, branch))
+                    repo.delete_remote_branch(remote, branch)
+        return remote_refspecs
+
+    def fetch_url(self, github_repo):
+        """Url to clone and fetch a repo from, its mirror if up to date
 
-        sync_remotes()
-        sync_branches()
-        if self.config.glob.fork_repos:
-            sync_fork()
+        :type github_repo: hubsync.github.Repo
+        """
+        if self.mirror is None:
+            return github_repo.url
+        if self.mirror.is_fresh(github_repo):
+            return self.mirror.repo_url(github_repo)
+        LOG.info("Mirror of {} is not up to date, using github".format(
+            github_repo.full_name))
+        return github_repo.url
+
+    def expected_remotes(self, github_repo):
+        """Urls each remote of a repo should point to
+
+        :type github_repo: hubsync.github.Repo
+        :return: dictionary of remote name to url
+        """
+        result = {'origin': github_repo.url}
+        if github_repo.user != self.api.user.name:
+            result['upstream'] = github_repo.url
+            result['fork'] = str(github_repo.url).replace(
+                github_repo.user, self.api.user.name, 1)
+        return result
@@ -0,0 +1,250 @@
+"""Transports used by hubsync.github.Api to talk http
+
+A transport receives a method, an url, the request headers and optionally a
+body and returns a Response. Besides the http one there are transports to
+record the responses into a CaptureStore and to replay them later without
+network access.
+"""
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import parse_header_links
+
+
+LOG = logging.getLogger('hubsync.transport')
+
+
+class ReplayMissError(KeyError):
+    """Raised when replaying a request that was not captured"""
+
+
+class Response(collections.namedtuple('Response',
+                                      'status headers body elapsed')):
+    """Response of a transport
+
+    :param status: http status code
+    :param headers: case insensitive dictionary of headers
+    :param body: text of the body
+    :param elapsed: seconds the request took
+    """
+    __slots__ = ()
+
+    def __new__(cls, status, headers, body, elapsed=0.0):
+        return super(Response, cls).__new__(
+            cls, status, CaseInsensitiveDict(headers or {}), body, elapsed)
+
+    def json(self):
+        """Decodes the body as json, raises ValueError if it is not json"""
+        return json.loads(self.body)
+
+    @property
+    def links(self):
+        """Dictionary of the Link header urls by their rel"""
+        header = self.headers.get('Link')
+        if not header:
+            return {}
+        return dict((link.get('rel'), link['url'])
+                    for link in parse_header_links(header))
+
+
+class HttpTransport(object):
+    """Sends the requests through http reusing connections"""
+
+    def __init__(self, session=None, timeout=None):
+        """
+        :param timeout: seconds to wait for github to accept the connection
+            or to send data, no limit if None
+        """
+        self.session = session or requests.Session()
+        self.timeout = timeout
+
+    def request(self, method, url, headers, body=None):
+        """Sends the request and returns its Response
+
+        :raises requests.Timeout: if github does not answer in time
+        """
+        start = time.time()
+        result = self.session.request(method, url, headers=headers,
+                                      data=body, timeout=self.timeout)
+        return Response(result.status_code, result.headers, result.text,
+                        time.time() - start)
+
+
+def _key(method, url):
+    return "{} {}".format(method.upper(), url)
+
+
+class CaptureStore(object):
+    """On disk storage of captured responses
+
+    It is a folder with two files:
+
+    - responses.jsonl: one json record per line with the method, url, status,
+      headers, body and the elapsed time of each response. It is only appended
+      to, so it can be streamed into.
+    - index.json: offset and length of the last record of each request within
+      responses.jsonl, written when closing the store. It is rebuilt from the
+      records if missing or out of date.
+
+    Records are only read from disk when they are requested.
+    """
+
+    DATA_FILE = 'responses.jsonl'
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, path):
+        self.path = path
+        self._data_path = os.path.join(path, self.DATA_FILE)
+        self._index_path = os.path.join(path, self.INDEX_FILE)
+        self._index = None
+        self._reader = None
+        self._writer = None
+        self._lock = threading.Lock()
+
+    @property
+    def index(self):
+        """Dictionary of request key to (offset, length) of its record"""
+        with self._lock:
+            return self._load_index()
+
+    def _load_index(self):
+        if self._index is not None:
+            return self._index
+        size = 0
+        if os.path.exists(self._data_path):
+            size = os.path.getsize(self._data_path)
+        self._index = {}
+        indexed_size = 0
+        if os.path.exists(self._index_path):
+            with open(self._index_path) as index_file:
+                stored = json.load(index_file)
+            self._index = dict((key, tuple(value)) for key, value
+                               in stored['entries'].items())
+            indexed_size = stored['size']
+        if indexed_size < size:
+            LOG.debug("Indexing {} from offset {}".format(self._data_path,
+                                                          indexed_size))
+            self._scan(indexed_size)
+        return self._index
+
+    def _scan(self, offset):
+        """Indexes the records in the data file starting from offset"""
+        with open(self._data_path, 'rb') as data_file:
+            data_file.seek(offset)
+            for line in data_file:
+                if not line.endswith(b'\n'):
+                    break  # partially written record
+                record = json.loads(line.decode('utf-8'))
+                self._index[_key(record['method'], record['url'])] = (
+                    offset, len(line))
+                offset += len(line)
+
+    def __contains__(self, key):
+        method, url = key
+        return _key(method, url) in self.index
+
+    def read(self, method, url):
+        """Returns the Response captured for a request
+
+        :raises ReplayMissError: if the request was not captured
+        """
+        try:
+            offset, length = self.index[_key(method, url)]
+        except KeyError:
+            raise ReplayMissError(_key(method, url))
+        with self._lock:
+            if self._reader is None:
+                self._reader = open(self._data_path, 'rb')
+            self._reader.seek(offset)
+            record = json.loads(self._reader.read(length).decode('utf-8'))
+        return Response(record['status'], record['headers'], record['body'],
+                        record['elapsed'])
+
+    def write(self, method, url, response):
+        """Appends a response to the store"""
+        record = json.dumps({
+            'method': method.upper(),
+            'url': url,
+            'status': response.status,
+            'headers': dict(response.headers),
+            'body': response.body,
+            'elapsed': response.elapsed,
+        }, sort_keys=True).encode('utf-8') + b'\n'
+        with self._lock:
+            self._load_index()
+            if self._writer is None:
+                if not os.path.exists(self.path):
+                    os.makedirs(self.path)
+                self._writer = open(self._data_path, 'ab')
+            offset = self._writer.tell()
+            self._writer.write(record)
+            self._writer.flush()
+            self._index[_key(method, url)] = (offset, len(record))
+
+    def close(self):
+        """Closes the files and stores the index"""
+        with self._lock:
+            if self._writer is not None:
+                size = self._writer.tell()
+                self._writer.close()
+                self._writer = None
+                tmp_path = self._index_path + '.tmp'
+                with open(tmp_path, 'w') as index_file:
+                    json.dump({'size': size, 'entries': self._index},
+                              index_file)
+                os.rename(tmp_path, self._index_path)
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class RecordingTransport(object):
+    """Sends requests through another transport storing the responses"""
+
+    def __init__(self, store, transport=None):
+        """
+        :type store: CaptureStore
+        :param transport: transport to record, http by default
+        """
+        self.store = store
+        self.transport = transport or HttpTransport()
+
+    def request(self, method, url, headers, body=None):
+        """Sends the request and records its Response"""
+        response = self.transport.request(method, url, headers, body)
+        self.store.write(method, url, response)
+        return response
+
+
+class ReplayTransport(object):
+    """Answers the requests with the responses of a CaptureStore"""
+
+    def __init__(self, store, realtime=False):
+        """
+        :type store: CaptureStore
+        :param realtime: whether to wait the time the original request took
+        """
+        self.store = store
+        self.realtime = realtime
+
+    def request(self, method, url, *_):
+        """Returns the captured Response
+
+        :raises ReplayMissError: if the request was not captured
+        """
+        response = self.store.read(method, url)
+        if self.realtime:
+            time.sleep(response.elapsed)
+        return response
@@ -0,0 +1,137 @@
+"""Bounds on how long a run waits for git and github
+
+A git process waiting for a credential prompt or on a dead connection, or a
+github request that never gets an answer, would hang the run forever, and
+runs started by cron would pile up behind it. Git runs under a watchdog that
+kills it once it takes longer than its timeout, the github requests time
+out, and the operations that time out are retried a few times, waiting
+longer each time, before giving up on them.
+"""
+import logging
+import os
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+
+import six
+
+
+LOG = logging.getLogger('hubsync.watchdog')
+
+DEFAULT_RETRIES = 2
+# seconds waited before the first retry, doubled for each of the next ones
+DEFAULT_BACKOFF = 2.0
+
+
+class Timeout(Exception):
+    """Raised when a command is killed for taking longer than its timeout"""
+
+
+def seconds(value):
+    """Timeout set in the config, None if disabled with 0 or false
+
+    >>> seconds('600')
+    600
+    """
+    return int(value) or None
+
+
+def check_output(args, cwd=None, timeout=None):
+    """Runs a command and returns its output, killing it after timeout
+
+    What the command writes to stderr is kept for the errors. It goes to a
+    file rather than a pipe, as an ssh control master started by git keeps
+    its stderr open long after git is done.
+
+    :param timeout: seconds the command may take, no limit if None
+    :raises subprocess.CalledProcessError: if the command fails, with what
+        it wrote to stderr in its stderr attribute
+    :raises Timeout: if the command is killed
+    """
+    with tempfile.TemporaryFile() as stdout, \
+            tempfile.TemporaryFile() as stderr:
+        process = _start(args, cwd, stdout, stderr, bool(timeout))
+        killed = threading.Event()
+
+        def kill():
+            killed.set()
+            try:
+                if os.name == 'posix':
+                    # the ssh and credential helpers git started go with it
+                    os.killpg(process.pid, signal.SIGKILL)
+                else:
+                    process.kill()
+            except OSError:
+                pass  # finished in the meantime
+        timer = None
+        if timeout:
+            timer = threading.Timer(timeout, kill)
+            timer.daemon = True
+            timer.start()
+        try:
+            process.wait()
+        finally:
+            if timer is not None:
+                timer.cancel()
+        stdout.seek(0)
+        output = stdout.read()
+        stderr.seek(0)
+        errors = stderr.read()
+    if killed.is_set():
+        raise Timeout("{} did not finish in {}s{}".format(
+            " ".join(args), timeout, describe_stderr(errors)))
+    if process.returncode:
+        error = subprocess.CalledProcessError(process.returncode, args,
+                                              output)
+        error.stderr = errors
+        raise error
+    return output
+
+
+def describe_stderr(errors):
+    """Output of a command on stderr to add to its error, if any
+
+    :param errors: bytes written to stderr
+    """
+    errors = errors.decode('utf-8', 'replace').strip()
+    return ": {}".format(errors) if errors else ""
+
+
+def _start(args, cwd, stdout, stderr, new_group):
+    """Starts a command, in its own process group if new_group and where
+    possible, so it can be killed together with its children"""
+    kwargs = {'cwd': cwd, 'stdout': stdout, 'stderr': stderr}
+    if new_group and os.name == 'posix':
+        if six.PY2:
+            kwargs['preexec_fn'] = os.setsid
+        else:
+            kwargs['start_new_session'] = True
+    return subprocess.Popen(args, **kwargs)
+
+
+def retry(operation, errors, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+          description="operation", on_retry=None):
+    """Calls operation, calling it again with backoff if it raises errors
+
+    :param errors: exception class, or tuple of them, that are retried
+    :param retries: max number of times the operation is called again
+    :param on_retry: function called with the error before each retry
+    :return: what the operation returns
+    :raises: the error of the last call if all of them failed
+    """
+    attempt = 0
+    while True:
+        try:
+            return operation()
+        except errors as err:
+            if attempt >= retries:
+                raise
+            wait = backoff * 2 ** attempt
+            LOG.warning("{} failed, retrying in {:.0f}s: {}".format(
+                description, wait, err))
+            if on_retry is not None:
+                on_retry(err)
+            time.sleep(wait)
+            attempt += 1
@@ -1,12 +1,27 @@
 """File wrapping workspace related functions"""
+import collections
+import json
 import logging
 import os
+import time
 
-import git
+try:
+    from os import scandir
+except ImportError:  # python < 3.5
+    from scandir import scandir
+
+from . import gitbackend
 
 
 LOG = logging.getLogger('hubsync.workspace')
 
+# Folders modified this recently are not cached, as further changes within
+# the same mtime granularity would go unnoticed
+RACY_SECONDS = 2
+
+ScanResult = collections.namedtuple('ScanResult', 'repos invalid')
+Folder = collections.namedtuple('Folder', 'name path')
+
 
 class LocalWorkspaceError(Exception):
     """Base exception for errors related to the local file workspace"""
@@ -18,46 +33,299 @@ class InvalidPath(LocalWorkspaceError):
 
 
 def get_sub_folders(path):
-    """Returns the name of all subfolders within a path"""
-    return next(os.walk(path))[1]
+    """Returns the name of all subfolders within a path
+
+    :raises OSError: if path cannot be listed
+    """
+    return [entry.name for entry in scandir(path) if entry.is_dir()]
+
+
+def is_git_folder(path):
+    """Whether the folder in path holds a git repo"""
+    return os.path.exists(os.path.join(path, '.git'))
+
+
+def scan_repos(path):
+    """Lists the subfolders of path splitting them in git repos and others
+
+    :rtype: ScanResult
+    """
+    repos, invalid = [], []
+    for entry in scandir(path):
+        if not entry.is_dir():
+            continue
+        if is_git_folder(entry.path):
+            repos.append(entry.name)
+        else:
+            invalid.append(entry.name)
+    return ScanResult(sorted(repos), sorted(invalid))
+
+
+def reclassify(path, cached):
+    """Checks again which of the subfolders of a cached scan are git repos
+
+    Running git init in a subfolder, or removing its .git, leaves the mtime
+    of path unchanged. Costs a stat per subfolder, path is not listed.
+
+    :type cached: ScanResult
+    :rtype: ScanResult
+    """
+    repos, invalid = [], []
+    for name in cached.repos + cached.invalid:
+        if is_git_folder(os.path.join(path, name)):
+            repos.append(name)
+        else:
+            invalid.append(name)
+    return ScanResult(sorted(repos), sorted(invalid))
+
+
+class Manifest(object):
+    """Index of the workspace, stored in a file at its root
+
+    It keeps:
+
+    - orgs: the result of scanning each org folder together with the mtime
+      of the folder. Scans are reused while the folder is not modified, as
+      adding, removing or renaming a repo updates the mtime of the org folder.
+      Whether each folder is a git repo is checked again on reuse.
+    - repos: what hubsync knows about each repo since it was last synced:
+      github id and full name, remote urls, default branch and the shas of
+      HEAD and of the remote default branch. Each entry is stored with the
+      mtime of the repo folder, entries whose folder changed since should be
+      cross-checked against the repo.
+    - maintenance: when each repo was last maintained and the result, see
+      hubsync.maintenance.
+
+    All paths are stored relative to the workspace root.
+    """
+    VERSION = 1
+
+    def __init__(self, path):
+        """
+        :param path: path of the manifest file, within the workspace root
+        """
+        self.path = path
+        self.root = os.path.dirname(os.path.abspath(path))
+        self._data = None
+        self._ids = None
+        self._dirty = False
+
+    @property
+    def data(self):
+        """Contents of the manifest, loaded on first access"""
+        if self._data is None:
+            self._data = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path) as manifest_file:
+                        self._data = json.load(manifest_file)
+                except ValueError:
+                    LOG.error("Ignoring corrupt manifest {}".format(self.path))
+            if self._data.get('version') != self.VERSION:
+                self._data = {'version': self.VERSION}
+            self._data.setdefault('orgs', {})
+            self._data.setdefault('repos', {})
+            self._data.setdefault('maintenance', {})
+        return self._data
+
+    def _key(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def scan(self, path):
+        """Scans path, using the stored result if it was not modified
+
+        :rtype: ScanResult
+        """
+        mtime = os.stat(path).st_mtime
+        entry = self.data['orgs'].get(self._key(path))
+        if entry and entry['mtime'] == mtime:
+            LOG.debug("Using cached scan of {}".format(path))
+            result = reclassify(path, ScanResult(entry['repos'],
+                                                 entry['invalid']))
+            if result != (entry['repos'], entry['invalid']):
+                entry.update(repos=result.repos, invalid=result.invalid)
+                self._dirty = True
+            return result
+        result = scan_repos(path)
+        if time.time() - mtime > RACY_SECONDS:
+            self.data['orgs'][self._key(path)] = {
+                'mtime': mtime, 'repos': result.repos,
+                'invalid': result.invalid}
+            self._dirty = True
+        return result
+
+    def repo(self, path):
+        """Entry stored for the repo in path, None if there is none"""
+        return self.data['repos'].get(self._key(path))
+
+    @staticmethod
+    def _config_mtime(path):
+        """Mtime of the git config of the repo in path, None if missing
+
+        Changes to the remotes, through git or editing the file, are written
+        there and leave the mtime of the repo folder unchanged.
+        """
+        try:
+            return os.stat(os.path.join(path, '.git', 'config')).st_mtime
+        except OSError:
+            return None
+
+    def is_fresh(self, path):
+        """Whether the git config of the repo in path did not change since
+        it was recorded"""
+        entry = self.repo(path)
+        if not entry:
+            return False
+        mtime = self._config_mtime(path)
+        return mtime is not None and entry.get('config_mtime') == mtime
+
+    def find_by_id(self, github_id):
+        """Path of the repo recorded with a github id, None if not found"""
+        if github_id is None:
+            return None
+        if self._ids is None:
+            self._ids = dict((entry.get('id'), key) for key, entry
+                             in self.data['repos'].items())
+        key = self._ids.get(github_id)
+        return None if key is None else self._path(key)
+
+    def record_repo(self, path, **fields):
+        """Records the state of the repo in path after syncing it
+
+        :param fields: id, full_name, remotes, fetch refspecs of each remote,
+            default_branch and shas
+        """
+        entry = dict(fields, config_mtime=self._config_mtime(path),
+                     synced_at=time.time())
+        self.data['repos'][self._key(path)] = entry
+        self._ids = None
+        self._dirty = True
+
+    def update_repo(self, path, **fields):
+        """Updates some fields of the entry of the repo in path, if any"""
+        entry = self.repo(path)
+        if entry is None:
+            return
+        entry.update(fields, config_mtime=self._config_mtime(path))
+        self._dirty = True
+
+    def maintenance(self, path):
+        """Result of the last maintenance of the repo in path, if any"""
+        return self.data['maintenance'].get(self._key(path))
+
+    def record_maintenance(self, path, **fields):
+        """Records the maintenance of the repo in path
+
+        :param fields: at, duration, tasks, before and after
+        """
+        self.data['maintenance'][self._key(path)] = fields
+        self._dirty = True
+
+    def forget(self, path):
+        """Removes all entries of path and of the folders within it"""
+        key = self._key(path)
+        for section in ('orgs', 'repos', 'maintenance'):
+            for existing in list(self.data[section]):
+                if existing == key or existing.startswith(key + os.sep):
+                    del self.data[section][existing]
+                    self._ids = None
+                    self._dirty = True
+
+    def save(self):
+        """Writes the manifest if it changed"""
+        if not self._dirty:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as manifest_file:
+            json.dump(self.data, manifest_file, indent=1, sort_keys=True)
+        os.rename(tmp_path, self.path)
+        self._dirty = False
 
 
 class Workspace(object):
     """Represents the current workspace directory"""
 
-    def __init__(self, path):
+    def __init__(self, path, backend=None, manifest=None):
+        """
+        :param backend: git backend to open the repos with, GitPython by
+            default
+        :param manifest: index of the workspace, None to always scan
+        :type backend: hubsync.gitbackend.GitPythonBackend
+        :type manifest: Manifest
+        """
         self.path = path
+        self.backend = backend or gitbackend.GitPythonBackend()
+        self.manifest = manifest
 
     @property
     def organizations(self):
-        """Returns the organizations within the workspace"""
+        """Returns the organizations within the workspace
+
+        Hidden folders, like the trash of the removed folders, are not orgs.
+        """
         try:
-            return [Organization(subdir, self.path)
-                    for subdir in get_sub_folders(self.path)]
-        except StopIteration:
+            return [Organization(subdir, self.path, self.backend,
+                                 self.manifest)
+                    for subdir in get_sub_folders(self.path)
+                    if not subdir.startswith('.')]
+        except (StopIteration, OSError):
             raise InvalidPath("Unable to search for orgs within {0.path}, "
                               "is the path correct?".format(self))
 
+    def save_manifest(self):
+        """Persists the manifest, if there is one"""
+        if self.manifest is not None:
+            self.manifest.save()
+
     def __repr__(self):
         return "<{0.__class__.__name__} ({0.path})>".format(self)
 
 
 class Repo(object):
-    """Repository representation within the workspace"""
+    """Repository representation within the workspace
+
+    Creating it is cheap, the git repository is only opened when accessing
+    the git attribute.
+    """
+    __slots__ = ('name', 'path', 'backend', 'manifest', '_git')
 
-    def __init__(self, name, base_path):
+    def __init__(self, name, base_path, backend=None, manifest=None):
         """ Creates the repo object
 
         :type name: str
         :param name: name of the repository
+        :param backend: git backend to open the repo with, GitPython by
+            default
+        :param manifest: index of the workspace the repo is in, if any
         """
         self.name = name.rstrip('/')
         self.path = os.path.join(base_path, self.name)
-        try:
-            self.git = git.Repo(self.path)
-        except git.exc.InvalidGitRepositoryError:
-            raise InvalidPath("Git repo don't exists in path {}".format(
-                self.path))
+        self.backend = backend or gitbackend.GitPythonBackend()
+        self.manifest = manifest
+        self._git = None
+
+    @property
+    def git(self):
+        """Git repository opened through the backend
+
+        :raises InvalidPath: if there is no git repository in the path
+        """
+        if self._git is None:
+            try:
+                self._git = self.backend.open(self.path)
+            except gitbackend.InvalidRepository:
+                raise InvalidPath("Git repo don't exists in path {}".format(
+                    self.path))
+        return self._git
+
+    def close(self):
+        """Releases the git repository if it was opened"""
+        if self._git is not None:
+            self._git.close()
+            self._git = None
 
     def __repr__(self):
         """repr for an Repo"""
@@ -71,27 +339,55 @@ class Organization(object):
     workspace
     """
 
-    def __init__(self, name, base_path):
+    def __init__(self, name, base_path, backend=None, manifest=None):
         """Creates the organization object
 
         :type name: str
         :param name: name of the organization
+        :param backend: git backend to open the repos with, GitPython by
+            default
+        :param manifest: index of the workspace, None to always scan
         """
         self.name = name.rstrip('/')
         self.path = os.path.join(base_path, self.name)
+        self.backend = backend or gitbackend.GitPythonBackend()
+        self.manifest = manifest
+        self._scan = None
 
     def __repr__(self):
         """repr for an Organization"""
         return "<{0.__class__.__name__} {0.name}({0.path})>".format(self)
 
-    @property
-    def repos(self):
-        """All repos within the organization"""
+    def scan(self):
+        """Lists the folders of the org, only once per object
+
+        :rtype: ScanResult
+        :raises InvalidPath: if the org folder cannot be listed
+        """
+        if self._scan is not None:
+            return self._scan
         try:
-            # Note get_sub_folders use os.walk, which means that you should not
-            # change the current working dir whilst generating the list of repos
-            return [Repo(subdir, self.path)
-                    for subdir in get_sub_folders(self.path)]
-        except StopIteration:
+            if self.manifest is not None:
+                self._scan = self.manifest.scan(self.path)
+            else:
+                self._scan = scan_repos(self.path)
+        except OSError:
             raise InvalidPath("Unable to search for repos within org {0.name}, "
                               "is path {0.path} correct?".format(self))
+        return self._scan
+
+    def iter_repos(self):
+        """Yields the repos within the organization"""
+        for name in self.scan().repos:
+            yield Repo(name, self.path, self.backend, self.manifest)
+
+    @property
+    def repos(self):
+        """All repos within the organization"""
+        return list(self.iter_repos())
+
+    @property
+    def invalid_folders(self):
+        """Folders within the org that are not git repos"""
+        return [Folder(name, os.path.join(self.path, name))
+                for name in self.scan().invalid]
@@ -1,73 +1,294 @@
 #!/usr/bin/env python
 """"Script to capture github responses
 
-It will scrap the whole github api and save the responses in an python file
+It crawls the github api breadth first from a set of seed users and orgs and
+streams the responses into a hubsync.transport.CaptureStore that can be
+replayed with hubsync.transport.ReplayTransport.
+
+Progress is saved within the output folder, so an interrupted capture can be
+continued by running the same command with --resume.
 """
 from __future__ import unicode_literals
-import logging
 import argparse
-import pickle
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
 import six
 
-from hubsync import sync, github, config as hubsync_config
+from hubsync import github, transport, config as hubsync_config
 
 
 LOG = logging.getLogger('hubsync.scrapper')
 LOG.setLevel(logging.INFO)
 LOG.addHandler(logging.StreamHandler())
 
+PROGRESS_FILE = 'frontier.json'
+
+
+def find_urls(data, base_url):
+    """Returns all api urls within a json document
+
+    Templated urls like .../repos{/owner} are cut before the template
+    """
+    result = []
+    pending = [data]
+    while pending:
+        item = pending.pop()
+        if isinstance(item, dict):
+            pending.extend(item.values())
+        elif isinstance(item, list):
+            pending.extend(item)
+        elif isinstance(item, six.string_types) and item.startswith(base_url):
+            result.append(item.split('{', 1)[0])
+    return result
+
+
+class Frontier(object):
+    """Queue of urls pending to crawl, with the depth they were found at
+
+    Urls are only added once. get blocks until there is work or all the work
+    is done, in which case it returns None.
+    """
+
+    def __init__(self):
+        self._queue = collections.deque()
+        self._in_progress = set()
+        self._seen = set()
+        self._cond = threading.Condition()
+
+    def mark_seen(self, urls):
+        """Marks urls as already crawled"""
+        with self._cond:
+            self._seen.update(urls)
+
+    def put(self, url, depth):
+        """Adds an url to crawl if it was not added before"""
+        with self._cond:
+            if url in self._seen:
+                return
+            self._seen.add(url)
+            self._queue.append((url, depth))
+            self._cond.notify()
+
+    def get(self):
+        """Takes the next url to crawl, None when the crawl is finished"""
+        with self._cond:
+            while not self._queue and self._in_progress:
+                self._cond.wait(1)
+            if not self._queue:
+                self._cond.notify_all()
+                return None
+            item = self._queue.popleft()
+            self._in_progress.add(item)
+            return item
+
+    def retry(self, item):
+        """Puts back an item taken with get so it is crawled again"""
+        with self._cond:
+            self._in_progress.discard(item)
+            self._queue.append(item)
+            self._cond.notify()
+
+    def done(self, item):
+        """Marks an item taken with get as crawled"""
+        with self._cond:
+            self._in_progress.discard(item)
+            self._cond.notify_all()
+
+    def pending(self):
+        """All items not yet crawled, including the ones in progress"""
+        with self._cond:
+            return sorted(self._in_progress) + list(self._queue)
 
-class Scrapper(object):
-    def __init__(self, api, max_depth, interactive=False):
-        """
 
+class Crawler(object):
+    """Concurrent breadth first crawler of the github api"""
+
+    def __init__(self, api, store, max_depth, workers=8, delay=0.0,
+                 min_remaining=100, max_retries=3):
+        """
         :type api: hubsync.github.Api
-        :param max_depth:
-        :return:
+        :type store: hubsync.transport.CaptureStore
+        :param max_depth: depth of urls to follow from the seeds
+        :param workers: number of concurrent requests
+        :param delay: seconds each worker waits between requests
+        :param min_remaining: requests left in the rate limit at which the
+            crawl pauses until the limit resets
+        :param max_retries: attempts for requests failing with server errors
         """
         self.api = api
+        self.store = store
         self.max_depth = max_depth
-        self.res = dict()
-        self.interactive = interactive
+        self.workers = workers
+        self.delay = delay
+        self.min_remaining = min_remaining
+        self.max_retries = max_retries
+        self.frontier = Frontier()
+        self.fetched = 0
+        self._retries = collections.Counter()
+        self._resume_at = 0
+        self._lock = threading.Lock()
+
+    @property
+    def progress_path(self):
+        return os.path.join(self.store.path, PROGRESS_FILE)
+
+    def seed(self, urls):
+        """Adds the urls to start crawling from"""
+        for url in urls:
+            self.frontier.put(url, 0)
+
+    def resume(self):
+        """Continues from the progress saved in the output folder"""
+        self.frontier.mark_seen(url for _, url in
+                                (key.split(' ', 1) for key in self.store.index))
+        if not os.path.exists(self.progress_path):
+            return
+        with open(self.progress_path) as progress_file:
+            pending = json.load(progress_file)
+        LOG.info("Resuming with {} pending urls".format(len(pending)))
+        for url, depth in pending:
+            self.frontier.put(url, depth)
+
+    def save_progress(self):
+        """Saves the pending urls so the crawl can be resumed"""
+        tmp_path = self.progress_path + '.tmp'
+        with open(tmp_path, 'w') as progress_file:
+            json.dump(self.frontier.pending(), progress_file)
+        os.rename(tmp_path, self.progress_path)
+
+    def _wait_rate_limit(self):
+        with self._lock:
+            wait = self._resume_at - time.time()
+        if wait > 0:
+            LOG.info("Waiting {:.0f}s for the rate limit".format(wait))
+            time.sleep(wait)
+
+    def _pause(self, seconds):
+        """Pauses all workers"""
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.time() + seconds)
+
+    def _check_rate_limit(self, response):
+        """Pauses the crawl if the response asks to
 
-    def scrap(self, target, recursion=0):
-        """Scraps an target
+        :return: whether the response can be used or it has to be retried
+        """
+        headers = response.headers
+        if 'Retry-After' in headers:
+            self._pause(int(headers['Retry-After']))
+            return False
+        remaining = headers.get('X-RateLimit-Remaining')
+        if remaining is not None and int(remaining) <= self.min_remaining:
+            self._pause(int(headers['X-RateLimit-Reset']) - time.time())
+            if int(remaining) == 0 and response.status == 403:
+                return False
+        return True
+
+    def _visit(self, item):
+        """Fetches an url and adds the urls found in it to the frontier
 
-        Returns self so you can chain calls
+        :return: whether the url was captured
         """
-        if recursion > self.max_depth:
-            return self
-
-        LOG.debug("[{}] Scrapping {}".format(recursion, target))
-        if isinstance(target, dict):
-            for new_url in target.values():
-                self.scrap(new_url, recursion)
-        if isinstance(target, (list, tuple)):
-            for new_url in target:
-                self.scrap(new_url, recursion)
-        if isinstance(target, six.string_types):
+        url, depth = item
+        self._wait_rate_limit()
+        try:
+            response = self.api.request('GET', url)
+        except requests.RequestException as err:
+            LOG.warning("Failed to get {}: {}".format(url, err))
+            return self._retry(item)
+        if not self._check_rate_limit(response) or response.status >= 500:
+            return self._retry(item)
+        self.store.write('GET', url, response)
+        with self._lock:
+            self.fetched += 1
+        LOG.info("[{}] Parsed {}".format(depth, url))
+
+        # pages of a listing are at the same depth of the listing
+        if 'next' in response.links:
+            self.frontier.put(response.links['next'], depth)
+        if depth >= self.max_depth:
+            return True
+        try:
+            data = response.json()
+        except ValueError:
+            return True
+        for new_url in find_urls(data, self.api.base_url):
+            self.frontier.put(new_url, depth + 1)
+        return True
+
+    def _retry(self, item):
+        with self._lock:
+            self._retries[item] += 1
+            attempts = self._retries[item]
+        if attempts > self.max_retries:
+            LOG.error("Giving up on {}".format(item[0]))
+            return True
+        time.sleep(2 ** attempts * 0.1)
+        return False
+
+    def _work(self):
+        while True:
+            item = self.frontier.get()
+            if item is None:
+                return
+            done = False
             try:
-                target = target[:target.index("{")]
-            except ValueError:
-                pass
-            if target not in self.res and self.api.base_url in target:
-                LOG.info("[{}] Parsed {}".format(recursion, target))
-                try:
-                    data = self.api.get(target)
-                except ValueError:
-                    data = "NOT JSON"
-                question = "Add url {}".format(target)
-                if not self.interactive or sync.input_yesno(question):
-                    self.res[target] = data
-                    self.scrap(data, recursion + 1)
+                done = self._visit(item)
+            finally:
+                if done:
+                    self.frontier.done(item)
+                else:
+                    self.frontier.retry(item)
+            if self.delay:
+                time.sleep(self.delay)
 
+    def crawl(self, save_every=5.0):
+        """Crawls until the frontier is exhausted
+
+        Progress is saved every save_every seconds and when interrupted.
+        """
+        threads = [threading.Thread(target=self._work)
+                   for _ in range(self.workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            alive = threads
+            while alive:
+                alive[0].join(save_every)
+                self.save_progress()
+                alive = [thread for thread in threads if thread.is_alive()]
+        finally:
+            self.save_progress()
+            self.store.close()
+        LOG.info("Captured {} responses".format(self.fetched))
         return self
 
 
+def seed_urls(base_url, orgs, users):
+    """Urls to start the crawl from, the authenticated user by default"""
+    result = []
+    for org in orgs:
+        result.append("{}/orgs/{}".format(base_url, org))
+        result.append("{}/orgs/{}/repos".format(base_url, org))
+    for user in users:
+        result.append("{}/users/{}".format(base_url, user))
+        result.append("{}/users/{}/repos".format(base_url, user))
+    if not result:
+        result = [base_url + '/user', base_url + '/user/orgs']
+    return result
+
+
 def main():
     config = hubsync_config.Config.from_ini_file('~/.hubsyncrc')
     parser = argparse.ArgumentParser(
-        description="Testing tool to get all github responses",
+        description="Testing tool to capture github responses",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
     parser.add_argument('--github_api_url', type=str,
@@ -81,13 +302,26 @@ def main():
     parser.add_argument('--logging', choices=['INFO', 'DEBUG', 'ERROR'],
                         required=False, default='INFO', type=str,
                         help="Logging level of the script")
-    parser.add_argument('--output_file', type=str, required=False,
-                        default='gh_responses.pickle',
-                        help="Out file to save the result")
+    parser.add_argument('--org', action='append', default=[],
+                        help="Organization to start crawling from, can be "
+                             "repeated")
+    parser.add_argument('--user', action='append', default=[],
+                        help="User to start crawling from, can be repeated."
+                             " The authenticated user if no org nor user is"
+                             " given")
+    parser.add_argument('--output_dir', type=str, required=False,
+                        default='gh_responses',
+                        help="Folder to stream the responses into")
     parser.add_argument('--max_depth', type=int, required=False, default=3,
                         help="How deep to go in the scrapping of urls")
-    parser.add_argument('--interactive', default=False, action="store_true",
-                        help="Whether or not to ask for confirmation to save an url")
+    parser.add_argument('--workers', type=int, default=8,
+                        help="Number of concurrent requests")
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help="Seconds each worker waits between requests")
+    parser.add_argument('--min_remaining', type=int, default=100,
+                        help="Pause when the rate limit gets this low")
+    parser.add_argument('--resume', default=False, action="store_true",
+                        help="Continue an interrupted capture in output_dir")
     args = parser.parse_args()
 
     LOG.setLevel(args.logging)
@@ -98,38 +332,14 @@ def main():
     }
 
     api = github.Api(**api_args)
-    scraper = Scrapper(api, args.max_depth, args.interactive)
-    scraper.scrap(api.base_url + '/user/orgs')
-    scraper.max_depth = 0
-    scraper.scrap(api.base_url + '/user')
-    scraper.scrap(api.base_url + '/user/orgs')
-    scraper.scrap(api.base_url + '/orgs/etcaterva')
-    scraper.scrap(api.base_url + '/user')
-    scraper.scrap(api.base_url + '/users/Mariocj89/repos')
-    scraper.scrap(api.base_url + '/repos/Mariocj89/config-files')
-    scraper.scrap(api.base_url + '/repos/Mariocj89/hubsync')
-    scraper.scrap(api.base_url + '/repos/Mariocj89/OnlineWBS')
-    scraper.scrap(api.base_url + '/repos/Mariocj89/price-scraper')
-    scraper.scrap(api.base_url + '/repos/Mariocj89/uni')
-    scraper.scrap(api.base_url + '/repos/Mariocj89/OnlineWBS/forks')
-    scraper.scrap(api.base_url + '/repos/Mariocj89/config-files/forks')
-    scraper.scrap(api.base_url + '/repos/Mariocj89/hubsync/forks')
-    scraper.scrap(api.base_url + '/repos/Mariocj89/price-scraper/forks')
-    scraper.scrap(api.base_url + '/repos/Mariocj89/uni/forks')
-    scraper.scrap(api.base_url + '/orgs/etcaterva/repos')
-    scraper.scrap(api.base_url + '/repos/etcaterva/EtCatervaGroup')
-    scraper.scrap(api.base_url + '/repos/etcaterva/EchaloASuerte')
-    scraper.scrap(api.base_url + '/repos/etcaterva/EtCaterva-Ansible')
-    scraper.scrap(api.base_url + '/repos/etcaterva/Echaloasuerte_legacy')
-    scraper.scrap(api.base_url + '/repos/etcaterva/Echaloasuerte-android')
-    scraper.scrap(api.base_url + '/repos/etcaterva/EchaloASuerte/forks')
-    scraper.scrap(api.base_url + '/repos/etcaterva/Echaloasuerte-android/forks')
-    scraper.scrap(api.base_url + '/repos/etcaterva/Echaloasuerte_legacy/forks')
-    scraper.scrap(api.base_url + '/repos/etcaterva/EtCaterva-Ansible/forks')
-    scraper.scrap(api.base_url + '/repos/etcaterva/EtCatervaGroup/forks')
-
-    with open(args.output_file, 'wb') as output:
-        pickle.dump(scraper.res, output, 1)
+    store = transport.CaptureStore(args.output_dir)
+    crawler = Crawler(api, store, args.max_depth, args.workers, args.delay,
+                      args.min_remaining)
+    if args.resume:
+        crawler.resume()
+    else:
+        crawler.seed(seed_urls(api.base_url, args.org, args.user))
+    crawler.crawl()
 
 
 if __name__ == "__main__":
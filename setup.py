@@ -10,9 +10,12 @@ setup(
     author_email='mariocj89@gmail.com',
     url='https://github.com/Mariocj89/hubsync',
     keywords=['github', 'sync', 'workspace'],
-    scripts=['bin/hubsync'],
+    entry_points={'console_scripts': ['hubsync = hubsync.cli:main']},
     test_suite='nose.collector',
     use_2to3=True,
-    install_requires=['gitpython', 'requests', 'six'],
+    install_requires=['gitpython', 'requests', 'six',
+                      'scandir; python_version < "3.5"',
+                      'futures; python_version < "3.2"'],
+    extras_require={'pygit2': ['pygit2']},
     tests_require=['mock']
 )
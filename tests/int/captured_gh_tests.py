@@ -4,11 +4,11 @@ import os
 import shutil
 import unittest
 import subprocess
-import pickle
 import git
 
 import mock
 from hubsync import sync, github, workspace, config as hs_conifg
+from hubsync.transport import CaptureStore, ReplayTransport
 
 DIR = os.path.dirname(os.path.realpath(__file__))
 
@@ -32,7 +32,9 @@ class RecordedGithubTestCase(unittest.TestCase):
         self.path = self.path.decode()
         print("Running tests in {}".format(self.path))
 
-        self.gh_api = github.Api(api_url=self.base_url, user_token='')
+        self.store = CaptureStore(os.path.join(DIR, "gh_responses"))
+        self.gh_api = github.Api(api_url=self.base_url, user_token='',
+                                 transport=ReplayTransport(self.store))
         self.ws = workspace.Workspace(self.path)
 
         self.config = hs_conifg.Config()
@@ -40,25 +42,18 @@ class RecordedGithubTestCase(unittest.TestCase):
         self.config.glob.sync_user = False
         self.config.glob.fork_repos = False
 
-        with open(os.path.join(DIR, "gh_responses.pickle"), "rb") as pickled_file:
-            responses = pickle.load(pickled_file)
-
-        def faked_req(key):
-            return responses[key]
-        self.gh_api.get = faked_req
-        self.gh_api.post = faked_req
-
         self.syncer = sync.SyncHelper(self.gh_api, self.config)
 
-        self.clone_patcher = mock.patch('hubsync.sync.git.Repo.clone_from')
+        self.clone_patcher = mock.patch('git.Repo.clone_from')
         self.clone_patcher.start().side_effect = fake_clone
 
-        self.fetch_patcher = mock.patch('hubsync.workspace.git')
+        self.fetch_patcher = mock.patch('hubsync.gitbackend.GitPythonRepo')
         self.fetch_patcher.start()
 
     def tearDown(self):
         self.clone_patcher.stop()
         self.fetch_patcher.stop()
+        self.store.close()
         shutil.rmtree(self.path)
 
     def test_sanity(self):
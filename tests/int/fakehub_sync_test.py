@@ -0,0 +1,450 @@
+"""End to end tests syncing against the fake github with real git repos"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from hubsync import (sync, github, journal, mirror, workspace,
+                     config as hs_config)
+from hubsync.fakehub import Dataset, FakeGithub
+from hubsync.forks import ForkQueue
+from hubsync.gitbackend import GitPythonRepo, run_git
+
+
+class FakehubSyncTestCase(unittest.TestCase):
+    """Syncs a workspace in a temp folder with repos served from local
+    bare repositories"""
+
+    def add_repo(self, owner, name, **metadata):
+        """Creates a bare repo with a commit and adds it to the dataset"""
+        path = os.path.join(self.remotes, owner, name + '.git')
+        work = os.path.join(self.tmp, 'work')
+        run_git(self.tmp, 'init', '-q', work)
+        run_git(work, '-c', 'user.name=test', '-c', 'user.email=test@test',
+                'commit', '--allow-empty', '-q', '-m', 'initial')
+        run_git(work, 'branch', '-q', '-M', 'master')
+        run_git(self.tmp, 'clone', '-q', '--bare', work, path)
+        shutil.rmtree(work)
+        return self.dataset.add_repo(owner, name, ssh_url=path, **metadata)
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.remotes = os.path.join(self.tmp, 'remotes')
+        self.path = os.path.join(self.tmp, 'ws')
+        os.makedirs(self.path)
+        self.dataset = Dataset('hubsync')
+        self.dataset.add_org('org0')
+        self.add_repo('org0', 'repo0')
+        self.add_repo('org0', 'repo1')
+        self.server = FakeGithub(self.dataset).start()
+        self.config = hs_config.Config()
+        self.config.glob.interactive = False
+        self.config.glob.sync_user = False
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def run_sync(self, manifest=True):
+        api = github.Api(self.server.url, self.server.token)
+        ws = workspace.Workspace(self.path, manifest=workspace.Manifest(
+            os.path.join(self.path, '.hubsync_manifest.json'))
+            if manifest else None)
+        helper = sync.SyncHelper(api, self.config)
+        helper.sync(ws, api)
+        helper.trash.wait()
+        return ws
+
+    def test_clones_and_records_manifest(self):
+        ws = self.run_sync()
+        self.assertEqual(['repo0', 'repo1'], sorted(os.listdir(
+            os.path.join(self.path, 'org0'))))
+        repo_path = os.path.join(self.path, 'org0', 'repo0')
+        entry = workspace.Manifest(ws.manifest.path).repo(repo_path)
+        self.assertEqual(self.dataset.repos[('org0', 'repo0')]['id'],
+                         entry['id'])
+        self.assertEqual('org0/repo0', entry['full_name'])
+        self.assertEqual(run_git(repo_path, 'rev-parse', 'HEAD').strip(),
+                         entry['shas']['HEAD'])
+        self.assertEqual('nopush', run_git(
+            repo_path, 'config', 'remote.origin.pushurl').strip())
+
+    def test_second_run_skips_remotes_config(self):
+        self.run_sync()
+        with mock.patch.object(GitPythonRepo, 'create_remote') as create, \
+                mock.patch.object(GitPythonRepo,
+                                  'set_remote_config') as set_config:
+            self.run_sync()
+        self.assertFalse(create.called)
+        self.assertFalse(set_config.called)
+
+    def test_remote_deleted_within_git_is_created_again(self):
+        self.run_sync()
+        repo_path = os.path.join(self.path, 'org0', 'repo0')
+        url = run_git(repo_path, 'remote', 'get-url', 'origin').strip()
+        run_git(repo_path, 'remote', 'remove', 'origin')
+        self.run_sync()
+        self.assertEqual(url, run_git(repo_path, 'remote', 'get-url',
+                                      'origin').strip())
+
+    def test_sync_without_manifest(self):
+        self.run_sync(manifest=False)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.path, '.hubsync_manifest.json')))
+        self.assertEqual(['repo0', 'repo1'], sorted(os.listdir(
+            os.path.join(self.path, 'org0'))))
+
+    def move_repo(self, owner, name, new_owner, new_name):
+        """Renames or transfers a repo in the dataset, moving its remote"""
+        old_data = self.dataset.repos[(owner, name)]
+        new_url = os.path.join(self.remotes, new_owner, new_name + '.git')
+        os.renames(old_data['ssh_url'], new_url)
+        data = self.dataset.move_repo(owner, name, new_owner, new_name)
+        data['ssh_url'] = new_url
+
+    def test_renamed_repo_is_moved(self):
+        self.run_sync()
+        old_path = os.path.join(self.path, 'org0', 'repo0')
+        run_git(old_path, 'branch', 'feature')
+        self.move_repo('org0', 'repo0', 'org0', 'renamed')
+        ws = self.run_sync()
+        new_path = os.path.join(self.path, 'org0', 'renamed')
+        self.assertEqual(['renamed', 'repo1'], sorted(os.listdir(
+            os.path.join(self.path, 'org0'))))
+        self.assertIn('feature', run_git(new_path, 'branch'))
+        self.assertEqual(self.dataset.repos[('org0', 'renamed')]['ssh_url'],
+                         run_git(new_path, 'remote', 'get-url',
+                                 'origin').strip())
+        manifest = workspace.Manifest(ws.manifest.path)
+        self.assertIsNone(manifest.repo(old_path))
+        self.assertEqual('org0/renamed', manifest.repo(new_path)['full_name'])
+
+    def test_transferred_repo_is_moved(self):
+        self.dataset.add_org('org1')
+        self.run_sync()
+        self.move_repo('org0', 'repo0', 'org1', 'repo0')
+        with mock.patch('hubsync.sync.input_yesno') as input_yesno:
+            self.config.glob.interactive = True
+            self.run_sync()
+        self.assertFalse(input_yesno.called)
+        self.assertEqual(['repo1'], os.listdir(
+            os.path.join(self.path, 'org0')))
+        self.assertEqual(['repo0'], os.listdir(
+            os.path.join(self.path, 'org1')))
+
+    def test_deleted_repo_is_removed(self):
+        self.run_sync()
+        del self.dataset.repos[('org0', 'repo0')]
+        self.config.glob.interactive = True
+        with mock.patch('hubsync.sync.input_yesno', return_value=True):
+            self.run_sync()
+        self.assertEqual(['repo1'], os.listdir(
+            os.path.join(self.path, 'org0')))
+
+    def test_removals_are_reviewed_together_at_the_end(self):
+        self.dataset.add_org('org1')
+        self.add_repo('org1', 'repo0')
+        self.run_sync()
+        del self.dataset.repos[('org0', 'repo0')]
+        del self.dataset.repos[('org1', 'repo0')]
+        self.config.glob.interactive = True
+        with mock.patch('hubsync.sync.input_yesno',
+                        return_value=True) as input_yesno:
+            self.run_sync()
+        input_yesno.assert_called_once_with("Delete all of them?", "no")
+        self.assertEqual([], os.listdir(os.path.join(self.path, 'org1')))
+        self.assertEqual([], os.listdir(
+            os.path.join(self.path, '.hubsync_trash')))
+        manifest = workspace.Manifest(
+            os.path.join(self.path, '.hubsync_manifest.json'))
+        self.assertIsNone(manifest.repo(
+            os.path.join(self.path, 'org0', 'repo0')))
+
+    def test_removals_are_kept_if_not_interactive(self):
+        self.run_sync()
+        del self.dataset.repos[('org0', 'repo0')]
+        self.run_sync()
+        self.assertEqual(['repo0', 'repo1'], sorted(os.listdir(
+            os.path.join(self.path, 'org0'))))
+
+    def test_orgs_are_synced_with_and_without_prefetch(self):
+        self.dataset.add_org('org1')
+        self.add_repo('org1', 'repo0')
+        for prefetch in (1, 0):
+            shutil.rmtree(self.path)
+            os.makedirs(self.path)
+            self.config.glob.prefetch = prefetch
+            self.run_sync()
+            self.assertEqual(['repo0', 'repo1'], sorted(os.listdir(
+                os.path.join(self.path, 'org0'))))
+            self.assertEqual(['repo0'], os.listdir(
+                os.path.join(self.path, 'org1')))
+
+    def test_filters_skip_repos_and_orgs(self):
+        self.add_repo('org0', 'old', archived=True)
+        self.dataset.add_org('org1')
+        self.add_repo('org1', 'repo0')
+        self.config.filters.archived = False
+        self.config.filters.exclude_orgs = 'org1'
+        self.run_sync()
+        self.assertEqual(['org0'], sorted(
+            name for name in os.listdir(self.path) if not name.startswith('.')))
+        self.assertEqual(['repo0', 'repo1'], sorted(os.listdir(
+            os.path.join(self.path, 'org0'))))
+        repos_requested = [path for _, path in self.server.requests
+                           if path.startswith('/repos/')]
+        self.assertEqual([], repos_requested)
+
+    def test_skipped_local_repo_is_not_removed(self):
+        self.run_sync()
+        self.dataset.repos[('org0', 'repo1')]['archived'] = True
+        self.config.filters.archived = False
+        self.config.filters.exclude = 'repo0'
+        self.config.glob.interactive = True
+        with mock.patch('hubsync.sync.input_yesno') as input_yesno:
+            self.run_sync()
+        self.assertFalse(input_yesno.called)
+        self.assertEqual(['repo0', 'repo1'], sorted(os.listdir(
+            os.path.join(self.path, 'org0'))))
+
+    def test_forks_are_configured_once_created(self):
+        self.server.fork_delay = 0.2
+        self.config.glob.fork_repos = True
+        api = github.Api(self.server.url, self.server.token)
+        ws = workspace.Workspace(self.path, manifest=workspace.Manifest(
+            os.path.join(self.path, '.hubsync_manifest.json')))
+        helper = sync.SyncHelper(api, self.config)
+        helper.fork_queue = ForkQueue(api, post_interval=0,
+                                      poll_interval=0.05)
+        helper.sync(ws, api)
+
+        repo_path = os.path.join(self.path, 'org0', 'repo0')
+        fork = self.dataset.repos[('hubsync', 'repo0')]
+        self.assertEqual(fork['ssh_url'], run_git(
+            repo_path, 'remote', 'get-url', 'fork').strip())
+        self.assertIn('fork/master', run_git(repo_path, 'branch', '-r'))
+        entry = workspace.Manifest(ws.manifest.path).repo(repo_path)
+        self.assertEqual(fork['ssh_url'], entry['remotes']['fork'])
+
+    def test_forks_not_available_are_reported(self):
+        self.server.fork_delay = 60
+        self.config.glob.fork_repos = True
+        api = github.Api(self.server.url, self.server.token)
+        ws = workspace.Workspace(self.path)
+        helper = sync.SyncHelper(api, self.config)
+        helper.fork_queue = ForkQueue(api, post_interval=0,
+                                      poll_interval=0.05, timeout=0.1)
+        helper.sync(ws, api)
+
+        self.assertEqual(2, helper.metrics.counters['forks.failed'])
+        self.assertNotIn('fork', run_git(
+            os.path.join(self.path, 'org0', 'repo0'), 'remote').split())
+
+    def test_fetch_policy_narrows_and_prunes(self):
+        origin = self.dataset.repos[('org0', 'repo0')]['ssh_url']
+        for branch in ('feature', 'release/1.0'):
+            run_git(origin, 'branch', branch)
+        self.run_sync()
+        repo_path = os.path.join(self.path, 'org0', 'repo0')
+        self.assertIn('origin/feature', run_git(repo_path, 'branch', '-r'))
+
+        self.config.fetch_policies.append(('org0/repo0',
+                                           {'branches': 'release/*',
+                                            'prune': True}))
+        run_git(origin, 'branch', 'release/2.0')
+        ws = self.run_sync()
+        remote_branches = run_git(repo_path, 'branch', '-r')
+        self.assertNotIn('origin/feature', remote_branches)
+        self.assertIn('origin/release/2.0', remote_branches)
+        self.assertIn('origin/master', remote_branches)
+        entry = workspace.Manifest(ws.manifest.path).repo(repo_path)
+        self.assertEqual(
+            ['+refs/heads/master:refs/remotes/origin/master',
+             '+refs/heads/release/*:refs/remotes/origin/release/*'],
+            entry['fetch']['origin'])
+        # the other repos keep fetching all branches
+        self.assertEqual('+refs/heads/*:refs/remotes/origin/*', run_git(
+            os.path.join(self.path, 'org0', 'repo1'), 'config',
+            'remote.origin.fetch').strip())
+
+    def test_narrow_policy_clones_default_branch_only(self):
+        origin = self.dataset.repos[('org0', 'repo0')]['ssh_url']
+        run_git(origin, 'branch', 'feature')
+        self.config.fetch.branches = 'default-branch-only'
+        self.run_sync()
+        repo_path = os.path.join(self.path, 'org0', 'repo0')
+        self.assertNotIn('feature', run_git(repo_path, 'branch', '-r'))
+        self.assertEqual('+refs/heads/master:refs/remotes/upstream/master',
+                         run_git(repo_path, 'config',
+                                 'remote.upstream.fetch').strip())
+
+    def test_clones_and_fetches_from_fresh_mirror(self):
+        github_repo = github.Repo.from_data(None, dict(
+            self.dataset.repos[('org0', 'repo0')], owner={'login': 'org0'},
+            forks_url=''))
+        repo_mirror = mirror.Mirror(os.path.join(self.tmp, 'mirrors'))
+        repo_mirror.update(github_repo)
+        self.config.mirror.path = repo_mirror.path
+        self.run_sync()
+
+        repo_path = os.path.join(self.path, 'org0', 'repo0')
+        self.assertEqual(repo_mirror.repo_path(github_repo), run_git(
+            repo_path, 'remote', 'get-url', 'upstream').strip())
+        self.assertEqual(github_repo.url, run_git(
+            repo_path, 'remote', 'get-url', '--push', 'upstream').strip())
+        self.assertEqual('nopush', run_git(
+            repo_path, 'config', 'remote.origin.pushurl').strip())
+        # repo1 has no mirror, it is fetched from github
+        self.assertEqual(
+            self.dataset.repos[('org0', 'repo1')]['ssh_url'],
+            run_git(os.path.join(self.path, 'org0', 'repo1'), 'remote',
+                    'get-url', 'origin').strip())
+
+        # a push to github after the mirror was updated makes it stale
+        self.dataset.repos[('org0', 'repo0')]['pushed_at'] = \
+            '2100-01-01T00:00:00Z'
+        new_sha = self.add_commit(github_repo.url)
+        self.run_sync()
+        self.assertEqual(github_repo.url, run_git(
+            repo_path, 'remote', 'get-url', 'origin').strip())
+        self.assertEqual(new_sha, run_git(repo_path, 'rev-parse',
+                                          'origin/master').strip())
+
+    def test_failed_repo_does_not_stop_the_sync(self):
+        # github lists it but its remote is gone
+        shutil.rmtree(self.dataset.repos[('org0', 'repo0')]['ssh_url'])
+        api = github.Api(self.server.url, self.server.token)
+        helper = sync.SyncHelper(api, self.config)
+        helper.sync(workspace.Workspace(self.path), api)
+        self.assertEqual(['org0/repo0'], helper.failed)
+        self.assertEqual(1, helper.metrics.counters['repos.failed'])
+        # the partial clone is removed, the next sync clones it again
+        self.assertEqual(['repo1'], os.listdir(os.path.join(self.path,
+                                                            'org0')))
+
+    def test_interrupted_sync_is_resumed(self):
+        self.add_repo('org0', 'repo2')
+        sync_journal = journal.Journal(os.path.join(self.path,
+                                                    '.hubsync_journal'))
+        api = github.Api(self.server.url, self.server.token)
+        ws = workspace.Workspace(self.path)
+        original = sync.SyncHelper.sync_repo
+        synced = []
+
+        def sync_repo(helper, local_repo, github_repo):
+            if github_repo.name == 'repo1' and 'interrupted' not in synced:
+                # leave repo2 as if the clone was killed halfway
+                half_clone = os.path.join(self.path, 'org0', 'repo2')
+                sync_journal.start('clone', half_clone)
+                os.makedirs(os.path.join(half_clone, '.git'))
+                synced.append('interrupted')
+                raise KeyboardInterrupt()
+            synced.append(github_repo.name)
+            original(helper, local_repo, github_repo)
+
+        with mock.patch.object(sync.SyncHelper, 'sync_repo', sync_repo):
+            sync_journal.open()
+            with self.assertRaises(KeyboardInterrupt):
+                sync.SyncHelper(api, self.config, sync_journal).sync(ws, api)
+            sync_journal.close(completed=False)
+            self.assertEqual(['repo0', 'interrupted'], synced)
+
+            sync_journal = journal.Journal(sync_journal.path)
+            sync_journal.open(resume=True)
+            sync.SyncHelper(api, self.config, sync_journal).sync(ws, api)
+            sync_journal.close(completed=True)
+        self.assertEqual(['repo0', 'interrupted', 'repo1', 'repo2'], synced)
+        self.assertIn('master', run_git(os.path.join(
+            self.path, 'org0', 'repo2'), 'branch'))
+        self.assertFalse(os.path.exists(sync_journal.path))
+
+    def add_commit(self, bare_path):
+        """Pushes a new commit to the master branch of a bare repo"""
+        work = os.path.join(self.tmp, 'work')
+        run_git(self.tmp, 'clone', '-q', bare_path, work)
+        run_git(work, '-c', 'user.name=test', '-c', 'user.email=test@test',
+                'commit', '--allow-empty', '-q', '-m', 'new')
+        run_git(work, 'push', '-q', 'origin', 'master')
+        shutil.rmtree(work)
+        return run_git(bare_path, 'rev-parse', 'master').strip()
+
+    def sync_with_fork(self):
+        """Syncs twice updating forks, with a new commit in origin between
+
+        :return: sha of the new commit and path of the bare repo of the fork
+        """
+        origin = self.dataset.repos[('org0', 'repo0')]
+        fork_path = os.path.join(self.remotes, 'hubsync', 'repo0.git')
+        run_git(self.tmp, 'clone', '-q', '--bare', origin['ssh_url'],
+                fork_path)
+        self.dataset.add_fork(origin, 'hubsync')['ssh_url'] = fork_path
+        self.config.glob.fork_repos = True
+        self.config.glob.update_forks = True
+        self.run_sync()
+        return self.add_commit(origin['ssh_url']), fork_path
+
+    def test_forks_are_updated_by_github(self):
+        new_sha, fork_path = self.sync_with_fork()
+        self.run_sync()
+        self.assertIn(('hubsync/repo0', 'master'), self.server.merged)
+        # github moves the fork, nothing is pushed from the workspace
+        self.assertNotEqual(new_sha, run_git(fork_path, 'rev-parse',
+                                             'master').strip())
+
+    def test_conflicting_forks_are_pushed(self):
+        new_sha, fork_path = self.sync_with_fork()
+        self.server.merge_conflicts.add('hubsync/repo0')
+        self.run_sync()
+        self.assertNotIn(('hubsync/repo0', 'master'), self.server.merged)
+        self.assertEqual(new_sha, run_git(fork_path, 'rev-parse',
+                                          'master').strip())
+
+    def test_failed_fork_updates_are_reported(self):
+        self.sync_with_fork()
+        # a fork remote pointing to a repo github does not have
+        run_git(os.path.join(self.path, 'org0', 'repo0'), 'remote',
+                'set-url', 'fork', os.path.join(self.remotes, 'nobody',
+                                                'repo0.git'))
+        api = github.Api(self.server.url, self.server.token)
+        helper = sync.SyncHelper(api, self.config)
+        helper.sync(workspace.Workspace(self.path), api)
+        self.assertEqual([], self.server.merged)
+        self.assertEqual(1, helper.metrics.counters['forks.update_failed'])
+
+    def test_repo_policies_skip_and_fetch_only(self):
+        self.config.repo_sections = [('org0/repo1', {'mode': 'skip'})]
+        self.run_sync()
+        self.assertEqual(['repo0'], sorted(
+            name for name in os.listdir(os.path.join(self.path, 'org0'))))
+        old_sha = run_git(os.path.join(self.path, 'org0', 'repo0'),
+                          'rev-parse', 'master').strip()
+        new_sha = self.add_commit(
+            self.dataset.repos[('org0', 'repo0')]['ssh_url'])
+        self.config.repo_sections.append(('repo0', {'mode': 'fetch-only'}))
+        self.run_sync()
+        local = os.path.join(self.path, 'org0', 'repo0')
+        # the remotes are fetched but the local branch is left alone
+        self.assertEqual(new_sha, run_git(local, 'rev-parse',
+                                          'origin/master').strip())
+        self.assertEqual(old_sha, run_git(local, 'rev-parse',
+                                          'master').strip())
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'org0',
+                                                     'repo1')))
+
+    def test_repos_synced_within_their_interval_are_skipped(self):
+        self.config.repo_sections = [('repo0', {'interval': '1h'})]
+        self.run_sync()
+        for name in ('repo0', 'repo1'):
+            self.add_commit(self.dataset.repos[('org0', name)]['ssh_url'])
+        self.run_sync()
+        for name, updated in (('repo0', False), ('repo1', True)):
+            bare = self.dataset.repos[('org0', name)]['ssh_url']
+            self.assertEqual(updated, run_git(bare, 'rev-parse', 'master') ==
+                             run_git(os.path.join(self.path, 'org0', name),
+                                     'rev-parse', 'origin/master'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -57,6 +57,11 @@ class SanityTestCase(unittest.TestCase):
         self.config.glob.sync_user = False
         self.config.glob.fork_repos = False
         self.syncer = sync.SyncHelper(self.gh_api, self.config)
+        # listings go through the Api.get patched by each test
+        patcher = mock.patch('hubsync.github.Api.iter_get',
+                             lambda api, url: iter(api.get(url)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     def tearDown(self):
         shutil.rmtree(self.path)
@@ -81,12 +86,10 @@ class SanityTestCase(unittest.TestCase):
         org_name = 'sample_org'
         api_get.side_effect = gb_api_mock({
             'orgs': [defaultdict(str, {
-                'url': 'org_url'
-            })],
-            'org_url': defaultdict(str, {
+                'url': 'org_url',
                 'login': org_name,
                 'repos_url': 'repos_url'
-            }),
+            })],
             'repos_url': []
         }, {})
         self._create_local_org(org_name)
@@ -112,21 +115,16 @@ class SanityTestCase(unittest.TestCase):
                 'repos_url': 'user/repos_url'
             }),
             'orgs': [defaultdict(str, {
-                'url': 'org_url'
-            })],
-            'org_url': defaultdict(str, {
+                'url': 'org_url',
                 'login': org_name,
                 'repos_url': 'repos_url'
-            }),
-            'repos_url': [defaultdict(str, {
-                'url': 'repo_url'
             })],
-            'repo_url': defaultdict(str, {
+            'repos_url': [defaultdict(str, {
                 'owner': {
                     'login': org_name
                 },
                 'name': repo_name
-            })
+            })]
         }, {})
         self._create_local_org(org_name)
 
@@ -195,12 +193,10 @@ class SanityTestCase(unittest.TestCase):
         org_name = 'sample_org'
         api_get.side_effect = gb_api_mock({
             'orgs': [defaultdict(str, {
-                'url': 'org_url'
-            })],
-            'org_url': defaultdict(str, {
+                'url': 'org_url',
                 'login': org_name,
                 'repos_url': 'repos_url'
-            }),
+            })],
             'repos_url': []
         }, {})
         self.config.org.pre = "touch test.pre"
@@ -219,3 +215,24 @@ class SanityTestCase(unittest.TestCase):
         self.assertEqual(['test.post'], org_tree[1])
         # one file
         self.assertEqual(['test.pre'], org_tree[2])
+
+    @mock.patch('hubsync.github.Api.get')
+    def test_non_git_folder_is_ignored(self, api_get):
+        """Test a folder that is not a repo does not abort the org sync"""
+        org_name = 'sample_org'
+        api_get.side_effect = gb_api_mock({
+            'orgs': [defaultdict(str, {
+                'url': 'org_url',
+                'login': org_name,
+                'repos_url': 'repos_url'
+            })],
+            'repos_url': []
+        }, {})
+        self._create_local_org(org_name)
+        os.makedirs(os.path.join(self.path, org_name, 'notes'))
+
+        self.syncer.sync(self.ws, self.gh_api)
+
+        file_tree = os.walk(self.path)
+        next(file_tree)
+        self.assertEqual(['notes'], next(file_tree)[1])
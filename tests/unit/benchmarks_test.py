@@ -0,0 +1,32 @@
+"""Tests for the benchmark helpers"""
+import unittest
+
+from benchmarks import common, memory
+
+
+class CompareTestCase(unittest.TestCase):
+    def test_slower_than_threshold_is_regression(self):
+        comparison = common.compare({'a[1]': 1.0}, {'a[1]': 1.5}, 0.25)
+        self.assertEqual([('a[1]', 1.0, 1.5, 1.5, True)], comparison)
+
+    def test_within_threshold_is_not_regression(self):
+        comparison = common.compare({'a[1]': 1.0}, {'a[1]': 1.2}, 0.25)
+        self.assertFalse(comparison[0][-1])
+
+    def test_missing_baseline_is_not_regression(self):
+        comparison = common.compare({}, {'a[1]': 1.0})
+        self.assertEqual([('a[1]', None, 1.0, None, False)], comparison)
+
+    def test_best_time_returns_time_per_call(self):
+        self.assertLess(common.best_time(lambda: None, repeat=2,
+                                         min_time=0.001), 0.001)
+
+
+class MemoryTestCase(unittest.TestCase):
+    def test_sync_memory_does_not_grow_with_the_repos(self):
+        small, big = memory.measure(100), memory.measure(5000)
+        self.assertLess(big, small * 1.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+"""Module with the same name tests"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import mock
+import six
+
+from hubsync import cli
+from hubsync.gitbackend import run_git
+from hubsync.fakehub import Dataset, FakeGithub
+
+
+class CliTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.ws_path = os.path.join(self.tmp, 'ws')
+        os.makedirs(self.ws_path)
+        self.config_path = os.path.join(self.tmp, 'hubsyncrc')
+        dataset = Dataset.generate(orgs=1, repos_per_org=0, user_repos=0)
+        self.server = FakeGithub(dataset).start()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def write_config(self, token):
+        with open(self.config_path, 'w') as config_file:
+            config_file.write("[global]\nsync_user: false\n"
+                              "[github]\ntoken: {}\napi_url: {}\n"
+                              "[workspace]\npath: {}\n"
+                              .format(token, self.server.url, self.ws_path))
+
+    def test_default_command(self):
+        self.assertEqual(['sync'], cli.with_default_command([]))
+        self.assertEqual(['sync', '--ws_path', 'x'],
+                         cli.with_default_command(['--ws_path', 'x']))
+        self.assertEqual(['--help'], cli.with_default_command(['--help']))
+        self.assertEqual(['sync', '-h'], cli.with_default_command(['sync',
+                                                                   '-h']))
+
+    def test_help_does_not_import_heavy_modules(self):
+        code = ("import sys\n"
+                "from hubsync import cli\n"
+                "try:\n"
+                "    cli.main(['sync', '--help'])\n"
+                "except SystemExit:\n"
+                "    pass\n"
+                "print(sorted(m for m in ('git', 'requests', 'hubsync.sync')"
+                " if m in sys.modules))\n")
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(b'[]', output.splitlines()[-1].strip())
+
+    def test_missing_token(self):
+        with open(self.config_path, 'w') as config_file:
+            config_file.write("[workspace]\npath: {}\n".format(self.ws_path))
+        with self.assertRaises(SystemExit):
+            cli.main(['--config', self.config_path])
+
+    def test_sync_reads_config(self):
+        self.write_config(self.server.token)
+        self.assertEqual(0, cli.main(['sync', '--config', self.config_path]))
+        self.assertEqual(['org0'], os.listdir(self.ws_path))
+        self.assertEqual('/user/orgs', self.server.requests[0][1])
+
+    def test_sync_writes_metrics(self):
+        self.write_config(self.server.token)
+        metrics_path = os.path.join(self.tmp, 'metrics.json')
+        self.assertEqual(0, cli.main(['sync', '--config', self.config_path,
+                                      '--metrics', metrics_path]))
+        with open(metrics_path) as metrics_file:
+            metrics = json.load(metrics_file)
+        self.assertEqual(1, metrics['timings']['sync']['count'])
+        self.assertIn('ssh.multiplexing', metrics['values'])
+
+    def test_sync_waits_for_the_deletions(self):
+        self.write_config(self.server.token)
+        left = os.path.join(self.ws_path, '.hubsync_trash', 'repo-1')
+        os.makedirs(left)
+        deleted = []
+
+        def slow_rmtree(path, ignore_errors):
+            if path == left:
+                time.sleep(1)
+            deleted.append(path)
+        with mock.patch('hubsync.removals.shutil.rmtree',
+                        side_effect=slow_rmtree), \
+                mock.patch('sys.stdout', new_callable=six.StringIO) as stdout:
+            self.assertEqual(0, cli.main(['sync', '--config',
+                                          self.config_path]))
+            self.assertIn(left, deleted)
+        self.assertIn('Waiting for the removed folders to be deleted',
+                      stdout.getvalue())
+
+    def test_sync_multiple_hosts(self):
+        corp = FakeGithub(Dataset.generate(orgs=2, repos_per_org=0,
+                                           user_repos=0)).start()
+        self.addCleanup(corp.stop)
+        with open(self.config_path, 'w') as config_file:
+            config_file.write(
+                "[global]\nsync_user: false\n"
+                "[github:com]\ntoken: {}\napi_url: {}\n"
+                "[github:corp]\ntoken: {}\napi_url: {}\npath: work\n"
+                "[workspace]\npath: {}\n".format(
+                    self.server.token, self.server.url, corp.token, corp.url,
+                    self.ws_path))
+        with mock.patch('sys.stdout', new_callable=six.StringIO) as stdout:
+            self.assertEqual(0, cli.main(['sync', '--config',
+                                          self.config_path]))
+        self.assertEqual(['com', 'work'], sorted(os.listdir(self.ws_path)))
+        self.assertEqual(['org0', 'org1'], sorted(
+            os.listdir(os.path.join(self.ws_path, 'work'))))
+        self.assertIn('2 hosts synced, 0 failed', stdout.getvalue())
+
+    def test_mirror_requires_a_path(self):
+        self.write_config(self.server.token)
+        with self.assertRaises(SystemExit):
+            cli.main(['mirror', '--config', self.config_path])
+        mirror_path = os.path.join(self.tmp, 'mirrors')
+        with mock.patch('sys.stdout', new_callable=six.StringIO) as stdout:
+            self.assertEqual(0, cli.main(['mirror', '--config',
+                                          self.config_path, '--mirror_path',
+                                          mirror_path]))
+        self.assertIn('0 mirrors updated', stdout.getvalue())
+
+    def test_status_does_not_use_the_network(self):
+        self.write_config(self.server.token)
+        run_git(self.ws_path, 'init', '-q', os.path.join('org0', 'repo0'))
+        with mock.patch('sys.stdout', new_callable=six.StringIO) as stdout:
+            self.assertEqual(0, cli.main(['status', '--json', '--config',
+                                          self.config_path]))
+        self.assertEqual(['repo0'], [item['name'] for item in
+                                     json.loads(stdout.getvalue())])
+        self.assertEqual([], self.server.requests)
+
+    def test_maintain_does_not_use_the_network(self):
+        self.write_config(self.server.token)
+        repo_path = os.path.join(self.ws_path, 'org0', 'repo0')
+        run_git(self.ws_path, 'init', '-q', repo_path)
+        with mock.patch('sys.stdout', new_callable=six.StringIO) as stdout:
+            self.assertEqual(0, cli.main(['maintain', '--config',
+                                          self.config_path]))
+        self.assertIn('org0/repo0', stdout.getvalue())
+        self.assertEqual([], self.server.requests)
+
+    def write_hosts_config(self):
+        with open(self.config_path, 'w') as config_file:
+            config_file.write(
+                "[github:com]\ntoken: a\napi_url: {}\n"
+                "[github:corp]\ntoken: b\napi_url: {}\npath: work\n"
+                "[workspace]\npath: {}\n".format(
+                    self.server.url, self.server.url, self.ws_path))
+
+    def test_status_of_each_host(self):
+        self.write_hosts_config()
+        run_git(self.ws_path, 'init', '-q',
+                os.path.join('com', 'org0', 'repo0'))
+        run_git(self.ws_path, 'init', '-q',
+                os.path.join('work', 'org1', 'repo1'))
+        with mock.patch('sys.stdout', new_callable=six.StringIO) as stdout:
+            self.assertEqual(0, cli.main(['status', '--json', '--config',
+                                          self.config_path]))
+        self.assertEqual([('com/org0', 'repo0'), ('corp/org1', 'repo1')],
+                         [(item['org'], item['name']) for item in
+                          json.loads(stdout.getvalue())])
+
+    def test_maintain_each_host(self):
+        self.write_hosts_config()
+        run_git(self.ws_path, 'init', '-q',
+                os.path.join('work', 'org1', 'repo1'))
+        with mock.patch('sys.stdout', new_callable=six.StringIO) as stdout:
+            self.assertEqual(0, cli.main(['maintain', '--force', '--config',
+                                          self.config_path]))
+        self.assertIn("Maintaining the repos of '{}'".format(
+            os.path.join(self.ws_path, 'work')), stdout.getvalue())
+        self.assertIn('org1/repo1', stdout.getvalue())
+        self.assertEqual([], self.server.requests)
+
+    def test_invalid_token_fails_on_first_request(self):
+        self.write_config('wrong-token')
+        self.assertEqual(1, cli.main(['--config', self.config_path]))
+        self.assertEqual(1, len(self.server.requests))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+"""Tests for hubsync.concurrency module"""
+import threading
+import unittest
+
+from hubsync import config, gitbackend
+from hubsync.concurrency import (AdaptiveLimit, AdaptiveLimits,
+                                 InvalidConcurrency, git_host, is_congestion)
+from hubsync.metrics import Metrics
+
+
+class GitHostTestCase(unittest.TestCase):
+    def test_hosts_of_git_urls(self):
+        self.assertEqual('github.com', git_host('git@github.com:org/r.git'))
+        self.assertEqual('github.com', git_host('github.com:org/r.git'))
+        self.assertEqual('ghe.corp',
+                         git_host('ssh://git@ghe.corp:2222/org/r.git'))
+        self.assertEqual('github.com', git_host('https://github.com/org/r'))
+        self.assertEqual('local', git_host('/srv/mirrors/org/r.git'))
+        self.assertEqual('local', git_host('file:///srv/mirrors/org/r.git'))
+
+
+class AdaptiveLimitTestCase(unittest.TestCase):
+    def run_round(self, limit, seconds=1.0, succeeded=True,
+                  congested=False):
+        """Runs as many operations as the limit allows"""
+        count = limit.level
+        for _ in range(count):
+            limit.acquire()
+        for _ in range(count):
+            limit.release(seconds, succeeded, congested)
+
+    def test_invalid_bounds_raise(self):
+        self.assertRaises(InvalidConcurrency, AdaptiveLimit, 0, 4)
+        self.assertRaises(InvalidConcurrency, AdaptiveLimit, 4, 2)
+
+    def test_grows_by_one_per_round_up_to_the_max(self):
+        limit = AdaptiveLimit(1, 4)
+        levels = []
+        for _ in range(5):
+            self.run_round(limit)
+            levels.append(limit.level)
+        self.assertEqual([2, 3, 4, 4, 4], levels)
+
+    def test_halves_once_per_round_on_congestion(self):
+        limit = AdaptiveLimit(1, 8)
+        while limit.level < 8:
+            self.run_round(limit)
+        self.run_round(limit, succeeded=False, congested=True)
+        self.assertEqual(4, limit.level)
+        self.assertEqual(1, limit.decreases)
+        self.run_round(limit, succeeded=False, congested=True)
+        self.run_round(limit, succeeded=False, congested=True)
+        self.run_round(limit, succeeded=False, congested=True)
+        self.assertEqual(1, limit.level)
+        self.assertEqual((1, 8), (limit.lowest, limit.highest))
+
+    def test_other_failures_do_not_halve(self):
+        limit = AdaptiveLimit(1, 4)
+        while limit.level < 4:
+            self.run_round(limit)
+        self.run_round(limit, succeeded=False)
+        self.assertEqual((4, 0, 4), (limit.level, limit.decreases,
+                                     limit.failed))
+
+    def test_halves_when_the_latency_grows(self):
+        limit = AdaptiveLimit(1, 8)
+        while limit.level < 8:
+            self.run_round(limit, seconds=0.5)
+        limit.acquire()
+        limit.release(0.5)
+        for _ in range(3):
+            limit.acquire()
+            limit.release(20.0)
+        self.assertEqual(4, limit.level)
+
+    def test_untimed_operations_do_not_show_congestion(self):
+        limit = AdaptiveLimit(1, 2)
+        self.run_round(limit, seconds=0.5)
+        limit.acquire()
+        limit.acquire()
+        limit.release(None)
+        limit.release(None)
+        self.assertEqual(2, limit.level)
+        self.assertEqual(0, limit.failed)
+
+    def test_acquire_waits_for_room(self):
+        limit = AdaptiveLimit(1, 1)
+        limit.acquire()
+        acquired = threading.Event()
+
+        def acquire():
+            limit.acquire()
+            acquired.set()
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        limit.release(1.0)
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+
+
+class AdaptiveLimitsTestCase(unittest.TestCase):
+    def test_each_host_has_its_limit(self):
+        limits = AdaptiveLimits(1, 4)
+        self.assertIs(limits.limit('git@github.com:a/b.git'),
+                      limits.limit('git@github.com:c/d.git'))
+        self.assertIsNot(limits.limit('git@github.com:a/b.git'),
+                         limits.limit('git@ghe.corp:a/b.git'))
+
+    def test_congestion(self):
+        self.assertTrue(is_congestion(gitbackend.GitTimeout("killed")))
+        self.assertTrue(is_congestion(gitbackend.GitBackendError(
+            "fatal: the remote end hung up unexpectedly")))
+        self.assertFalse(is_congestion(gitbackend.GitBackendError(
+            "fatal: couldn't find remote ref feature")))
+        self.assertFalse(is_congestion(gitbackend.GitBackendError(
+            "! [rejected] master -> master (non-fast-forward)")))
+
+    def test_operation_records_failures(self):
+        limits = AdaptiveLimits(1, 4)
+        with self.assertRaises(OSError):
+            with limits.operation('git@github.com:a/b.git'):
+                raise OSError("timeout")
+        metrics = Metrics()
+        limits.record(metrics)
+        summary = metrics.values['git.concurrency.github.com']
+        self.assertEqual((1, 1, 1), (summary['completed'], summary['failed'],
+                                     summary['level']))
+        # the round of the failure ends without growing the limit
+        with limits.operation('git@github.com:a/b.git'):
+            pass
+        self.assertEqual(2, limits.limit('git@github.com:a/b.git').level)
+
+    def test_from_config(self):
+        limits = AdaptiveLimits.from_config(config.Config(
+            glob={'min_fetches': '2', 'max_fetches': '16'}).glob)
+        self.assertEqual((2, 16), (limits.minimum, limits.maximum))
+        with self.assertRaises(InvalidConcurrency):
+            AdaptiveLimits.from_config(config.Config(
+                glob={'max_fetches': 'many'}).glob)
+        with self.assertRaises(InvalidConcurrency):
+            AdaptiveLimits.from_config(config.Config(
+                glob={'min_fetches': '4', 'max_fetches': '2'}).glob)
+
+
+if __name__ == '__main__':
+    unittest.main()
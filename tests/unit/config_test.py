@@ -35,6 +35,80 @@ class ConfigTestCase(unittest.TestCase):
         conf = config.Config.from_ini_file('fake')
         self.assertEqual('value', conf.github.token)
 
+    @mock.patch('hubsync.config._get_config_parser')
+    def test_create_from_ini_with_org_filters(self, parser_mock):
+        parser = configparser.ConfigParser()
+        parser.add_section('filters')
+        parser.set('filters', 'archived', 'false')
+        parser.set('filters', 'exclude', 'old-*')
+        parser.add_section('filters:team')
+        parser.set('filters:team', 'include', 'service-*')
+        parser_mock.return_value = parser
+        conf = config.Config.from_ini_file('fake')
+        self.assertFalse(conf.filters.archived)
+        self.assertEqual([('team', {'include': 'service-*'})],
+                         conf.org_filters)
+        team = conf.filters_section(conf.org_filters[0][1])
+        self.assertEqual('service-*', team.include)
+        self.assertEqual('old-*', team.exclude)
+        self.assertFalse(team.archived)
+
+    @mock.patch('hubsync.config._get_config_parser')
+    def test_create_from_ini_with_fetch_policies(self, parser_mock):
+        parser = configparser.ConfigParser()
+        parser.add_section('fetch')
+        parser.set('fetch', 'prune', 'false')
+        parser.add_section('fetch:team')
+        parser.set('fetch:team', 'branches', 'default-branch-only')
+        parser.add_section('fetch:team/monorepo')
+        parser.set('fetch:team/monorepo', 'branches', 'release/*')
+        parser_mock.return_value = parser
+        conf = config.Config.from_ini_file('fake')
+        self.assertEqual('all', conf.fetch.branches)
+        self.assertEqual([('team', {'branches': 'default-branch-only'}),
+                          ('team/monorepo', {'branches': 'release/*'})],
+                         conf.fetch_policies)
+        monorepo = conf.fetch_section(conf.fetch_policies[1][1])
+        self.assertEqual('release/*', monorepo.branches)
+        self.assertFalse(monorepo.prune)
+
+    @mock.patch('hubsync.config._get_config_parser')
+    def test_create_from_ini_with_org_and_repo_sections(self, parser_mock):
+        parser = configparser.ConfigParser()
+        parser.add_section('repo')
+        parser.set('repo', 'pre', 'make')
+        parser.add_section('repo:team/*')
+        parser.set('repo:team/*', 'interval', '1h')
+        parser.add_section('repo:big-*')
+        parser.set('repo:big-*', 'clone', 'blobless')
+        parser.add_section('org:team')
+        parser.set('org:team', 'post', 'ls')
+        parser_mock.return_value = parser
+        conf = config.Config.from_ini_file('fake')
+        self.assertEqual('make', conf.repo.pre)
+        self.assertEqual([('team/*', {'interval': '1h'}),
+                          ('big-*', {'clone': 'blobless'})],
+                         conf.repo_sections)
+        self.assertEqual([('team', {'post': 'ls'})], conf.org_sections)
+        section = conf.repo_section({'clone': 'blobless'})
+        self.assertEqual(('make', 'blobless', 'full'),
+                         (section.pre, section.clone, section.mode))
+
+    @mock.patch('hubsync.config._get_config_parser')
+    def test_create_from_ini_with_hosts(self, parser_mock):
+        parser = configparser.ConfigParser()
+        parser.add_section('github:corp')
+        parser.set('github:corp', 'token', 'XXX')
+        parser.set('github:corp', 'api_url', 'https://corp/api/v3')
+        parser.add_section('github:com')
+        parser.set('github:com', 'token', 'YYY')
+        parser_mock.return_value = parser
+        conf = config.Config.from_ini_file('fake')
+        self.assertEqual(['corp', 'com'], list(conf.hosts))
+        self.assertEqual('https://corp/api/v3', conf.hosts['corp'].api_url)
+        self.assertEqual('https://api.github.com', conf.hosts['com'].api_url)
+        self.assertIsNone(conf.github.token)
+
     def test_create_from_ini_with_invalid_value(self):
         self.assertRaises(AssertionError,
                           lambda: config.Config(org={'a': 1}))
@@ -0,0 +1,115 @@
+"""Tests for the fake github api server"""
+import threading
+import unittest
+
+import requests
+
+from hubsync import github
+from hubsync.fakehub import Dataset, FakeGithub
+
+
+class FakeGithubTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dataset = Dataset.generate(orgs=2, repos_per_org=5, user_repos=2)
+        self.server = FakeGithub(self.dataset, per_page=2).start()
+        self.headers = {'Authorization': 'token ' + self.server.token}
+
+    def tearDown(self):
+        self.server.stop()
+
+    def get(self, path, **kwargs):
+        headers = dict(self.headers, **kwargs.pop('headers', {}))
+        return requests.get(self.server.url + path, headers=headers, **kwargs)
+
+    def test_bad_credentials(self):
+        response = requests.get(self.server.url + '/user')
+        self.assertEqual(401, response.status_code)
+        self.assertEqual('Bad credentials', response.json()['message'])
+
+    def test_unknown_url(self):
+        self.assertEqual(404, self.get('/orgs/missing').status_code)
+
+    def test_pagination(self):
+        response = self.get('/orgs/org0/repos')
+        self.assertEqual(['repo0', 'repo1'],
+                         [repo['name'] for repo in response.json()])
+        self.assertIn('page=3', response.links['last']['url'])
+        names = [repo['name'] for repo in response.json()]
+        while 'next' in response.links:
+            response = requests.get(response.links['next']['url'],
+                                    headers=self.headers)
+            names.extend(repo['name'] for repo in response.json())
+        self.assertEqual(5, len(names))
+
+    def test_etag_returns_not_modified(self):
+        first = self.get('/user')
+        remaining = int(first.headers['X-RateLimit-Remaining'])
+        second = self.get('/user',
+                          headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(304, second.status_code)
+        self.assertEqual(remaining,
+                         int(second.headers['X-RateLimit-Remaining']))
+
+    def test_rate_limit_exceeded(self):
+        self.server.limiter.limit = 1
+        self.assertEqual(200, self.get('/user').status_code)
+        response = self.get('/user')
+        self.assertEqual(403, response.status_code)
+        self.assertEqual('0', response.headers['X-RateLimit-Remaining'])
+
+    def test_secondary_limit(self):
+        self.server.limiter.secondary_limit = 1
+        self.server.latency = 0.2
+        responses = []
+        threads = [threading.Thread(target=lambda: responses.append(
+            self.get('/user'))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        statuses = sorted(response.status_code for response in responses)
+        self.assertEqual(200, statuses[0])
+        self.assertEqual(403, statuses[-1])
+        self.assertTrue(any('Retry-After' in response.headers
+                            for response in responses))
+
+    def test_error_injection(self):
+        self.server.error_rate = 1
+        self.assertEqual(502, self.get('/user').status_code)
+
+    def test_create_fork(self):
+        response = requests.post(self.server.url + '/repos/org0/repo0/forks',
+                                 headers=self.headers)
+        self.assertEqual(202, response.status_code)
+        forks = self.get('/repos/org0/repo0/forks',
+                         params={'per_page': 100}).json()
+        self.assertIn(self.dataset.user,
+                      [fork['owner']['login'] for fork in forks])
+
+    def test_api_reads_organizations(self):
+        self.server.per_page = 100
+        api = github.Api(self.server.url, self.server.token)
+        self.assertEqual(['org0', 'org1'],
+                         [org.name for org in api.organizations])
+        self.assertEqual(self.dataset.user, api.user.name)
+        self.assertEqual(5, len(api.organizations[0].repos))
+
+    def test_moved_repo_keeps_id(self):
+        repo_id = self.dataset.repos[('org0', 'repo0')]['id']
+        self.dataset.move_repo('org0', 'repo0', 'org1', 'moved')
+        self.assertEqual(404, self.get('/repos/org0/repo0').status_code)
+        api = github.Api(self.server.url, self.server.token)
+        repo = api.repository(repo_id)
+        self.assertEqual('org1/moved', repo.full_name)
+        self.assertEqual(repo_id, repo.id)
+        self.assertIsNone(api.repository(repo_id + 1000))
+
+    def test_generated_dataset_is_deterministic(self):
+        again = Dataset.generate(orgs=2, repos_per_org=5, user_repos=2)
+        self.assertEqual(self.dataset.repos, again.repos)
+        self.assertTrue(all(repo['pushed_at'] < '2020-01-01T00:00:00Z'
+                            for repo in again.repos.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
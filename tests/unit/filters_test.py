@@ -0,0 +1,120 @@
+"""Tests for hubsync.filters module"""
+import unittest
+
+from hubsync import config, filters
+from hubsync.github import Repo
+
+
+def make_repo(name, user='org', **metadata):
+    return Repo(None, user, name, 'description', 'url', 'forks_url',
+                **metadata)
+
+
+class PatternsTestCase(unittest.TestCase):
+    def test_split_list(self):
+        self.assertEqual(['a', 'b*', 're:c.+'],
+                         filters.split_list(' a, b*\n  re:c.+'))
+        self.assertEqual([], filters.split_list(None))
+
+    def test_glob_and_regex(self):
+        names = filters.NameFilter(['tools-*', 're:lib[0-9]+'])
+        self.assertTrue(names.selects('tools-ci'))
+        self.assertTrue(names.selects('lib42'))
+        self.assertFalse(names.selects('lib42-old'))
+        self.assertFalse(names.selects('website'))
+
+    def test_exclude_wins(self):
+        names = filters.NameFilter(['*'], ['*-archive'])
+        self.assertTrue(names.selects('project'))
+        self.assertFalse(names.selects('project-archive'))
+
+    def test_full_name_patterns(self):
+        names = filters.NameFilter(exclude=['org/legacy-*'])
+        self.assertFalse(names.selects('legacy-app', 'org/legacy-app'))
+        self.assertTrue(names.selects('legacy-app', 'other/legacy-app'))
+
+    def test_case_insensitive(self):
+        self.assertTrue(filters.NameFilter(['Tools'], case_sensitive=False)
+                        .selects('tools'))
+        self.assertFalse(filters.NameFilter(['Tools']).selects('tools'))
+
+    def test_invalid_regex_raises(self):
+        self.assertRaises(filters.InvalidFilter,
+                          lambda: filters.compile_pattern('re:('))
+
+    def test_parse_duration(self):
+        self.assertEqual(2 * 24 * 3600, filters.parse_duration('2'))
+        self.assertEqual(12 * 3600, filters.parse_duration('12h'))
+        self.assertEqual(14 * 24 * 3600, filters.parse_duration('2w'))
+        self.assertRaises(filters.InvalidFilter,
+                          lambda: filters.parse_duration('2 months'))
+
+
+class RepoFilterTestCase(unittest.TestCase):
+    def test_metadata_predicates(self):
+        repo_filter = filters.RepoFilter(
+            archived=False, forks=False, max_size=1, languages=['python'],
+            pushed_within=filters.parse_duration('30d'))
+        now = filters.parse_time('2016-02-01T00:00:00Z')
+        selected = dict(language='Python', size=1024,
+                        pushed_at='2016-01-15T00:00:00Z')
+        self.assertTrue(repo_filter.selects(make_repo('a', **selected), now))
+        for change in ({'archived': True}, {'is_fork': True},
+                       {'size': 1025}, {'language': 'Go'},
+                       {'language': None},
+                       {'pushed_at': '2015-12-01T00:00:00Z'}):
+            metadata = dict(selected, **change)
+            self.assertFalse(repo_filter.selects(make_repo('a', **metadata),
+                                                 now), change)
+
+    def test_default_selects_all(self):
+        self.assertTrue(filters.RepoFilter().selects(
+            make_repo('a', archived=True, is_fork=True, size=10 ** 9)))
+
+
+class SelectorTestCase(unittest.TestCase):
+    def test_from_config(self):
+        conf = config.Config(
+            filters={'exclude_orgs': 'old-*', 'exclude': '*-archive',
+                     'archived': False},
+            org_filters=[('team', {'include': 'service-*'})])
+        selector = filters.Selector.from_config(conf)
+        self.assertTrue(selector.selects_org('team'))
+        self.assertFalse(selector.selects_org('old-team'))
+
+        default = selector.repo_filter('other')
+        self.assertTrue(default.selects(make_repo('web')))
+        self.assertFalse(default.selects(make_repo('web-archive')))
+        self.assertFalse(default.selects(make_repo('web', archived=True)))
+
+        team = selector.repo_filter('team')
+        self.assertTrue(team.selects(make_repo('service-a', 'team')))
+        self.assertFalse(team.selects(make_repo('web', 'team')))
+        # global options apply to the orgs with their own filters
+        self.assertFalse(team.selects(make_repo('service-archive', 'team')))
+        self.assertFalse(team.selects(make_repo('service-a', 'team',
+                                                archived=True)))
+
+    def test_org_sections_match_globs_in_order(self):
+        conf = config.Config(org_filters=[
+            ('team-*', {'include': 'service-*', 'forks': False}),
+            ('team-web', {'include': 'web-*'})])
+        selector = filters.Selector.from_config(conf)
+        web = selector.repo_filter('team-web')
+        self.assertTrue(web.selects(make_repo('web-a', 'team-web')))
+        self.assertFalse(web.selects(make_repo('service-a', 'team-web')))
+        # options not set by the later section are kept
+        self.assertFalse(web.selects(make_repo('web-a', 'team-web',
+                                               is_fork=True)))
+        self.assertTrue(selector.repo_filter('team-api').selects(
+            make_repo('service-a', 'team-api')))
+        self.assertIs(selector.repos, selector.repo_filter('other'))
+
+    def test_invalid_config_raises(self):
+        conf = config.Config(filters={'max_size': 'big'})
+        self.assertRaises(filters.InvalidFilter,
+                          lambda: filters.Selector.from_config(conf))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+"""Tests for hubsync.forks module"""
+import unittest
+
+import mock
+
+from hubsync import forks, github
+from hubsync.fakehub import Dataset, FakeGithub
+from hubsync.forks import ForkQueue, MergeUpstreamQueue
+from hubsync.transport import Response
+
+
+class RemoteNameTestCase(unittest.TestCase):
+    def test_urls(self):
+        for url in ('git@github.com:user/repo.git',
+                    'ssh://git@github.com/user/repo.git',
+                    'https://github.com/user/repo',
+                    'https://github.com/user/repo.git/',
+                    '/remotes/user/repo.git'):
+            self.assertEqual('user/repo', forks.remote_name(url))
+
+    def test_url_without_owner(self):
+        self.assertIsNone(forks.remote_name('git@github.com:repo.git'))
+
+
+class ForkQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dataset = Dataset.generate(orgs=1, repos_per_org=3, user_repos=0,
+                                        forks_per_repo=0)
+        self.server = FakeGithub(self.dataset, fork_delay=0.2).start()
+        self.api = github.Api(self.server.url, self.server.token)
+        self.queue = ForkQueue(self.api, post_interval=0, poll_interval=0.05)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_forks_are_ready_once_available(self):
+        repos = self.api.organizations[0].repos
+        for repo in repos:
+            self.queue.request(repo, '/ws/org0/' + repo.name)
+        ready = self.queue.wait()
+        self.assertEqual(sorted(repo.name for repo in repos),
+                         sorted(fork.github_repo.name for fork in ready))
+        self.assertEqual([], self.queue.failed)
+        for repo in repos:
+            self.assertIn((self.dataset.user, repo.name), self.dataset.repos)
+        # the forks were polled until available
+        polls = [path for method, path in self.server.requests
+                 if method == 'GET' and path.startswith(
+                     '/repos/{}/'.format(self.dataset.user))]
+        self.assertGreater(len(polls), len(repos))
+
+    def test_existing_fork_is_not_requested(self):
+        repo = self.api.organizations[0].repos[0]
+        self.dataset.add_fork(self.dataset.repos[('org0', repo.name)],
+                              self.dataset.user)
+        self.queue.request(repo, 'path')
+        self.assertEqual(1, len(self.queue.wait()))
+        self.assertNotIn('POST', [method for method, _
+                                  in self.server.requests])
+
+    def test_fork_of_another_repo_is_not_used(self):
+        repo = self.api.organizations[0].repos[0]
+        self.dataset.add_fork(self.dataset.add_repo('other', repo.name),
+                              self.dataset.user)
+        self.queue.request(repo, 'path')
+        self.queue.wait()
+        self.assertIn('POST', [method for method, _
+                               in self.server.requests])
+
+    def test_timed_out_fork_fails(self):
+        self.server.fork_delay = 60
+        self.queue.timeout = 0.1
+        self.queue.request(self.api.organizations[0].repos[0], 'path')
+        self.assertEqual([], self.queue.wait())
+        self.assertEqual(1, len(self.queue.failed))
+
+    def test_waits_for_rate_limit(self):
+        self.api.transport = mock.Mock()
+        self.api.transport.request.side_effect = [
+            Response(403, {'Retry-After': '0'}, '{}'),
+            Response(404, {}, '{}'),
+        ]
+        with mock.patch('time.sleep') as sleep:
+            self.assertEqual(404, forks.send(self.api, 'GET', 'url').status)
+        sleep.assert_called_once_with(0)
+
+    def test_wait_without_requests(self):
+        self.assertEqual([], self.queue.wait())
+
+
+class MergeUpstreamQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dataset = Dataset.generate(orgs=1, repos_per_org=2, user_repos=0,
+                                        forks_per_repo=0)
+        for name in ('repo0', 'repo1'):
+            self.dataset.add_fork(self.dataset.repos[('org0', name)],
+                                  self.dataset.user)
+        self.server = FakeGithub(self.dataset).start()
+        self.api = github.Api(self.server.url, self.server.token)
+        self.queue = MergeUpstreamQueue(self.api, post_interval=0)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def request(self, name):
+        repo = [repo for repo in self.api.organizations[0].repos
+                if repo.name == name][0]
+        self.queue.request(repo, '/ws/org0/' + name,
+                           "{}/{}".format(self.dataset.user, name))
+
+    def test_forks_are_merged_by_github(self):
+        self.request('repo0')
+        self.request('repo1')
+        self.assertEqual([], self.queue.wait())
+        self.assertEqual(
+            [("{}/repo0".format(self.dataset.user), 'master'),
+             ("{}/repo1".format(self.dataset.user), 'master')],
+            sorted(self.server.merged))
+        self.assertEqual(2, len(self.queue.merged))
+
+    def test_conflicts_are_returned(self):
+        self.server.merge_conflicts.add(
+            "{}/repo1".format(self.dataset.user))
+        self.request('repo0')
+        self.request('repo1')
+        conflicts = self.queue.wait()
+        self.assertEqual(['repo1'], [merge_request.github_repo.name
+                                     for merge_request in conflicts])
+        self.assertEqual('/ws/org0/repo1', conflicts[0].path)
+        self.assertEqual(1, len(self.server.merged))
+
+    def test_unprocessable_fork_is_returned(self):
+        repo = self.api.organizations[0].repos[0]
+        self.queue.request(repo, 'path', repo.full_name)
+        self.assertEqual(1, len(self.queue.wait()))
+        self.assertEqual([], self.server.merged)
+
+    def test_missing_fork_fails(self):
+        repo = self.api.organizations[0].repos[0]
+        self.queue.request(repo, 'path', 'nobody/' + repo.name)
+        self.assertEqual([], self.queue.wait())
+        self.assertEqual(1, len(self.queue.failed))
+
+    def test_wait_without_requests(self):
+        self.assertEqual([], self.queue.wait())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+"""Tests for hubsync.gitbackend module"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from hubsync import gitbackend
+from hubsync.gitbackend import run_git
+
+try:
+    import pygit2
+except ImportError:
+    pygit2 = None
+
+
+def commit(path, message):
+    run_git(path, '-c', 'user.name=test', '-c', 'user.email=test@test',
+            'commit', '--allow-empty', '-q', '-m', message)
+
+
+class GitPythonBackendTestCase(unittest.TestCase):
+    """Runs the backend against real repositories in a temp folder"""
+
+    def get_backend(self, timeout=None):
+        return gitbackend.GitPythonBackend(timeout)
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.origin = os.path.join(self.tmp, 'origin')
+        os.makedirs(self.origin)
+        run_git(self.origin, 'init', '-q')
+        run_git(self.origin, 'checkout', '-q', '-b', 'master')
+        commit(self.origin, 'first')
+        self.backend = self.get_backend()
+        self.path = os.path.join(self.tmp, 'clone')
+        self.backend.clone(self.origin, self.path)
+        self.repo = self.backend.open(self.path)
+
+    def tearDown(self):
+        self.repo.close()
+        shutil.rmtree(self.tmp)
+
+    def test_open_invalid_path_raises(self):
+        self.assertRaises(gitbackend.InvalidRepository,
+                          lambda: self.backend.open(self.tmp))
+
+    def test_remotes(self):
+        self.assertEqual(self.origin, self.repo.remote_url('origin'))
+        self.assertIsNone(self.repo.remote_url('upstream'))
+        self.repo.create_remote('upstream', self.origin)
+        self.repo.set_remote_config('upstream', 'pushurl', 'nopush')
+        self.repo.fetch('upstream')
+        self.assertEqual('nopush', run_git(
+            self.path, 'config', 'remote.upstream.pushurl').strip())
+
+    def test_pull(self):
+        commit(self.origin, 'second')
+        self.repo.pull('origin')
+        self.assertEqual((0, 0),
+                         self.repo.ahead_behind('master', 'origin/master'))
+
+    def test_fetch_refspecs_and_prune(self):
+        run_git(self.origin, 'branch', 'feature')
+        run_git(self.origin, 'branch', 'old')
+        self.repo.fetch('origin')
+        self.assertEqual(['+refs/heads/*:refs/remotes/origin/*'],
+                         self.repo.fetch_refspecs('origin'))
+        self.repo.set_fetch_refspecs('origin', [
+            '+refs/heads/master:refs/remotes/origin/master',
+            '+refs/heads/f*:refs/remotes/origin/f*'])
+        self.assertEqual(['+refs/heads/master:refs/remotes/origin/master',
+                          '+refs/heads/f*:refs/remotes/origin/f*'],
+                         self.repo.fetch_refspecs('origin'))
+        self.assertEqual([], self.repo.fetch_refspecs('missing'))
+
+        run_git(self.origin, 'branch', '-D', 'feature')
+        self.repo.fetch('origin', prune=True)
+        self.assertEqual(['HEAD', 'master', 'old'],
+                         sorted(self.repo.remote_branches('origin')))
+        self.repo.delete_remote_branch('origin', 'old')
+        self.assertEqual(['HEAD', 'master'],
+                         sorted(self.repo.remote_branches('origin')))
+
+    def test_no_fetch_refspecs(self):
+        self.repo.set_fetch_refspecs('origin', [])
+        self.assertEqual([], self.repo.fetch_refspecs('origin'))
+        self.repo.set_fetch_refspecs('origin', [])
+        self.repo.set_fetch_refspecs(
+            'origin', ['+refs/heads/*:refs/remotes/origin/*'])
+        self.assertEqual(['+refs/heads/*:refs/remotes/origin/*'],
+                         self.repo.fetch_refspecs('origin'))
+
+    def test_clone_single_branch(self):
+        run_git(self.origin, 'branch', 'feature')
+        path = os.path.join(self.tmp, 'single')
+        self.backend.clone(self.origin, path, branch='master')
+        self.assertEqual(['+refs/heads/master:refs/remotes/origin/master'],
+                         run_git(path, 'config', '--get-all',
+                                 'remote.origin.fetch').splitlines())
+        self.assertNotIn('feature', run_git(path, 'branch', '-r'))
+
+    def test_clone_with_options(self):
+        commit(self.origin, 'second')
+        path = os.path.join(self.tmp, 'shallow')
+        self.backend.clone('file://' + self.origin, path,
+                           options=('--depth', '1'))
+        self.assertEqual('1', run_git(path, 'rev-list', '--count',
+                                      'HEAD').strip())
+
+    def test_branches_ahead_behind_and_delete(self):
+        run_git(self.path, 'branch', 'stale')
+        run_git(self.path, 'checkout', '-q', '-b', 'feature')
+        commit(self.path, 'feature work')
+        run_git(self.path, 'checkout', '-q', 'master')
+        commit(self.origin, 'second')
+        self.repo.fetch('origin')
+
+        self.assertEqual(['feature', 'master', 'stale'],
+                         sorted(self.repo.branches()))
+        self.assertEqual((0, 1),
+                         self.repo.ahead_behind('stale', 'origin/master'))
+        self.assertEqual((1, 1),
+                         self.repo.ahead_behind('feature', 'origin/master'))
+        self.repo.delete_branch('stale')
+        self.assertEqual(['feature', 'master'], sorted(self.repo.branches()))
+
+    def test_rev_parse(self):
+        sha = run_git(self.origin, 'rev-parse', 'HEAD').strip()
+        self.assertEqual(sha, self.repo.rev_parse('origin/master'))
+        self.assertIsNone(self.repo.rev_parse('origin/missing'))
+
+    def test_ahead_behind_unknown_revision_raises(self):
+        self.assertRaises(gitbackend.GitBackendError,
+                          lambda: self.repo.ahead_behind('master', 'nope/x'))
+
+    def test_working_tree_state(self):
+        self.assertFalse(self.repo.is_dirty())
+        self.assertEqual('master', self.repo.active_branch())
+        with open(os.path.join(self.path, 'new_file'), 'w'):
+            pass
+        self.assertTrue(self.repo.is_dirty())
+        run_git(self.path, 'checkout', '-q', '--detach')
+        self.assertIsNone(self.repo.active_branch())
+
+    def test_broken_index_raises(self):
+        with open(os.path.join(self.path, '.git', 'index'), 'w') as index:
+            index.write('garbage')
+        self.assertRaises(gitbackend.GitBackendError, self.repo.is_dirty)
+
+    def test_tracking_branches(self):
+        run_git(self.path, 'branch', 'local')
+        self.assertEqual({'master': 'origin/master', 'local': None},
+                         self.repo.tracking_branches())
+
+    def test_delete_current_branch_raises(self):
+        self.assertRaises(gitbackend.GitBackendError,
+                          lambda: self.repo.delete_branch('master'))
+
+    def test_hung_fetch_is_killed(self):
+        # an ssh remote whose connection never answers
+        ssh = os.path.join(self.tmp, 'hung-ssh')
+        with open(ssh, 'w') as script:
+            script.write('#!/bin/sh\nsleep 30\n')
+        os.chmod(ssh, 0o755)
+        run_git(self.path, 'config', 'core.sshCommand', ssh)
+        run_git(self.path, 'remote', 'add', 'hung', 'ssh://hung/repo.git')
+        self.repo.close()
+        self.repo = self.get_backend(timeout=1).open(self.path)
+        self.assertRaises(gitbackend.GitTimeout,
+                          lambda: self.repo.fetch('hung'))
+
+
+@unittest.skipIf(pygit2 is None, "pygit2 is not installed")
+class Pygit2BackendTestCase(GitPythonBackendTestCase):
+    def get_backend(self, timeout=None):
+        return gitbackend.Pygit2Backend(timeout)
+
+
+class GetBackendTestCase(unittest.TestCase):
+    def test_get_gitpython(self):
+        self.assertIsInstance(gitbackend.get_backend('gitpython'),
+                              gitbackend.GitPythonBackend)
+
+    def test_unknown_backend_raises(self):
+        self.assertRaises(gitbackend.GitBackendError,
+                          lambda: gitbackend.get_backend('svn'))
+
+
+if __name__ == '__main__':
+    unittest.main()
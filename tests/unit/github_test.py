@@ -3,8 +3,11 @@
 import unittest
 
 import mock
+import requests
 
-from hubsync.github import Api, Organization, Repo
+from hubsync.github import (Api, AuthenticationError, GithubError,
+                            GithubUnavailable, Organization, Repo)
+from hubsync.transport import Response
 
 
 class ApiTestCase(unittest.TestCase):
@@ -13,56 +16,145 @@ class ApiTestCase(unittest.TestCase):
     def setUp(self):
         self.api = Api('sample_url', 'awesome token')
 
-    @mock.patch('hubsync.github.requests')
-    def test_get_token_is_sent_in_header(self, requests_mock):
-        requests_mock.get.return_value = mock.MagicMock()
+    def test_get_token_is_sent_in_header(self):
+        self.api.transport = mock.Mock()
+        self.api.transport.request.return_value = Response(200, {}, '{}')
         self.api.get('test')
-        headers = requests_mock.get.call_args[1]['headers']
+        headers = self.api.transport.request.call_args[0][2]
         self.assertTrue('Authorization' in headers)
         self.assertTrue('awesome token' in headers['Authorization'])
 
-    @mock.patch('hubsync.github.requests')
-    def test_post_token_is_sent_in_header(self, requests_mock):
-        requests_mock.post.return_value = mock.MagicMock()
+    def test_post_token_is_sent_in_header(self):
+        self.api.transport = mock.Mock()
+        self.api.transport.request.return_value = Response(202, {}, '{}')
         self.api.post('test')
-        headers = requests_mock.post.call_args[1]['headers']
+        method, _, headers, _ = self.api.transport.request.call_args[0]
+        self.assertEqual('POST', method)
         self.assertTrue('Authorization' in headers)
         self.assertTrue('awesome token' in headers['Authorization'])
 
+    def test_get_follows_pagination(self):
+        self.api.transport = mock.Mock()
+        self.api.transport.request.side_effect = [
+            Response(200, {'Link': '<page2>; rel="next", <page2>; rel="last"'},
+                     '[1, 2]'),
+            Response(200, {'Link': '<test>; rel="first"'}, '[3]'),
+        ]
+        self.assertEqual([1, 2, 3], self.api.get('test'))
+        self.assertEqual('page2',
+                         self.api.transport.request.call_args[0][1])
+
+    def test_iter_get_requests_the_next_page_once_consumed(self):
+        self.api.transport = mock.Mock()
+        self.api.transport.request.side_effect = [
+            Response(200, {'Link': '<page2>; rel="next", <page2>; rel="last"'},
+                     '[1, 2]'),
+            Response(200, {'Link': '<test>; rel="first"'}, '[3]'),
+        ]
+        items = self.api.iter_get('test')
+        self.assertEqual([1, 2], [next(items), next(items)])
+        self.assertEqual(1, self.api.transport.request.call_count)
+        self.assertEqual([3], list(items))
+        self.assertEqual(2, self.api.transport.request.call_count)
+
+    def test_get_is_retried_if_github_does_not_answer(self):
+        self.api.retries = 2
+        self.api.retry_backoff = 0
+        self.api.transport = mock.Mock()
+        self.api.transport.request.side_effect = [
+            requests.Timeout('read timed out'),
+            requests.ConnectionError('connection reset'),
+            Response(200, {}, '[1]'),
+        ]
+        self.assertEqual([1], self.api.get('test'))
+        self.assertEqual(3, self.api.transport.request.call_count)
+
+    def test_unavailable_github_raises(self):
+        self.api.retries = 1
+        self.api.retry_backoff = 0
+        self.api.transport = mock.Mock()
+        self.api.transport.request.side_effect = requests.Timeout('timeout')
+        self.assertRaises(GithubUnavailable, lambda: self.api.get('test'))
+        self.assertEqual(2, self.api.transport.request.call_count)
+
+    def test_get_is_retried_on_server_errors_and_rate_limits(self):
+        self.api.retries = 2
+        self.api.retry_backoff = 0
+        self.api.transport = mock.Mock()
+        self.api.transport.request.side_effect = [
+            Response(502, {}, 'Bad gateway'),
+            Response(403, {'X-RateLimit-Remaining': '0'}, '{}'),
+            Response(200, {}, '[1]'),
+        ]
+        self.assertEqual([1], self.api.get('test'))
+        self.assertEqual(3, self.api.transport.request.call_count)
+
+    def test_listing_of_failing_github_raises(self):
+        self.api.retries = 1
+        self.api.retry_backoff = 0
+        self.api.transport = mock.Mock()
+        self.api.transport.request.return_value = Response(
+            503, {}, '{"message": "Unavailable"}')
+        with self.assertRaises(GithubUnavailable):
+            list(self.api.iter_get('test'))
+        self.assertEqual(2, self.api.transport.request.call_count)
+
+    def test_error_status_raises_before_reading_the_body(self):
+        self.api.transport = mock.Mock()
+        self.api.transport.request.return_value = Response(
+            403, {}, '{"message": "Forbidden"}')
+        with self.assertRaises(GithubError) as raised:
+            list(self.api.iter_get('test'))
+        self.assertNotIsInstance(raised.exception, GithubUnavailable)
+        self.assertEqual(1, self.api.transport.request.call_count)
+
+    def test_post_is_not_retried(self):
+        self.api.retries = 2
+        self.api.transport = mock.Mock()
+        self.api.transport.request.side_effect = requests.Timeout('timeout')
+        self.assertRaises(GithubUnavailable, lambda: self.api.post('test'))
+        self.assertEqual(1, self.api.transport.request.call_count)
+
+    def test_bad_credentials_raise(self):
+        self.api.transport = mock.Mock()
+        self.api.transport.request.return_value = Response(
+            401, {}, '{"message": "Bad credentials"}')
+        with self.assertRaises(AuthenticationError):
+            self.api.get('test')
+
+    def test_repository_not_found(self):
+        self.api.transport = mock.Mock()
+        self.api.transport.request.return_value = Response(
+            404, {}, '{"message": "Not Found"}')
+        self.assertIsNone(self.api.repository(42))
+        self.assertEqual('sample_url/repositories/42',
+                         self.api.transport.request.call_args[0][1])
+
     def test_get_organizations_none_returned(self):
         self.api.get = mock.Mock(return_value=[])
         self.assertEqual(len(self.api.organizations), 0)
 
     def test_get_organizations_one_returned(self):
-        def call_api(url):
-            if 'user/org' in url:
-                return [{'url': 'repo_url'}]
-            elif 'repo_url' in url:
-                return {
-                    'login': 'sample_repo',
-                    'description': 'description!',
-                    'repos_url': 'http://localhost/repos'
-                }
-            else:
-                raise ValueError()
-
-        self.api.get = mock.MagicMock(side_effect=call_api)
-        self.assertEqual(len(self.api.organizations), 1)
+        self.api.get = mock.MagicMock(return_value=[{
+            'url': 'org_url',
+            'login': 'sample_org',
+            'description': 'description!',
+            'repos_url': 'http://localhost/repos'
+        }])
+        orgs = self.api.organizations
+        self.assertEqual(len(orgs), 1)
+        self.assertEqual('sample_org', orgs[0].name)
+        # the listing has all the org data
+        self.assertEqual(1, self.api.get.call_count)
 
     def test_organizations_two_returned(self):
-        def call_api(url):
-            if 'user/org' in url:
-                return [{'url': 'repo_url'}, {'url': 'repo_url'}]
-            elif 'repo_url' in url:
-                return {
-                    'login': 'sample_repo',
-                    'description': 'description!',
-                    'repos_url': 'http://localhost/repos'
-                }
-            else:
-                raise ValueError()
-
-        self.api.get = mock.MagicMock(side_effect=call_api)
+        org = {
+            'url': 'org_url',
+            'login': 'sample_org',
+            'description': 'description!',
+            'repos_url': 'http://localhost/repos'
+        }
+        self.api.get = mock.MagicMock(return_value=[org, org])
         self.assertEqual(len(self.api.organizations), 2)
 
     def test_get_user(self):
@@ -73,29 +165,26 @@ class ApiTestCase(unittest.TestCase):
                 return []
             elif 'repos' in url:
                 return [{
-                            'url': 'http://localhost/a_repo',
-                            'fork': False
-                        }]
-            elif 'user' in url:
-                return {
-                    'login': username,
-                    'description': 'description!',
-                    'repos_url': 'http://localhost/repos'
-                }
-            elif 'a_repo' in url:
-                return {
                     'owner': {
                         "login": username
                     },
                     'name': 'sample_repo',
                     'description': 'description!',
                     'ssh_url': 'http://localhost/repos',
-                    'forks_url': 'http://localhost/repos/forks'
+                    'forks_url': 'http://localhost/repos/forks',
+                    'fork': False
+                }]
+            elif 'user' in url:
+                return {
+                    'login': username,
+                    'description': 'description!',
+                    'repos_url': 'http://localhost/repos'
                 }
             else:
                 raise ValueError()
 
         self.api.get = mock.MagicMock(side_effect=call_api)
+        self.api.iter_get = lambda url: iter(self.api.get(url))
         self.assertEqual(len(self.api.organizations), 0)
         user = self.api.user
         self.assertEqual(username, user.name)
@@ -122,24 +211,32 @@ class ApiTestCase(unittest.TestCase):
                 }
             elif 'repos' in url:
                 return [{
-                            'url': 'http://localhost/a_repo'
-                        }]
-            elif 'a_repo' in url:
-                return {
                     'owner': {
                         "login": "the_user"
                     },
+                    'id': 7,
                     'name': 'sample_repo',
                     'description': 'description!',
                     'ssh_url': 'http://localhost/repos',
-                    'forks_url': 'http://localhost/repos/forks'
-                }
+                    'forks_url': 'http://localhost/repos/forks',
+                    'archived': True,
+                    'fork': False,
+                    'size': 120,
+                    'language': 'Python',
+                    'pushed_at': '2016-01-01T00:00:00Z'
+                }]
             else:
                 raise ValueError()
 
         self.api.get = mock.MagicMock(side_effect=call_api)
+        self.api.iter_get = lambda url: iter(self.api.get(url))
         org = Organization.from_url(self.api, 'the org url!')
-        self.assertEqual(len(org.repos), 1)
+        repos = org.repos
+        self.assertEqual(len(repos), 1)
+        self.assertEqual((7, True, False, 120, 'Python'),
+                         (repos[0].id, repos[0].archived, repos[0].is_fork,
+                          repos[0].size, repos[0].language))
+        self.assertEqual(2, self.api.get.call_count)
 
     @mock.patch('hubsync.github.Api.get')
     def test_get_forks_of_repo(self, requests_mock):
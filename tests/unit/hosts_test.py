@@ -0,0 +1,89 @@
+"""Tests for the sync of several github hosts"""
+import threading
+import unittest
+
+import mock
+
+from hubsync import config, hosts
+from hubsync.metrics import Metrics
+
+
+class FromConfigTestCase(unittest.TestCase):
+    def build(self, **sections):
+        return config.Config(hosts=sorted(sections.items()))
+
+    def test_hosts_sync_into_their_folder(self):
+        result = hosts.from_config(self.build(
+            com={'token': 'a'},
+            corp={'token': 'b', 'api_url': 'https://corp/api/v3',
+                  'path': 'work'}), '/ws')
+        self.assertEqual(
+            [hosts.Host('com', 'https://api.github.com', 'a', '/ws/com'),
+             hosts.Host('corp', 'https://corp/api/v3', 'b', '/ws/work')],
+            result)
+
+    def test_host_without_token_raises(self):
+        with self.assertRaises(hosts.InvalidHosts):
+            hosts.from_config(self.build(com={}), '/ws')
+
+    def test_hosts_sharing_a_folder_raise(self):
+        with self.assertRaises(hosts.InvalidHosts):
+            hosts.from_config(self.build(com={'token': 'a'},
+                                         corp={'token': 'b', 'path': 'com'}),
+                              '/ws')
+
+
+class FakeHostSync(object):
+    def __init__(self, name, started, other_started):
+        self.name = name
+        self.started = started
+        self.other_started = other_started
+
+    def run(self, resume):
+        self.started.set()
+        # only returns if the other host runs at the same time
+        concurrent = self.other_started.wait(5)
+        return hosts.HostResult(self.name, '/ws/' + self.name, Metrics(), 0,
+                                None, None if concurrent else 'alone')
+
+
+class HostSyncTestCase(unittest.TestCase):
+    def test_unexpected_error_is_recorded(self):
+        helper = mock.Mock(metrics=Metrics())
+        helper.sync.side_effect = KeyError('login')
+        sync_journal = mock.Mock()
+        host_sync = hosts.HostSync(hosts.Host('com', None, 'a', '/ws/com'),
+                                   mock.Mock(rate_limit_remaining=10), None,
+                                   helper, sync_journal)
+        with mock.patch.object(hosts.LOG, 'exception') as log:
+            result = host_sync.run()
+        self.assertEqual("KeyError: 'login'", result.error)
+        log.assert_called_once_with("Failed to sync com")
+        sync_journal.close.assert_called_once_with(False)
+
+
+class SyncHostsTestCase(unittest.TestCase):
+    def test_hosts_are_synced_at_the_same_time(self):
+        first, second = threading.Event(), threading.Event()
+        results = hosts.sync_hosts([FakeHostSync('com', first, second),
+                                    FakeHostSync('corp', second, first)])
+        self.assertEqual([('com', None), ('corp', None)],
+                         [(result.name, result.error) for result in results])
+
+    def test_format_report(self):
+        metrics = Metrics()
+        metrics.increment('repos', 3)
+        metrics.increment('repos.failed')
+        report = hosts.format_report([
+            hosts.HostResult('com', '/ws/com', metrics, 2.5, 4990, None),
+            hosts.HostResult('corp', '/ws/corp', Metrics(), 0.5, None,
+                             'Invalid credentials'),
+        ])
+        self.assertEqual(
+            "com: 3 repos synced in 2.5s into /ws/com, 1 repos failed, 4990 "
+            "api requests left\ncorp: failed after 0.5s: Invalid credentials\n"
+            "1 hosts synced, 1 failed", report)
+
+
+if __name__ == '__main__':
+    unittest.main()
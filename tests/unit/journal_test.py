@@ -0,0 +1,90 @@
+"""Tests for hubsync.journal module"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from hubsync.journal import Journal
+
+
+class JournalTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, '.hubsync_journal')
+
+    def interrupted_journal(self):
+        journal = Journal(self.path)
+        journal.open()
+        journal.start('repo', '/ws/org/done')
+        journal.done('repo', '/ws/org/done')
+        journal.start('repo', '/ws/org/half')
+        journal.close(completed=False)
+        return Journal(self.path)
+
+    def test_resume_skips_what_was_done(self):
+        journal = self.interrupted_journal()
+        self.assertTrue(journal.interrupted)
+        journal.open(resume=True)
+        self.assertTrue(journal.is_done('repo', '/ws/org/done'))
+        self.assertFalse(journal.is_done('repo', '/ws/org/half'))
+        self.assertEqual(['/ws/org/half'], journal.unfinished('repo'))
+        journal.close(completed=True)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_done_since_resuming_is_not_skipped(self):
+        journal = self.interrupted_journal()
+        journal.open(resume=True)
+        journal.start('repo', '/ws/org/half')
+        journal.done('repo', '/ws/org/half')
+        self.assertFalse(journal.is_done('repo', '/ws/org/half'))
+        self.assertEqual([], journal.unfinished('repo'))
+        journal.close(completed=False)
+
+    def test_not_resuming_starts_again(self):
+        journal = self.interrupted_journal()
+        journal.open()
+        self.assertFalse(journal.is_done('repo', '/ws/org/done'))
+        journal.close(completed=False)
+        self.assertEqual('', open(self.path).read())
+
+    def test_partial_line_is_ignored(self):
+        self.interrupted_journal()
+        with open(self.path, 'a') as journal_file:
+            journal_file.write('{"action": "do')
+        journal = Journal(self.path)
+        journal.open(resume=True)
+        self.assertTrue(journal.is_done('repo', '/ws/org/done'))
+
+    def test_remove_unfinished_clones(self):
+        half_clone = os.path.join(self.tmp, 'org', 'half')
+        os.makedirs(os.path.join(half_clone, '.git'))
+        journal = Journal(self.path)
+        journal.open()
+        journal.start('clone', half_clone)
+        journal.start('clone', os.path.join(self.tmp, 'org', 'missing'))
+        journal.close(completed=False)
+
+        journal = Journal(self.path)
+        journal.open(resume=True)
+        journal.remove_unfinished_clones()
+        self.assertFalse(os.path.exists(half_clone))
+
+    def test_not_resuming_removes_unfinished_clones(self):
+        half_clone = os.path.join(self.tmp, 'org', 'half')
+        os.makedirs(os.path.join(half_clone, '.git'))
+        journal = Journal(self.path)
+        journal.open()
+        journal.start('clone', half_clone)
+        journal.close(completed=False)
+
+        journal = Journal(self.path)
+        journal.open()
+        journal.remove_unfinished_clones()
+        self.assertFalse(os.path.exists(half_clone))
+        journal.close(completed=False)
+        self.assertEqual('', open(self.path).read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+"""Tests for hubsync.maintenance module"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from hubsync import config, maintenance, workspace
+from hubsync.gitbackend import run_git
+from hubsync.maintenance import Budget, Maintainer
+
+
+def commit(path, message):
+    with open(os.path.join(path, message), 'w') as content:
+        content.write(message)
+    run_git(path, 'add', message)
+    run_git(path, '-c', 'user.name=test', '-c', 'user.email=test@test',
+            'commit', '-q', '-m', message)
+
+
+class MaintainerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.repo_path = os.path.join(self.tmp, 'org', 'repo')
+        run_git(self.tmp, 'init', '-q', self.repo_path)
+        for message in ('first', 'second', 'third'):
+            commit(self.repo_path, message)
+        self.ws = workspace.Workspace(self.tmp, manifest=workspace.Manifest(
+            os.path.join(self.tmp, '.hubsync_manifest.json')))
+        self.maintainer = Maintainer(niceness=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_maintain_packs_and_writes_commit_graph(self):
+        results = self.maintainer.maintain_workspace(self.ws)
+        self.assertEqual(1, len(results))
+        result = results[0]
+        self.assertIsNone(result.error)
+        self.assertGreater(result.before['loose_objects'], 0)
+        self.assertEqual(0, result.after['loose_objects'])
+        self.assertEqual(list(maintenance.TASKS), sorted(
+            result.tasks, key=list(maintenance.TASKS).index))
+        git_dir = os.path.join(self.repo_path, '.git')
+        self.assertTrue(os.path.exists(os.path.join(
+            git_dir, 'objects', 'info', 'commit-graphs')))
+        self.assertTrue(os.path.exists(os.path.join(git_dir, 'packed-refs')))
+        entry = workspace.Manifest(self.ws.manifest.path).maintenance(
+            self.repo_path)
+        self.assertEqual(result.after, entry['after'])
+
+    def test_recently_maintained_repos_are_skipped(self):
+        self.maintainer.interval = 3600
+        self.maintainer.maintain_workspace(self.ws)
+        with mock.patch('hubsync.maintenance.run_niced_git') as git:
+            results = self.maintainer.maintain_workspace(self.ws)
+        self.assertTrue(results[0].skipped)
+        self.assertFalse(git.called)
+        self.assertFalse(self.maintainer.maintain_workspace(
+            self.ws, force=True)[0].skipped)
+
+    def test_stops_when_budget_is_spent(self):
+        self.maintainer.budget = Budget(max_duration=0)
+        self.assertEqual([], self.maintainer.maintain_workspace(self.ws))
+
+    def test_failed_task_is_reported(self):
+        self.maintainer.tasks = ['repack']
+        with mock.patch.dict(maintenance.TASKS,
+                             {'repack': ('repack', '--unknown-option')}):
+            result = self.maintainer.maintain_workspace(self.ws)[0]
+        self.assertIn('git repack failed', result.error)
+        self.assertIn('error', maintenance.format_report([result]))
+        self.assertIsNone(self.ws.manifest.maintenance(self.repo_path))
+
+    def test_empty_repo_is_not_maintained(self):
+        empty_path = os.path.join(self.tmp, 'org', 'empty')
+        run_git(self.tmp, 'init', '-q', empty_path)
+        results = self.maintainer.maintain_workspace(self.ws)
+        self.assertEqual([None, None], [result.error for result in results])
+        self.assertEqual({}, results[0].tasks)
+
+    def test_unknown_task(self):
+        self.assertRaises(maintenance.InvalidMaintenance,
+                          lambda: Maintainer(['repack', 'gc']))
+
+    def test_from_config(self):
+        maintainer = Maintainer.from_config(config.Config.Maintenance(
+            tasks='pack-refs commit-graph', interval='12h', load='0.25'))
+        self.assertEqual(['commit-graph', 'pack-refs'], maintainer.tasks)
+        self.assertEqual(12 * 60 * 60, maintainer.interval)
+        self.assertEqual(0.25, maintainer.budget.load)
+        self.assertRaises(maintenance.InvalidMaintenance,
+                          lambda: Maintainer.from_config(
+                              config.Config.Maintenance(load='2')))
+
+
+class BudgetTestCase(unittest.TestCase):
+    def test_pauses_to_keep_the_load(self):
+        sleep = mock.Mock()
+        Budget(load=0.25, sleep=sleep).spend(2)
+        sleep.assert_called_once_with(6)
+        sleep = mock.Mock()
+        Budget(load=1, sleep=sleep).spend(2)
+        self.assertFalse(sleep.called)
+
+    def test_exhausted(self):
+        clock = mock.Mock(return_value=100)
+        budget = Budget(max_duration=10, clock=clock)
+        self.assertFalse(budget.exhausted)
+        clock.return_value = 110
+        self.assertTrue(budget.exhausted)
+        self.assertFalse(Budget(clock=clock).exhausted)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Tests for hubsync.metrics module"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from hubsync.metrics import Metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = mock.Mock(return_value=0)
+        self.metrics = Metrics(clock=self.clock)
+
+    def test_timer(self):
+        for duration in (1, 3):
+            with self.metrics.timer('git.fetch'):
+                self.clock.return_value += duration
+        self.assertEqual({'count': 2, 'total': 4, 'max': 3, 'mean': 2},
+                         self.metrics.as_dict()['timings']['git.fetch'])
+
+    def test_merge(self):
+        other = Metrics()
+        other.increment('repos', 2)
+        other.record('git.pull', 3)
+        other.set('ssh.multiplexing', True)
+        self.metrics.increment('repos')
+        self.metrics.record('git.pull', 1)
+        self.metrics.merge(other)
+        data = self.metrics.as_dict()
+        self.assertEqual({'repos': 3}, data['counters'])
+        self.assertEqual({'ssh.multiplexing': True}, data['values'])
+        self.assertEqual({'count': 2, 'total': 4, 'max': 3, 'mean': 2},
+                         data['timings']['git.pull'])
+
+    def test_timer_records_failures(self):
+        with self.assertRaises(ValueError):
+            with self.metrics.timer('git.pull'):
+                raise ValueError()
+        self.assertEqual(1, self.metrics.as_dict()['timings']['git.pull']
+                         ['count'])
+
+    def test_counters_values_and_summary(self):
+        self.metrics.increment('repos')
+        self.metrics.increment('repos', 2)
+        self.metrics.set('ssh.multiplexing', True)
+        self.metrics.record('git.clone', 2)
+        self.assertEqual("git.clone: 1 in 2.00s (mean 2.000s, max 2.000s)\n"
+                         "repos: 3\n"
+                         "ssh.multiplexing: True",
+                         self.metrics.format_summary())
+
+    def test_save(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'metrics.json')
+        self.metrics.increment('repos')
+        self.metrics.save(path)
+        with open(path) as metrics_file:
+            self.assertEqual({'repos': 1}, json.load(metrics_file)['counters'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+"""Tests for hubsync.mirror module"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from hubsync import concurrency, config, github, mirror
+from hubsync.fakehub import Dataset, FakeGithub
+from hubsync.gitbackend import run_git
+from hubsync.mirror import Mirror
+
+
+def commit(path, message):
+    run_git(path, '-c', 'user.name=test', '-c', 'user.email=test@test',
+            'commit', '--allow-empty', '-q', '-m', message)
+
+
+class MirrorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.origin = os.path.join(self.tmp, 'origin')
+        run_git(self.tmp, 'init', '-q', self.origin)
+        commit(self.origin, 'first')
+        self.repo = github.Repo(None, 'org', 'repo', '', self.origin, '',
+                                pushed_at='2020-01-01T00:00:00Z')
+        self.mirror = Mirror(os.path.join(self.tmp, 'mirrors'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_update_clones_and_fetches(self):
+        self.assertFalse(self.mirror.is_fresh(self.repo))
+        self.assertTrue(self.mirror.update(self.repo))
+        path = os.path.join(self.tmp, 'mirrors', 'org', 'repo.git')
+        self.assertEqual(path, self.mirror.repo_path(self.repo))
+        self.assertEqual('true', run_git(path, 'config',
+                                         'remote.origin.mirror').strip())
+        self.assertTrue(self.mirror.is_fresh(self.repo))
+
+        commit(self.origin, 'second')
+        self.assertFalse(self.mirror.update(self.repo))
+        self.assertEqual(run_git(self.origin, 'rev-parse', 'HEAD'),
+                         run_git(path, 'rev-parse', 'HEAD'))
+        self.assertEqual('2020-01-01T00:00:00Z',
+                         self.mirror.state(self.repo)['pushed_at'])
+
+    def test_stale_after_push_or_max_age(self):
+        self.mirror.update(self.repo)
+        self.repo.pushed_at = '2020-01-02T00:00:00Z'
+        self.assertFalse(self.mirror.is_fresh(self.repo))
+        self.repo.pushed_at = None
+        self.assertTrue(self.mirror.is_fresh(self.repo))
+        self.mirror.max_age = 60
+        updated_at = self.mirror.state(self.repo)['updated_at']
+        self.assertTrue(self.mirror.is_fresh(self.repo, updated_at + 30))
+        self.assertFalse(self.mirror.is_fresh(self.repo, updated_at + 90))
+
+    def test_repo_url(self):
+        self.assertEqual(self.mirror.repo_path(self.repo),
+                         self.mirror.repo_url(self.repo))
+        self.mirror.url = 'git://mirrors.lan/'
+        self.assertEqual('git://mirrors.lan/org/repo.git',
+                         self.mirror.repo_url(self.repo))
+
+    def test_corrupt_state_is_stale(self):
+        self.mirror.update(self.repo)
+        with open(os.path.join(self.mirror.repo_path(self.repo),
+                               mirror.STATE_FILE), 'w') as state_file:
+            state_file.write('{')
+        self.assertFalse(self.mirror.is_fresh(self.repo))
+
+    def test_update_mirrors_skips_fresh_ones(self):
+        missing = github.Repo(None, 'org', 'missing', '',
+                              os.path.join(self.tmp, 'missing'), '')
+        self.mirror.update(self.repo)
+        with mock.patch.object(Mirror, 'update',
+                               wraps=self.mirror.update) as update:
+            results = mirror.update_mirrors(self.mirror,
+                                            [self.repo, missing])
+        update.assert_called_once_with(missing, None)
+        self.assertEqual(['org/missing'],
+                         [result.full_name for result in results])
+        self.assertIsNotNone(results[0].error)
+        self.assertFalse(os.path.exists(self.mirror.repo_path(missing)))
+
+    def test_update_mirrors_within_the_adaptive_limits(self):
+        limits = concurrency.AdaptiveLimits(1, 4)
+        results = mirror.update_mirrors(self.mirror, [self.repo], 4, limits)
+        self.assertEqual([None], [result.error for result in results])
+        summary = limits.as_dict()['local']
+        self.assertEqual((1, 0), (summary['completed'], summary['failed']))
+
+    def test_from_config(self):
+        self.assertIsNone(Mirror.from_config(config.Config.Mirror()))
+        repo_mirror = Mirror.from_config(config.Config.Mirror(
+            path='/srv/mirrors', max_age='12h'))
+        self.assertEqual(12 * 60 * 60, repo_mirror.max_age)
+        self.assertRaises(mirror.InvalidMirror,
+                          lambda: Mirror.from_config(config.Config.Mirror(
+                              path='/srv/mirrors', max_age='soon')))
+
+
+class SelectedReposTestCase(unittest.TestCase):
+    def test_filters_are_applied(self):
+        dataset = Dataset.generate(orgs=2, repos_per_org=2, user_repos=1,
+                                   forks_per_repo=0)
+        server = FakeGithub(dataset).start()
+        self.addCleanup(server.stop)
+        conf = config.Config(filters={'exclude_orgs': 'org1',
+                                      'archived': False})
+        api = github.Api(server.url, server.token)
+        names = [repo.full_name
+                 for repo in mirror.selected_repos(api, conf)]
+        expected = [
+            "{}/{}".format(owner, name)
+            for (owner, name), data in sorted(dataset.repos.items())
+            if owner != 'org1' and not data['archived']]
+        self.assertEqual(sorted(expected), sorted(names))
+
+
+if __name__ == '__main__':
+    unittest.main()
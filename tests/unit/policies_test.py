@@ -0,0 +1,80 @@
+"""Tests for the org and repo policies"""
+import unittest
+
+from hubsync import config, policies
+
+
+class RepoPolicyTestCase(unittest.TestCase):
+    def test_defaults_sync_everything_in_full(self):
+        policy = policies.RepoPolicy.from_config(config.Config().repo)
+        self.assertEqual((policies.FULL, (), None),
+                         (policy.mode, policy.clone_options, policy.interval))
+        self.assertTrue(policy.is_due({'synced_at': 0}))
+
+    def test_unknown_mode_or_clone_raise(self):
+        with self.assertRaises(policies.InvalidSyncPolicy):
+            policies.RepoPolicy(mode='sometimes')
+        with self.assertRaises(policies.InvalidSyncPolicy):
+            policies.RepoPolicy(clone='partial')
+
+    def test_invalid_interval_raises(self):
+        section = config.Config(repo={'interval': 'often'}).repo
+        with self.assertRaises(policies.InvalidSyncPolicy):
+            policies.RepoPolicy.from_config(section)
+
+    def test_is_due_after_the_interval(self):
+        policy = policies.RepoPolicy(interval=3600)
+        self.assertFalse(policy.is_due({'synced_at': 1000}, now=2000))
+        self.assertTrue(policy.is_due({'synced_at': 1000}, now=4600))
+        self.assertTrue(policy.is_due(None, now=2000))
+
+
+class PoliciesTestCase(unittest.TestCase):
+    def build(self, repo_sections=(), org_sections=(), **kwargs):
+        return policies.Policies.from_config(config.Config(
+            repo_sections=list(repo_sections),
+            org_sections=list(org_sections), **kwargs))
+
+    def test_repo_without_sections_uses_the_repo_section(self):
+        result = self.build(repo={'pre': 'make'}).repo('org', 'repo')
+        self.assertEqual(('make', policies.FULL), (result.pre, result.mode))
+
+    def test_matching_sections_are_applied_in_order(self):
+        result = self.build([
+            ('org/*', {'mode': 'fetch-only', 'interval': '1h'}),
+            ('big-*', {'clone': 'blobless'}),
+            ('org/big-archive', {'mode': 'skip'}),
+        ], repo={'post': 'ls'})
+        big = result.repo('org', 'big-data')
+        self.assertEqual(
+            (policies.FETCH_ONLY, 'blobless', 3600, 'ls'),
+            (big.mode, big.clone, big.interval, big.post))
+        self.assertEqual(policies.SKIP,
+                         result.repo('org', 'big-archive').mode)
+        other = result.repo('other', 'big-data')
+        self.assertEqual((policies.FULL, 'blobless'),
+                         (other.mode, other.clone))
+
+    def test_case_insensitive_matching(self):
+        result = self.build([('Org/Repo', {'mode': 'skip'})],
+                            glob={'case_sensitive': False})
+        self.assertEqual(policies.SKIP, result.repo('org', 'repo').mode)
+        result = self.build([('Org/Repo', {'mode': 'skip'})])
+        self.assertEqual(policies.FULL, result.repo('org', 'repo').mode)
+
+    def test_org_sections(self):
+        result = self.build(org_sections=[('re:team-.*', {'pre': 'make'})],
+                            org={'post': 'ls'})
+        team = result.org('team-a')
+        self.assertEqual(('make', 'ls'), (team.pre, team.post))
+        self.assertEqual('', result.org('other').pre)
+
+    def test_invalid_sections_raise_even_if_unused(self):
+        with self.assertRaises(policies.InvalidSyncPolicy):
+            self.build([('unused', {'mode': 'never'})])
+        with self.assertRaises(policies.InvalidSyncPolicy):
+            self.build([('re:(', {'mode': 'skip'})])
+
+
+if __name__ == '__main__':
+    unittest.main()
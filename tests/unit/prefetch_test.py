@@ -0,0 +1,109 @@
+"""Tests for hubsync.prefetch module"""
+import threading
+import time
+import unittest
+
+from hubsync.github import GithubError
+from hubsync.metrics import Metrics
+from hubsync.prefetch import PrefetchError, Prefetcher
+
+
+class FakeOrg(object):
+    def __init__(self, name, size, error=None):
+        self.name = name
+        self.size = size
+        self.error = error
+        self.listed = 0
+        self.started = threading.Event()
+
+    def iter_repos(self):
+        self.started.set()
+        for index in range(self.size):
+            self.listed += 1
+            yield "{}/repo{}".format(self.name, index)
+        if self.error is not None:
+            raise self.error
+
+
+class PrefetcherTestCase(unittest.TestCase):
+    def start(self, orgs, lookahead=10, metrics=None):
+        prefetcher = Prefetcher(orgs, lookahead, metrics).start()
+        self.addCleanup(prefetcher.close)
+        return prefetcher
+
+    def test_next_orgs_are_listed_while_syncing(self):
+        first, second = FakeOrg('a', 2), FakeOrg('b', 2)
+        prefetcher = self.start([first, second])
+        repos = prefetcher.org(first).iter_repos()
+        self.assertEqual('a/repo0', next(repos))
+        # listed before the sync asks for it
+        self.assertTrue(second.started.wait(5))
+        self.assertEqual(['a/repo1'], list(repos))
+        self.assertEqual(['b/repo0', 'b/repo1'],
+                         list(prefetcher.org(second).iter_repos()))
+
+    def test_lookahead_bounds_the_repos_listed(self):
+        org = FakeOrg('a', 100)
+        prefetcher = self.start([org], lookahead=5)
+        deadline = time.time() + 5
+        while not prefetcher._queue.full() and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        # plus the one waiting for room in the queue
+        self.assertEqual(6, org.listed)
+        self.assertEqual(100, len(list(prefetcher.org(org).iter_repos())))
+
+    def test_orgs_not_read_are_skipped(self):
+        first, second = FakeOrg('a', 3), FakeOrg('b', 1)
+        prefetcher = self.start([first, second], lookahead=1)
+        self.assertEqual(['b/repo0'],
+                         list(prefetcher.org(second).iter_repos()))
+
+    def test_listing_errors_are_raised_by_the_sync(self):
+        first = FakeOrg('a', 1, GithubError("Not found"))
+        second = FakeOrg('b', 1)
+        prefetcher = self.start([first, second])
+        repos = prefetcher.org(first).iter_repos()
+        self.assertEqual('a/repo0', next(repos))
+        with self.assertRaises(GithubError):
+            next(repos)
+        self.assertEqual(['b/repo0'],
+                         list(prefetcher.org(second).iter_repos()))
+
+    def test_org_not_listed_raises(self):
+        prefetcher = self.start([FakeOrg('a', 1)])
+        with self.assertRaises(PrefetchError):
+            next(prefetcher.org(FakeOrg('b', 1)).iter_repos())
+
+    def test_org_passed_by_the_listing_raises(self):
+        first, second = FakeOrg('a', 1), FakeOrg('b', 1)
+        prefetcher = self.start([first, second])
+        self.assertEqual(['b/repo0'],
+                         list(prefetcher.org(second).iter_repos()))
+        with self.assertRaises(PrefetchError):
+            next(prefetcher.org(first).iter_repos())
+
+    def test_not_started_raises(self):
+        org = FakeOrg('a', 1)
+        with self.assertRaises(PrefetchError):
+            next(Prefetcher([org]).org(org).iter_repos())
+
+    def test_records_the_time_waited(self):
+        metrics = Metrics()
+        org = FakeOrg('a', 1)
+        prefetcher = self.start([org], metrics=metrics)
+        list(prefetcher.org(org).iter_repos())
+        self.assertEqual(
+            1, metrics.as_dict()['timings']['github.list.wait']['count'])
+
+    def test_close_stops_the_listing(self):
+        org = FakeOrg('a', 100)
+        prefetcher = Prefetcher([org], 1).start()
+        self.assertTrue(org.started.wait(5))
+        prefetcher.close()
+        self.assertFalse(prefetcher._thread.is_alive())
+        self.assertLess(org.listed, 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
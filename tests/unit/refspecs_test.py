@@ -0,0 +1,87 @@
+"""Tests for hubsync.refspecs module"""
+import unittest
+
+from hubsync import config, refspecs
+from hubsync.refspecs import FetchPolicy, FetchPolicies
+
+
+class FetchPolicyTestCase(unittest.TestCase):
+    def test_all(self):
+        policy = FetchPolicy()
+        self.assertFalse(policy.narrow)
+        self.assertEqual(['+refs/heads/*:refs/remotes/origin/*'],
+                         policy.refspecs('origin', 'main'))
+        self.assertTrue(policy.covers('feature', 'main'))
+
+    def test_default_branch_only(self):
+        policy = FetchPolicy(refspecs.DEFAULT_BRANCH_ONLY)
+        self.assertTrue(policy.narrow)
+        self.assertEqual(['+refs/heads/main:refs/remotes/upstream/main'],
+                         policy.refspecs('upstream', 'main'))
+        self.assertTrue(policy.covers('main', 'main'))
+        self.assertFalse(policy.covers('feature', 'main'))
+
+    def test_globs_include_default_branch(self):
+        policy = FetchPolicy(['release/*', 'main'])
+        self.assertEqual(
+            ['+refs/heads/main:refs/remotes/origin/main',
+             '+refs/heads/release/*:refs/remotes/origin/release/*'],
+            policy.refspecs('origin', 'main'))
+        self.assertTrue(policy.covers('release/1.0/hotfix', 'main'))
+        self.assertFalse(policy.covers('feature', 'main'))
+
+    def test_invalid_patterns(self):
+        for pattern in ('a*b*', 'v?', 'v[12]'):
+            self.assertRaises(refspecs.InvalidPolicy,
+                              lambda: FetchPolicy([pattern]))
+
+    def test_from_config(self):
+        policy = FetchPolicy.from_config(config.Config.Fetch(
+            branches='release/*, hotfix-*', prune=False))
+        self.assertEqual(['release/*', 'hotfix-*'], policy.branches)
+        self.assertFalse(policy.prune)
+        default = FetchPolicy.from_config(config.Config.Fetch())
+        self.assertFalse(default.narrow)
+        # like git, nothing is pruned unless asked
+        self.assertFalse(default.prune)
+
+
+class FetchPoliciesTestCase(unittest.TestCase):
+    def test_repo_over_org_over_default(self):
+        conf = config.Config(
+            fetch={'branches': 'default-branch-only'},
+            fetch_policies=[('team', {'branches': 'all'}),
+                            ('team/monorepo', {'branches': 'release/*'})])
+        policies = FetchPolicies.from_config(conf)
+        self.assertEqual(['release/*'],
+                         policies.policy('team', 'monorepo').branches)
+        self.assertEqual(refspecs.ALL, policies.policy('team', 'app').branches)
+        self.assertEqual(refspecs.DEFAULT_BRANCH_ONLY,
+                         policies.policy('other', 'app').branches)
+
+    def test_later_sections_override_earlier_ones(self):
+        conf = config.Config(fetch_policies=[
+            ('*/monorepo', {'branches': 'release/*', 'prune': False}),
+            ('team*', {'branches': 'default-branch-only'})])
+        policies = FetchPolicies.from_config(conf)
+        policy = policies.policy('team', 'monorepo')
+        self.assertEqual(refspecs.DEFAULT_BRANCH_ONLY, policy.branches)
+        self.assertFalse(policy.prune)
+        self.assertEqual(['release/*'],
+                         policies.policy('other', 'monorepo').branches)
+
+    def test_case_insensitive(self):
+        conf = config.Config(
+            glob={'case_sensitive': False},
+            fetch_policies=[('Team', {'branches': 'default-branch-only'})])
+        policies = FetchPolicies.from_config(conf)
+        self.assertTrue(policies.policy('team', 'app').narrow)
+
+    def test_invalid_pattern_raises(self):
+        conf = config.Config(fetch_policies=[('re:(', {})])
+        self.assertRaises(refspecs.InvalidPolicy,
+                          FetchPolicies.from_config, conf)
+
+
+if __name__ == '__main__':
+    unittest.main()
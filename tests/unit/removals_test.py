@@ -0,0 +1,105 @@
+"""Tests for hubsync.removals module"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from hubsync.removals import Removals, Trash
+
+
+class TrashTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.trash = Trash(os.path.join(self.tmp, '.hubsync_trash'))
+
+    def make_folder(self, *parts):
+        path = os.path.join(self.tmp, *parts)
+        os.makedirs(path)
+        open(os.path.join(path, 'file'), 'w').close()
+        return path
+
+    def test_discard_moves_the_folder_and_deletes_it(self):
+        first = self.make_folder('org', 'repo')
+        self.trash.discard(first)
+        self.assertFalse(os.path.exists(first))
+        second = self.make_folder('org', 'repo')
+        self.trash.discard(second)
+        self.trash.wait()
+        self.assertEqual([], os.listdir(self.trash.path))
+
+    def test_discard_deletes_in_the_background(self):
+        folder = self.make_folder('org', 'repo')
+        with mock.patch('shutil.rmtree') as rmtree:
+            self.trash.discard(folder)
+            self.trash.wait()
+        target, = os.listdir(self.trash.path)
+        self.assertTrue(target.startswith('repo-'))
+        rmtree.assert_called_once_with(
+            os.path.join(self.trash.path, target), True)
+
+    def test_empty_deletes_the_folders_left(self):
+        self.make_folder('.hubsync_trash', 'repo-1')
+        self.trash.empty()
+        self.trash.wait()
+        self.assertEqual([], os.listdir(self.trash.path))
+
+    def test_wait_stops_the_deleting_thread(self):
+        self.trash.discard(self.make_folder('org', 'repo'))
+        self.trash.wait()
+        self.assertFalse(self.trash.deleting)
+        self.assertIsNone(self.trash._executor)
+
+    def test_without_path_deletes_in_place(self):
+        folder = self.make_folder('org', 'repo')
+        trash = Trash()
+        trash.discard(folder)
+        trash.wait()
+        self.assertFalse(os.path.exists(folder))
+
+
+class RemovalsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.trash = mock.Mock()
+        self.removals = Removals()
+        self.folders = []
+        for name in ('a', 'b', 'c'):
+            self.folders.append(os.path.join(self.tmp, name))
+            os.mkdir(self.folders[-1])
+
+    def test_review_removes_the_folders_confirmed(self):
+        manifest = mock.Mock()
+        for folder in self.folders:
+            self.removals.add(folder, manifest)
+        confirm = mock.Mock(return_value=self.folders[1:])
+        removed = self.removals.review(confirm, self.trash)
+        confirm.assert_called_once_with(self.folders)
+        self.assertEqual(self.folders[1:], removed)
+        self.assertEqual([mock.call(folder) for folder in self.folders[1:]],
+                         self.trash.discard.call_args_list)
+        self.assertEqual([mock.call(folder) for folder in self.folders[1:]],
+                         manifest.forget.call_args_list)
+        self.assertEqual([], self.removals.review(confirm, self.trash))
+
+    def test_review_skips_the_folders_moved_since(self):
+        self.removals.add(self.folders[0])
+        os.rmdir(self.folders[0])
+        confirm = mock.Mock()
+        self.assertEqual([], self.removals.review(confirm, self.trash))
+        self.assertFalse(confirm.called)
+
+    def test_folders_failing_to_move_are_not_forgotten(self):
+        manifest = mock.Mock()
+        self.removals.add(self.folders[0], manifest)
+        self.trash.discard.side_effect = OSError("busy")
+        self.assertEqual([], self.removals.review(lambda folders: folders,
+                                                  self.trash))
+        self.assertFalse(manifest.forget.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
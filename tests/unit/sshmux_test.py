@@ -0,0 +1,102 @@
+"""Tests for hubsync.sshmux module"""
+import os
+import stat
+import shutil
+import tempfile
+import time
+import unittest
+
+import mock
+
+from hubsync import sshmux
+from hubsync.gitbackend import GitBackendError, run_git
+from hubsync.metrics import Metrics
+
+
+FAKE_SSH = """#!/bin/sh
+echo "$@" >> {}
+exit 1
+"""
+
+
+@unittest.skipIf(os.name != 'posix', "ssh control masters need posix")
+class ControlMasterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        patcher = mock.patch.dict(os.environ)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        os.environ.pop('GIT_SSH', None)
+        os.environ.pop(sshmux.SSH_COMMAND_ENV, None)
+
+    def test_git_uses_the_master_during_the_run(self):
+        calls = os.path.join(self.tmp, 'calls')
+        fake_ssh = os.path.join(self.tmp, 'ssh')
+        with open(fake_ssh, 'w') as script:
+            script.write(FAKE_SSH.format(calls))
+        os.chmod(fake_ssh, stat.S_IRWXU)
+        os.environ[sshmux.SSH_COMMAND_ENV] = fake_ssh
+
+        metrics = Metrics()
+        with sshmux.ControlMaster(persist=30, metrics=metrics) as master:
+            path = master.path
+            self.assertEqual(stat.S_IRWXU,
+                             stat.S_IMODE(os.stat(path).st_mode))
+            with self.assertRaises(GitBackendError):
+                run_git(self.tmp, 'ls-remote', 'ssh://git@example.com/repo')
+        with open(calls) as calls_file:
+            args = calls_file.read()
+        self.assertIn('-o ControlMaster=auto', args)
+        self.assertIn('-o ControlPath={}'.format(
+            os.path.join(path, '%C')), args)
+        self.assertIn('-o ControlPersist=30', args)
+
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(fake_ssh, os.environ[sshmux.SSH_COMMAND_ENV])
+        self.assertEqual({'ssh.multiplexing': True},
+                         metrics.as_dict()['values'])
+        self.assertEqual({'ssh.masters': 0}, metrics.as_dict()['counters'])
+
+    def test_counts_the_masters_started_again(self):
+        metrics = Metrics()
+        master = sshmux.ControlMaster(metrics=metrics, poll_interval=0.01)
+        master.start()
+        socket = os.path.join(master.path, 'abc')
+        for started in (1, 2):
+            open(socket, 'w').close()
+            deadline = time.time() + 5
+            while len(master._sockets) < started and time.time() < deadline:
+                time.sleep(0.01)
+            # closed by ControlPersist, then started again by the next git
+            os.remove(socket)
+        with mock.patch('subprocess.call'):
+            master.stop()
+        self.assertEqual(2, metrics.counters['ssh.masters'])
+
+    def test_masters_are_closed(self):
+        master = sshmux.ControlMaster()
+        master.start()
+        socket = os.path.join(master.path, 'abc')
+        open(socket, 'w').close()
+        with mock.patch('subprocess.call') as call:
+            master.stop()
+        self.assertIn('ControlPath={}'.format(socket), call.call_args[0][0])
+        self.assertNotIn(sshmux.SSH_COMMAND_ENV, os.environ)
+
+    def test_uses_the_git_configured_ssh_command(self):
+        with mock.patch('hubsync.sshmux.configured_ssh_command',
+                        return_value='ssh -i key'):
+            with sshmux.ControlMaster():
+                self.assertTrue(os.environ[sshmux.SSH_COMMAND_ENV]
+                                .startswith('ssh -i key -o ControlMaster'))
+
+    def test_git_ssh_is_left_alone(self):
+        os.environ['GIT_SSH'] = 'plink'
+        with sshmux.ControlMaster() as master:
+            self.assertFalse(master.active)
+            self.assertNotIn(sshmux.SSH_COMMAND_ENV, os.environ)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""Tests for hubsync.status module"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from hubsync import status, workspace
+from hubsync.gitbackend import run_git
+
+
+def commit(path, message):
+    run_git(path, '-c', 'user.name=test', '-c', 'user.email=test@test',
+            'commit', '--allow-empty', '-q', '-m', message)
+
+
+class StatusTestCase(unittest.TestCase):
+    """Reads the status of real repositories in a temp workspace"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.origin = os.path.join(self.tmp, 'origin')
+        os.makedirs(self.origin)
+        run_git(self.origin, 'init', '-q')
+        run_git(self.origin, 'checkout', '-q', '-b', 'master')
+        commit(self.origin, 'first')
+        self.path = os.path.join(self.tmp, 'ws')
+        for name in ('clean', 'work'):
+            run_git(self.tmp, 'clone', '-q', self.origin,
+                    os.path.join(self.path, 'org', name))
+        os.makedirs(os.path.join(self.path, 'org', 'not_git'))
+        self.ws = workspace.Workspace(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_clean_repo(self):
+        result = status.repo_status(
+            'org', workspace.Repo('clean', os.path.join(self.path, 'org')))
+        self.assertEqual(status.RepoStatus(
+            'org', 'clean', os.path.join(self.path, 'org', 'clean'),
+            'master', False, 0, 0, [], None), result)
+        self.assertFalse(result.changed)
+
+    def test_workspace_status(self):
+        work = os.path.join(self.path, 'org', 'work')
+        commit(self.origin, 'second')
+        run_git(work, 'fetch', '-q')
+        commit(work, 'local')
+        run_git(work, 'branch', 'merged', 'HEAD~1')
+        with open(os.path.join(work, 'new_file'), 'w'):
+            pass
+
+        clean, work_status = status.workspace_status(self.ws, workers=2)
+        self.assertEqual('clean', clean.name)
+        self.assertFalse(clean.changed)
+        self.assertTrue(work_status.dirty)
+        self.assertEqual((1, 1), (work_status.ahead, work_status.behind))
+        self.assertEqual(['merged'], work_status.stale)
+        self.assertTrue(work_status.changed)
+
+    def test_branch_with_deleted_upstream_is_stale(self):
+        work = os.path.join(self.path, 'org', 'work')
+        run_git(self.origin, 'branch', 'feature')
+        run_git(work, 'fetch', '-q')
+        run_git(work, 'branch', '-q', '--track', 'feature', 'origin/feature')
+        self.assertEqual([], status.workspace_status(self.ws)[1].stale)
+        run_git(self.origin, 'branch', '-D', 'feature')
+        run_git(work, 'fetch', '-q', '--prune')
+        self.assertEqual(['feature'], status.workspace_status(self.ws)[1].stale)
+
+    def test_detached_head(self):
+        run_git(os.path.join(self.path, 'org', 'work'), 'checkout', '-q',
+                '--detach')
+        work_status = status.workspace_status(self.ws)[1]
+        self.assertIsNone(work_status.branch)
+        self.assertIsNone(work_status.ahead)
+        self.assertIn('(detached)', status.format_table([work_status]))
+
+    def test_format(self):
+        statuses = status.workspace_status(self.ws)
+        lines = status.format_table(statuses).splitlines()
+        self.assertEqual(['REPO', 'BRANCH', 'DIRTY', 'AHEAD', 'BEHIND',
+                          'STALE'], lines[0].split())
+        self.assertEqual(['org/clean', 'master', '0', '0'], lines[1].split())
+        self.assertEqual(['clean', 'work'], [item['name'] for item in
+                                             json.loads(status.format_json(
+                                                 statuses))])
+
+    def test_unreadable_repo_reports_error(self):
+        os.makedirs(os.path.join(self.path, 'org', 'broken', '.git'))
+        broken = status.workspace_status(self.ws)[0]
+        self.assertEqual('broken', broken.name)
+        self.assertTrue(broken.error)
+        self.assertTrue(broken.changed)
+        self.assertIn('error:', status.format_table([broken]))
+
+
+if __name__ == '__main__':
+    unittest.main()
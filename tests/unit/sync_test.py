@@ -1,7 +1,10 @@
 """Sync module tests"""
+import threading
 import unittest
 
-from hubsync import sync
+import mock
+
+from hubsync import concurrency, config, gitbackend, sync
 
 
 class SyncTestCase(unittest.TestCase):
@@ -12,6 +15,78 @@ class SyncTestCase(unittest.TestCase):
         self.assertFalse(sync.yesno_as_boolean("no"))
 
 
+class GitOperationTestCase(unittest.TestCase):
+    def test_waits_for_a_git_slot(self):
+        slots = threading.BoundedSemaphore(1)
+        helper = sync.SyncHelper(None, config.Config(), git_slots=slots)
+        with helper.git_operation('git.pull'):
+            self.assertFalse(slots.acquire(False))
+        self.assertTrue(slots.acquire(False))
+        timings = helper.metrics.as_dict()['timings']
+        self.assertEqual(1, timings['git.pull']['count'])
+        self.assertEqual(1, timings['git.wait']['count'])
+
+    def test_waits_for_the_adaptive_limit_of_the_host(self):
+        limits = concurrency.AdaptiveLimits(1, 2)
+        helper = sync.SyncHelper(None, config.Config(), fetch_limits=limits)
+        url = 'git@github.com:org/repo.git'
+        with helper.git_operation('git.fetch', url):
+            self.assertEqual(1, limits.limit(url)._in_flight)
+        with helper.git_operation('git.clone', url):
+            pass
+        summary = limits.as_dict()['github.com']
+        self.assertEqual((2, 2), (summary['completed'], summary['level']))
+
+
+class RunGitOperationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.helper = sync.SyncHelper(None, config.Config())
+        self.operation = mock.Mock()
+        patcher = mock.patch('hubsync.watchdog.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_timed_out_operation_is_retried(self):
+        self.operation.side_effect = [gitbackend.GitTimeout('hung'), 'done']
+        self.assertEqual('done', self.helper.run_git_operation(
+            'git.fetch', None, self.operation))
+        self.assertEqual(1, self.helper.metrics.counters['git.retries'])
+        self.assertEqual(2, self.helper.metrics.as_dict()[
+            'timings']['git.fetch']['count'])
+
+    def test_gives_up_after_the_retries(self):
+        self.operation.side_effect = gitbackend.GitTimeout('hung')
+        self.assertRaises(gitbackend.GitTimeout,
+                          self.helper.run_git_operation, 'git.fetch', None,
+                          self.operation)
+        self.assertEqual(3, self.operation.call_count)
+        self.assertEqual([mock.call(2.0), mock.call(4.0)],
+                         self.sleep.call_args_list)
+
+    def test_failures_are_not_retried(self):
+        self.operation.side_effect = gitbackend.GitBackendError('rejected')
+        self.assertRaises(gitbackend.GitBackendError,
+                          self.helper.run_git_operation, 'git.push', None,
+                          self.operation)
+        self.assertEqual(1, self.operation.call_count)
+
+
+class ConfirmRemovalsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.helper = sync.SyncHelper(None, config.Config())
+
+    def test_not_interactive_confirms_none(self):
+        self.helper.config.glob.interactive = False
+        self.assertEqual([], self.helper.confirm_removals(['/ws/a']))
+
+    def test_folders_can_be_chosen_one_by_one(self):
+        answers = iter([False, True, True, False])
+        with mock.patch('hubsync.sync.input_yesno',
+                        side_effect=lambda *args: next(answers)):
+            self.assertEqual(['/ws/a'], self.helper.confirm_removals(
+                ['/ws/a', '/ws/b']))
+
+
 class ZipPairsTestCase(unittest.TestCase):
     def test_empty_lists(self):
         self.assertEqual(
@@ -0,0 +1,104 @@
+"""Tests for hubsync.transport module"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from hubsync.transport import (CaptureStore, RecordingTransport,
+                               ReplayMissError, ReplayTransport, Response)
+
+
+class ResponseTestCase(unittest.TestCase):
+    def test_headers_are_case_insensitive(self):
+        response = Response(200, {'ETag': 'x'}, '')
+        self.assertEqual('x', response.headers['etag'])
+
+    def test_links(self):
+        response = Response(200, {'Link': '<a>; rel="next", <b>; rel="last"'},
+                            '[]')
+        self.assertEqual({'next': 'a', 'last': 'b'}, response.links)
+
+    def test_no_links(self):
+        self.assertEqual({}, Response(200, {}, '[]').links)
+
+    def test_invalid_json_raises_value_error(self):
+        self.assertRaises(ValueError, Response(200, {}, 'NOT JSON').json)
+
+
+class CaptureStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'capture')
+        self.response = Response(201, {'ETag': '"1"'}, '{"a": 1}', 0.5)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.path))
+
+    def test_write_and_read(self):
+        with CaptureStore(self.path) as store:
+            store.write('GET', 'url', self.response)
+            self.assertEqual(self.response, store.read('get', 'url'))
+
+    def test_read_after_reopen(self):
+        with CaptureStore(self.path) as store:
+            store.write('GET', 'url', self.response)
+        with CaptureStore(self.path) as store:
+            self.assertTrue(('GET', 'url') in store)
+            response = store.read('GET', 'url')
+        self.assertEqual(201, response.status)
+        self.assertEqual('"1"', response.headers['etag'])
+        self.assertEqual({'a': 1}, response.json())
+        self.assertEqual(0.5, response.elapsed)
+
+    def test_missing_request_raises(self):
+        with CaptureStore(self.path) as store:
+            store.write('GET', 'url', self.response)
+            self.assertRaises(ReplayMissError,
+                              lambda: store.read('POST', 'url'))
+
+    def test_last_record_wins(self):
+        with CaptureStore(self.path) as store:
+            store.write('GET', 'url', self.response)
+            store.write('GET', 'url', Response(200, {}, '2'))
+        with CaptureStore(self.path) as store:
+            self.assertEqual(2, store.read('GET', 'url').json())
+
+    def test_index_rebuilt_when_not_closed(self):
+        store = CaptureStore(self.path)
+        store.write('GET', 'url', self.response)
+        store._writer.close()  # simulate a crash, no index written
+        self.assertFalse(os.path.exists(
+            os.path.join(self.path, CaptureStore.INDEX_FILE)))
+        with CaptureStore(self.path) as reopened:
+            self.assertEqual(self.response.body,
+                             reopened.read('GET', 'url').body)
+
+
+class TransportsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = CaptureStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.path)
+
+    def test_record_then_replay(self):
+        inner = mock.Mock()
+        inner.request.return_value = Response(200, {}, '[]', 0.1)
+        recorder = RecordingTransport(self.store, inner)
+        recorder.request('GET', 'url', {'Authorization': 'token x'})
+        self.store.close()
+        replayed = ReplayTransport(self.store).request('GET', 'url', {})
+        self.assertEqual([], replayed.json())
+
+    @mock.patch('hubsync.transport.time.sleep')
+    def test_replay_at_original_speed(self, sleep_mock):
+        self.store.write('GET', 'url', Response(200, {}, '[]', 0.1))
+        ReplayTransport(self.store, realtime=True).request('GET', 'url', {})
+        sleep_mock.assert_called_with(0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""Tests for hubsync.watchdog module"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import mock
+
+from hubsync import watchdog
+
+
+def alive(pid):
+    """Whether a process runs, zombies not reaped yet do not"""
+    if os.path.isdir('/proc'):
+        try:
+            with open('/proc/{}/stat'.format(pid)) as stat:
+                return stat.read().rsplit(')', 1)[1].split()[0] != 'Z'
+        except IOError:
+            return False
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+class CheckOutputTestCase(unittest.TestCase):
+    def test_returns_the_output(self):
+        self.assertEqual(b'hi\n', watchdog.check_output(
+            [sys.executable, '-c', 'print("hi")'], timeout=30))
+
+    def test_failure_raises(self):
+        self.assertRaises(subprocess.CalledProcessError,
+                          watchdog.check_output,
+                          [sys.executable, '-c', 'exit(3)'], timeout=30)
+
+    def test_stderr_is_kept_for_the_error(self):
+        with self.assertRaises(subprocess.CalledProcessError) as raised:
+            watchdog.check_output(
+                [sys.executable, '-c',
+                 'import sys; sys.stderr.write("fatal: gone"); exit(128)'])
+        self.assertEqual(b'fatal: gone', raised.exception.stderr)
+
+    def test_hung_command_is_killed(self):
+        start = time.time()
+        self.assertRaises(watchdog.Timeout, watchdog.check_output,
+                          ['sleep', '30'], timeout=0.5)
+        self.assertLess(time.time() - start, 10)
+
+    @unittest.skipIf(os.name != 'posix', "process groups are posix only")
+    def test_children_are_killed_with_the_command(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            pid_file = os.path.join(tmp, 'pid')
+            # like ssh started by git, keeping the pipe open
+            self.assertRaises(watchdog.Timeout, watchdog.check_output,
+                              ['sh', '-c', 'sleep 30 & echo $! > {}; wait'
+                               .format(pid_file)], timeout=0.5)
+            with open(pid_file) as pid:
+                child = int(pid.read())
+            deadline = time.time() + 5
+            while time.time() < deadline and alive(child):
+                time.sleep(0.05)
+            self.assertFalse(alive(child))
+        finally:
+            shutil.rmtree(tmp)
+
+    @unittest.skipIf(not os.path.isdir('/proc/self/fd'), "needs /proc")
+    def test_killed_command_leaves_no_open_files(self):
+        before = len(os.listdir('/proc/self/fd'))
+        with self.assertRaises(watchdog.Timeout) as raised:
+            watchdog.check_output(
+                ['sh', '-c', 'echo hanging >&2; sleep 30'], timeout=0.5)
+        self.assertIn('hanging', str(raised.exception))
+        self.assertEqual(before, len(os.listdir('/proc/self/fd')))
+
+    def test_seconds_disabled(self):
+        self.assertEqual(60, watchdog.seconds('60'))
+        self.assertIsNone(watchdog.seconds('0'))
+        self.assertIsNone(watchdog.seconds(False))
+
+
+class RetryTestCase(unittest.TestCase):
+    def test_backs_off_until_it_succeeds(self):
+        operation = mock.Mock(side_effect=[IOError(), IOError(), 'done'])
+        on_retry = mock.Mock()
+        with mock.patch('hubsync.watchdog.time.sleep') as sleep:
+            self.assertEqual('done', watchdog.retry(
+                operation, IOError, 2, 1.0, on_retry=on_retry))
+        self.assertEqual([mock.call(1.0), mock.call(2.0)],
+                         sleep.call_args_list)
+        self.assertEqual(2, on_retry.call_count)
+
+    def test_last_error_is_raised(self):
+        operation = mock.Mock(side_effect=IOError('down'))
+        self.assertRaises(IOError, watchdog.retry, operation, IOError, 1, 0)
+        self.assertEqual(2, operation.call_count)
+
+    def test_other_errors_are_not_retried(self):
+        operation = mock.Mock(side_effect=KeyError())
+        self.assertRaises(KeyError, watchdog.retry, operation, IOError, 2, 0)
+        self.assertEqual(1, operation.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
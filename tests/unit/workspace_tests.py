@@ -1,10 +1,15 @@
 """Tests for hubsync.workspace module"""
+import os
+import shutil
+import tempfile
+import time
 import unittest
 
 import git
 import mock
 
-from hubsync.workspace import Organization, InvalidPath, Workspace, Repo
+from hubsync.workspace import (Organization, InvalidPath, Workspace, Repo,
+                               Manifest, ScanResult, scan_repos)
 
 
 class WorkspaceTestCase(unittest.TestCase):
@@ -43,23 +48,33 @@ class OrgTestCase(unittest.TestCase):
     def test_org_repr(self):
         repr(self.org)
 
-    @mock.patch("hubsync.workspace.get_sub_folders")
-    def test_org_with_no_subfolders(self, mock_subfolders):
-        mock_subfolders.return_value = []
+    @mock.patch("hubsync.workspace.scan_repos")
+    def test_org_with_no_subfolders(self, mock_scan):
+        mock_scan.return_value = ScanResult([], [])
         self.assertEqual(0, len(self.org.repos))
 
-    @mock.patch("hubsync.workspace.get_sub_folders")
-    def test_org_for_invalid_path(self, mock_subfolders):
-        mock_subfolders.side_effect = StopIteration
+    @mock.patch("hubsync.workspace.scan_repos")
+    def test_org_for_invalid_path(self, mock_scan):
+        mock_scan.side_effect = OSError
         self.assertRaises(InvalidPath, lambda: self.org.repos)
 
-    @mock.patch("hubsync.workspace.get_sub_folders")
+    @mock.patch("hubsync.workspace.scan_repos")
     @mock.patch("git.Repo")
-    def test_org_with_a_subfolders_but_not_a_repo_raises(self, mock_git,
-                                                         mock_subfolders):
+    def test_org_with_a_subfolders_but_not_a_repo_is_reported(self, mock_git,
+                                                              mock_scan):
         mock_git.side_effect = git.exc.InvalidGitRepositoryError
-        mock_subfolders.return_value = ["secret_folder_without_repo"]
-        self.assertRaises(InvalidPath, lambda: self.org.repos)
+        mock_scan.return_value = ScanResult(
+            ["a_repo"], ["secret_folder_without_repo"])
+        self.assertEqual(["a_repo"], [repo.name for repo in self.org.repos])
+        self.assertEqual(["secret_folder_without_repo"],
+                         [folder.name for folder in self.org.invalid_folders])
+        self.assertFalse(mock_git.called)
+
+    @mock.patch("git.Repo")
+    def test_repo_opened_lazily(self, mock_git):
+        mock_git.side_effect = git.exc.InvalidGitRepositoryError
+        repo = Repo("not_a_repo", self.org_path)
+        self.assertRaises(InvalidPath, lambda: repo.git)
 
 
 class RepoTestCase(unittest.TestCase):
@@ -87,5 +102,97 @@ class RepoTestCase(unittest.TestCase):
         repr(self.repo)
 
 
+class ManifestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.path, 'org', 'repo', '.git'))
+        os.makedirs(os.path.join(self.path, 'org', 'folder'))
+        open(os.path.join(self.path, 'org', 'file'), 'w').close()
+        self.org_path = os.path.join(self.path, 'org')
+        self.repo_path = os.path.join(self.org_path, 'repo')
+        old = time.time() - 60
+        os.utime(self.org_path, (old, old))
+        self.manifest = Manifest(os.path.join(self.path, 'manifest.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def reload(self):
+        self.manifest.save()
+        return Manifest(self.manifest.path)
+
+    def test_scan_repos(self):
+        self.assertEqual(ScanResult(['repo'], ['folder']),
+                         scan_repos(self.org_path))
+
+    def test_cached_scan_reused_between_runs(self):
+        self.assertEqual(ScanResult(['repo'], ['folder']),
+                         self.manifest.scan(self.org_path))
+        manifest = self.reload()
+        with mock.patch("hubsync.workspace.scan_repos") as mock_scan:
+            result = manifest.scan(self.org_path)
+        self.assertFalse(mock_scan.called)
+        self.assertEqual(ScanResult(['repo'], ['folder']), result)
+
+    def test_cache_invalidated_by_mtime(self):
+        self.manifest.scan(self.org_path)
+        manifest = self.reload()
+        os.makedirs(os.path.join(self.org_path, 'new_repo', '.git'))
+        result = manifest.scan(self.org_path)
+        self.assertEqual(['new_repo', 'repo'], result.repos)
+
+    def test_cached_scan_sees_git_init_and_removal(self):
+        self.manifest.scan(self.org_path)
+        manifest = self.reload()
+        old = os.stat(self.org_path).st_mtime
+        os.makedirs(os.path.join(self.org_path, 'folder', '.git'))
+        shutil.rmtree(os.path.join(self.repo_path, '.git'))
+        self.assertEqual(old, os.stat(self.org_path).st_mtime)
+        with mock.patch("hubsync.workspace.scan_repos") as mock_scan:
+            result = manifest.scan(self.org_path)
+        self.assertFalse(mock_scan.called)
+        self.assertEqual(ScanResult(['folder'], ['repo']), result)
+        self.assertEqual(['folder'], manifest.data['orgs']['org']['repos'])
+
+    def test_recently_modified_not_cached(self):
+        os.utime(self.org_path, None)
+        self.manifest.scan(self.org_path)
+        self.assertEqual({}, self.manifest.data['orgs'])
+
+    def test_record_repo(self):
+        self.manifest.record_repo(self.repo_path, id=42, remotes={'a': 'b'})
+        manifest = self.reload()
+        self.assertEqual(42, manifest.repo(self.repo_path)['id'])
+        self.assertEqual(['org/repo'], list(manifest.data['repos']))
+        self.assertEqual(self.repo_path, manifest.find_by_id(42))
+        self.assertIsNone(manifest.find_by_id(1))
+
+    def test_repo_freshness(self):
+        git_config = os.path.join(self.repo_path, '.git', 'config')
+        open(git_config, 'w').close()
+        self.manifest.record_repo(self.repo_path, id=42)
+        self.assertTrue(self.manifest.is_fresh(self.repo_path))
+        # remotes changed within .git leave the repo folder untouched
+        os.utime(git_config, (0, 0))
+        self.assertFalse(self.manifest.is_fresh(self.repo_path))
+        os.remove(git_config)
+        self.assertFalse(self.manifest.is_fresh(self.repo_path))
+
+    def test_forget_org(self):
+        self.manifest.scan(self.org_path)
+        self.manifest.record_repo(self.repo_path, id=42)
+        self.manifest.forget(self.org_path)
+        self.assertEqual({}, self.manifest.data['orgs'])
+        self.assertEqual({}, self.manifest.data['repos'])
+
+    def test_record_maintenance(self):
+        self.manifest.record_maintenance(self.repo_path, at=10, tasks={})
+        self.manifest.save()
+        reloaded = Manifest(self.manifest.path)
+        self.assertEqual(10, reloaded.maintenance(self.repo_path)['at'])
+        reloaded.forget(self.repo_path)
+        self.assertIsNone(reloaded.maintenance(self.repo_path))
+
+
 if __name__ == '__main__':
     unittest.main()